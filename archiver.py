@@ -0,0 +1,219 @@
+import os
+import shutil
+import tarfile
+import threading
+import time
+import zipfile
+from typing import NamedTuple
+
+from copier import COPY_BUFSIZE, CopyReport
+
+# zstd は Python 3.14 の compression.zstd か zstandard パッケージがあれば使う
+try:
+    from compression import zstd as _zstd
+
+    _zstandard = None
+except ImportError:
+    _zstd = None
+    try:
+        import zstandard as _zstandard
+    except ImportError:
+        _zstandard = None
+HAS_ZSTD = _zstd is not None or _zstandard is not None
+
+# ========= デフォルト設定 =========
+# 圧縮済みの形式は再圧縮しても小さくならないので、ZIP では無圧縮で格納する
+DEFAULT_STORE_EXTS = [
+    ".docx", ".xlsx", ".pptx", ".pdf", ".zip", ".7z", ".gz", ".zst",
+    ".jpg", ".jpeg", ".png", ".gif", ".mp4", ".mp3",
+]
+
+
+class ArchiveFormat(NamedTuple):
+    label: str
+    ext: str
+
+
+ARCHIVE_FORMATS = {
+    "zip": ArchiveFormat("ZIP", ".zip"),
+    "tar.gz": ArchiveFormat("tar.gz", ".tar.gz"),
+}
+if HAS_ZSTD:
+    ARCHIVE_FORMATS["tar.zst"] = ArchiveFormat("tar.zst", ".tar.zst")
+
+# 格納の仕方（結果表示用）
+ARCHIVE_METHOD_LABELS = {
+    "stored": "無圧縮で格納",
+    "deflated": "圧縮して格納",
+    "tar": "tar に格納",
+}
+
+
+# ========= アーカイブへの書き込み =========
+class _ZipWriter:
+    """ZIP に1ファイルずつ書き込む（拡張子で無圧縮・圧縮を切り替える）"""
+
+    def __init__(self, path: str, store_exts):
+        self._zip = zipfile.ZipFile(path, "w", allowZip64=True)
+        self._store_exts = {e.lower() for e in store_exts}
+
+    def add(self, f, src: str, arcname: str) -> str:
+        info = zipfile.ZipInfo.from_file(src, arcname, strict_timestamps=False)
+        stored = os.path.splitext(arcname)[1].lower() in self._store_exts
+        info.compress_type = zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED
+        with self._zip.open(info, "w") as out:
+            shutil.copyfileobj(f, out, COPY_BUFSIZE)
+        return "stored" if stored else "deflated"
+
+    def close(self):
+        self._zip.close()
+
+
+class _TarWriter:
+    """tar に1ファイルずつ書き込む（圧縮はストリーム全体にかかる）"""
+
+    def __init__(self, path: str, fmt: str):
+        self._raw = None
+        if fmt == "tar.gz":
+            self._tar = tarfile.open(path, "w:gz")
+        elif _zstd is not None:
+            self._tar = tarfile.open(path, "w:zst")
+        else:
+            self._raw = open(path, "wb")
+            self._stream = _zstandard.ZstdCompressor().stream_writer(self._raw)
+            self._tar = tarfile.open(fileobj=self._stream, mode="w|")
+
+    def add(self, f, src: str, arcname: str) -> str:
+        info = self._tar.gettarinfo(arcname=arcname, fileobj=f)
+        self._tar.addfile(info, f)
+        return "tar"
+
+    def close(self):
+        self._tar.close()
+        if self._raw is not None:
+            self._stream.close()
+            self._raw.close()
+
+
+def open_archive(path: str, fmt: str, store_exts=()):
+    """アーカイブを書き込み用に開く（add(f, src, arcname) と close() を持つ）"""
+    if fmt == "zip":
+        return _ZipWriter(path, store_exts)
+    if fmt in ARCHIVE_FORMATS:
+        return _TarWriter(path, fmt)
+    raise ValueError(f"対応していないアーカイブ形式です: {fmt}")
+
+
+def archive_files(
+    tasks,
+    path: str,
+    fmt: str = "zip",
+    store_exts=DEFAULT_STORE_EXTS,
+    report: CopyReport = None,
+    cancel: threading.Event = None,
+) -> CopyReport:
+    """ファイルを1つのアーカイブへ順に書き込む（rel をアーカイブ内のパスにする）
+
+    いったん path + ".part" に書き、完了したら path に置き換える
+    （中止・失敗した場合は書きかけを消す）。
+    開けなかったファイルは結果に記録して続けるが、読み込み途中のエラーは
+    アーカイブが壊れるので全体を失敗にする。
+    """
+    if report is None:
+        report = CopyReport()
+    report.total = len(tasks)
+    part = path + ".part"
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    writer = open_archive(part, fmt, store_exts)
+    try:
+        for task in tasks:
+            if cancel is not None and cancel.is_set():
+                report.cancelled = True
+                break
+            with report.lock:
+                report.active[task.rel] = time.monotonic()
+            try:
+                f = open(task.src, "rb")
+            except FileNotFoundError:
+                with report.lock:
+                    report.missing.append(task.rel)
+                    report.active.pop(task.rel, None)
+                continue
+            except OSError as e:
+                with report.lock:
+                    report.failed.append((task.rel, str(e)))
+                    report.active.pop(task.rel, None)
+                continue
+            with f:
+                size = os.fstat(f.fileno()).st_size
+                used = writer.add(f, task.src, task.rel.replace(os.sep, "/"))
+            with report.lock:
+                report.active.pop(task.rel, None)
+                report.bytes += size
+                report.copied += 1
+                report.methods[used] = report.methods.get(used, 0) + 1
+        writer.close()
+        writer = None
+        if report.cancelled:
+            os.remove(part)
+        else:
+            os.replace(part, path)
+    finally:
+        if writer is not None:
+            # 途中で失敗した書きかけは残さない
+            try:
+                writer.close()
+            except Exception:
+                pass
+            try:
+                os.remove(part)
+            except OSError:
+                pass
+        report.end = time.monotonic()
+    return report
+
+
+# ========= バックグラウンド作成 =========
+class ArchiveJob:
+    """アーカイブの作成をバックグラウンドスレッドで実行する（中止可能）
+
+    CopyJob と同じく report・done・cancel() を持ち、UI は同じように進捗を描画できる。
+    """
+
+    sync = False  # 差分コピー・再開はアーカイブでは使わない
+    resumed = 0
+
+    def __init__(self, tasks, path: str, fmt: str = "zip", store_exts=DEFAULT_STORE_EXTS):
+        self.dest = path
+        self.fmt = fmt
+        self.store_exts = list(store_exts)
+        self.archive_size = 0
+        self.report = CopyReport(len(tasks))
+        self.error = ""
+        self._cancel = threading.Event()
+        self._done = threading.Event()
+        threading.Thread(target=self._run, args=(list(tasks),), daemon=True).start()
+
+    def _run(self, tasks):
+        try:
+            archive_files(
+                tasks, self.dest, self.fmt, self.store_exts, self.report, self._cancel
+            )
+            if not self.report.cancelled:
+                self.archive_size = os.path.getsize(self.dest)
+        except Exception as e:
+            self.error = str(e) or type(e).__name__
+        finally:
+            self._done.set()
+
+    def cancel(self):
+        """中止を要求（書きかけのアーカイブは消す）"""
+        self._cancel.set()
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    @property
+    def cancelling(self) -> bool:
+        return self._cancel.is_set()
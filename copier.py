@@ -0,0 +1,1195 @@
+import csv
+import errno
+import hashlib
+import json
+import os
+import shutil
+import stat
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+from typing import NamedTuple
+
+# リフリンク（FICLONE）は Linux のみ（Btrfs・XFS など対応するファイルシステムで使う）
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+HAS_REFLINK = fcntl is not None and sys.platform.startswith("linux")
+HAS_COPY_FILE_RANGE = hasattr(os, "copy_file_range")
+HAS_SENDFILE = hasattr(os, "sendfile") and sys.platform.startswith("linux")
+
+# ========= デフォルト設定 =========
+DEFAULT_COPY_WORKERS = 8
+PENDING_PER_WORKER = 4  # 並列数あたりの投入済みコピーの上限（一度に全件を投入しない）
+PROGRESS_INTERVAL_SEC = 0.1  # 進捗を通知する最短間隔
+MTIME_TOLERANCE_NS = 2_000_000_000  # 更新日時の許容差（FAT・SMB 共有の2秒精度に合わせる）
+COPY_CHUNK_SIZE = 1024 * 1024 * 1024  # copy_file_range / sendfile の1回あたりの上限
+COPY_BUFSIZE = 1024 * 1024  # 通常コピーのバッファサイズ
+JOURNAL_NAME = ".filecollect-journal.jsonl"  # 保存先に置く再開用の記録
+JOURNAL_VERSION = 1
+MANIFEST_NAME = "filecollect-manifest"  # 保存先に置くマニフェスト（拡張子は形式による）
+
+# マニフェストの形式（表示用）
+MANIFEST_FORMATS = {"csv": "CSV", "json": "JSON"}
+
+# コピー方法（表示用）
+COPY_METHODS = {
+    "auto": "自動（リフリンク → カーネル内コピー → 通常コピー）",
+    "hardlink": "ハードリンク",
+    "symlink": "シンボリックリンク",
+    "full": "通常のコピー",
+}
+# 実際に使った方法（結果表示用）
+COPY_METHOD_LABELS = {
+    "reflink": "リフリンク",
+    "copy_file_range": "カーネル内コピー",
+    "sendfile": "sendfile",
+    "buffered": "通常コピー",
+    "hardlink": "ハードリンク",
+    "symlink": "シンボリックリンク",
+    "fanout": "同時書き込み（1回の読み込みで複数の保存先へ）",
+    "stream": "通常コピー（チェックサム付き）",
+}
+
+FICLONE = 0x40049409
+# 高速なコピー方法が使えないことを示すエラー（次の方法に切り替える）
+FALLBACK_ERRNOS = {
+    errno.EXDEV,
+    errno.ENOSYS,
+    errno.EINVAL,
+    errno.EOPNOTSUPP,
+    errno.ENOTSUP,
+    errno.ENOTTY,
+    errno.EBADF,
+    errno.EPERM,
+}
+# ハードリンクが作れないことを示すエラー（通常のコピーに切り替える）
+LINK_FALLBACK_ERRNOS = {errno.EXDEV, errno.EPERM, errno.EMLINK, errno.EOPNOTSUPP, errno.ENOTSUP}
+
+
+# ========= コピー対象 =========
+class CopyTask(NamedTuple):
+    """1ファイル分のコピー"""
+
+    src: str
+    dst: str
+    rel: str  # 表示用の相対パス
+
+
+def make_tasks(entries, dest: str) -> list:
+    """エントリ（rel_path / abs_path を持つもの）から保存先へのコピー対象を作る"""
+    return [
+        CopyTask(e["abs_path"], os.path.join(dest, e["rel_path"]), e["rel_path"])
+        for e in entries
+    ]
+
+
+def unique_dests(dest: str, extra_dests) -> list:
+    """追加の保存先から、空のもの・dest や互いに重複するものを除く"""
+    seen = {os.path.normcase(os.path.abspath(dest))}
+    result = []
+    for d in extra_dests:
+        d = d.strip()
+        key = os.path.normcase(os.path.abspath(d)) if d else ""
+        if d and key not in seen:
+            seen.add(key)
+            result.append(d)
+    return result
+
+
+class CopyReport:
+    """コピーの進捗と結果
+
+    コピーを進めるスレッドが更新し、UI は lock を取って読む。
+    """
+
+    def __init__(self, total: int = 0):
+        self.total = total
+        self.copied = 0
+        self.bytes = 0
+        self.skipped = 0  # 保存先が最新だったのでコピーしなかったファイル数
+        self.skipped_bytes = 0  # コピーせずに済んだバイト数
+        self.deleted = []  # 保存先から削除したファイル（保存先からの相対パス。保存先が複数なら絶対パス）
+        self.missing = []  # 見つからなかったファイル（相対パス）
+        self.failed = []  # [(相対パス, エラーメッセージ)]
+        self.active = {}  # コピー中のファイル {相対パス: 開始時刻}
+        self.methods = {}  # 実際に使ったコピー方法ごとの件数
+        self.dests = {}  # 保存先が複数の場合の保存先ごとの結果 {保存先: DestStats}
+        self.verified = 0  # チェックサムで保存先の内容を確かめたファイル数
+        self.manifests = []  # 書き込んだマニフェストのパス
+        self.cancelled = False
+        self.start = time.monotonic()
+        self.end = None
+        self.lock = threading.Lock()
+
+    @property
+    def done(self) -> int:
+        """処理済みの件数（失敗・スキップを含む）"""
+        return self.copied + self.skipped + len(self.missing) + len(self.failed)
+
+    @property
+    def elapsed(self) -> float:
+        return (self.end or time.monotonic()) - self.start
+
+    @property
+    def throughput(self) -> float:
+        """コピー速度（バイト/秒）"""
+        elapsed = self.elapsed
+        return self.bytes / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta(self):
+        """残り時間の見込み（秒、まだ見込めなければ None）"""
+        done = self.done
+        if not done or self.end is not None:
+            return None
+        return (self.total - done) * self.elapsed / done
+
+    def slowest(self):
+        """コピー中で最も時間のかかっているファイルを (相対パス, 経過秒) で返す（なければ None）"""
+        with self.lock:
+            if not self.active:
+                return None
+            rel, started = min(self.active.items(), key=lambda item: item[1])
+        return rel, time.monotonic() - started
+
+
+class DestStats:
+    """保存先ごとの結果（複数の保存先へ同時にコピーする場合）"""
+
+    def __init__(self):
+        self.copied = 0
+        self.bytes = 0
+        self.skipped = 0
+        self.deleted = 0
+        self.failed = []  # [(相対パス, エラーメッセージ)]
+
+
+def format_size(n: float) -> str:
+    """バイト数を表示用の文字列にする"""
+    for unit in ("B", "KB", "MB", "GB"):
+        if n < 1024:
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} TB"
+
+
+def free_space(path: str):
+    """path のドライブの空き容量（path がまだなければ、ある親フォルダで調べる。分からなければ None）"""
+    path = os.path.abspath(path)
+    while not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+    try:
+        return shutil.disk_usage(path).free
+    except OSError:
+        return None
+
+
+class DirCache:
+    """作成済みの保存先フォルダを覚えておき、os.makedirs をフォルダごとに1回にする"""
+
+    def __init__(self):
+        self._created = set()
+        self._lock = threading.Lock()
+
+    def ensure(self, path: str):
+        if path in self._created:
+            return
+        # 同じフォルダを複数のスレッドが同時に作っても exist_ok で問題ない
+        os.makedirs(path, exist_ok=True)
+        with self._lock:
+            self._created.add(path)
+
+
+# ========= 差分判定 =========
+def file_digest(path: str) -> bytes:
+    """ファイル内容のハッシュ（BLAKE2b）"""
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, hashlib.blake2b).digest()
+
+
+def is_up_to_date(
+    src: str, src_stat: os.stat_result, dst: str, compare_hash: bool = False
+) -> bool:
+    """保存先のファイルがコピー元と同じか（サイズと更新日時、指定すれば内容も比較）"""
+    try:
+        dst_stat = os.stat(dst)
+    except OSError:
+        return False
+    if not stat.S_ISREG(dst_stat.st_mode) or dst_stat.st_size != src_stat.st_size:
+        return False
+    if abs(dst_stat.st_mtime_ns - src_stat.st_mtime_ns) > MTIME_TOLERANCE_NS:
+        return False
+    return not compare_hash or file_digest(src) == file_digest(dst)
+
+
+# ========= チェックサムとマニフェスト =========
+def file_sha256(path: str) -> str:
+    """ファイル内容の SHA-256（16進）"""
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def manifest_name(fmt: str) -> str:
+    """マニフェストのファイル名"""
+    return f"{MANIFEST_NAME}.{fmt}"
+
+
+class ManifestEntry(NamedTuple):
+    """マニフェストの1行"""
+
+    rel_path: str
+    size: int
+    mtime: float
+    sha256: str
+
+
+def write_manifest(root: str, entries, fmt: str = "csv") -> str:
+    """保存先にマニフェスト（rel_path, size, mtime, sha256）を書き、そのパスを返す
+
+    rel_path は / 区切り、mtime は ISO 8601（タイムゾーン付き）で書く。
+    """
+    if fmt not in MANIFEST_FORMATS:
+        raise ValueError(f"不明なマニフェストの形式です: {fmt}")
+    rows = [
+        {
+            "rel_path": e.rel_path.replace(os.sep, "/"),
+            "size": e.size,
+            "mtime": datetime.fromtimestamp(e.mtime).astimezone().isoformat(),
+            "sha256": e.sha256,
+        }
+        for e in sorted(entries)
+    ]
+    path = os.path.join(root, manifest_name(fmt))
+    part = path + ".part"
+    with open(part, "w", encoding="utf-8", newline="") as f:
+        if fmt == "csv":
+            writer = csv.DictWriter(f, fieldnames=list(ManifestEntry._fields))
+            writer.writeheader()
+            writer.writerows(rows)
+        else:
+            created = datetime.now().astimezone().isoformat()
+            json.dump({"created": created, "files": rows}, f, ensure_ascii=False, indent=2)
+    os.replace(part, path)
+    return path
+
+
+def read_manifest(root: str, fmt: str = "csv") -> dict:
+    """保存先のマニフェストを {相対パス: ManifestEntry} で読む（なければ・読めなければ空）"""
+    try:
+        with open(os.path.join(root, manifest_name(fmt)), encoding="utf-8", newline="") as f:
+            rows = list(csv.DictReader(f)) if fmt == "csv" else json.load(f)["files"]
+        entries = [
+            ManifestEntry(
+                r["rel_path"].replace("/", os.sep),
+                int(r["size"]),
+                datetime.fromisoformat(r["mtime"]).timestamp(),
+                r["sha256"],
+            )
+            for r in rows
+        ]
+    except (OSError, ValueError, KeyError, TypeError):
+        return {}
+    return {e.rel_path: e for e in entries}
+
+
+def known_sha256(entry: ManifestEntry, src_stat: os.stat_result):
+    """前回のマニフェストの行がコピー元と同じサイズ・更新日時なら、その SHA-256（違えば None）"""
+    if entry is None or entry.size != src_stat.st_size:
+        return None
+    # マニフェストの更新日時はコピー元の値をマイクロ秒まで書いたもの
+    if abs(entry.mtime - src_stat.st_mtime) > 1e-3:
+        return None
+    return entry.sha256
+
+
+# ========= コピー方法 =========
+def _reflink(fd_src: int, fd_dst: int):
+    fcntl.ioctl(fd_dst, FICLONE, fd_src)
+
+
+def _copy_file_range(fd_src: int, fd_dst: int):
+    offset = 0
+    while True:
+        copied = os.copy_file_range(fd_src, fd_dst, COPY_CHUNK_SIZE)
+        if not copied:
+            break
+        offset += copied
+    _check_copied(fd_src, offset)
+
+
+def _sendfile(fd_src: int, fd_dst: int):
+    offset = 0
+    while True:
+        sent = os.sendfile(fd_dst, fd_src, offset, COPY_CHUNK_SIZE)
+        if not sent:
+            break
+        offset += sent
+    _check_copied(fd_src, offset)
+
+
+def _check_copied(fd_src: int, offset: int):
+    """1バイトも写せなかったのにコピー元が空でなければ、その方法は使えないとみなす
+
+    procfs・sysfs や一部の FUSE・ネットワークのファイルシステム、古いカーネルでの
+    ファイルシステムをまたぐコピーでは、最初の呼び出しから 0 を返すことがある。
+    """
+    if not offset and os.fstat(fd_src).st_size > 0:
+        raise OSError(errno.ENOTSUP, "コピーできたバイト数が 0 です")
+
+
+FAST_COPIES = [
+    (name, func)
+    for name, func, available in (
+        ("reflink", _reflink, HAS_REFLINK),
+        ("copy_file_range", _copy_file_range, HAS_COPY_FILE_RANGE),
+        ("sendfile", _sendfile, HAS_SENDFILE),
+    )
+    if available
+]
+
+
+def _remove_if_aliased(src_stat: os.stat_result, dst: str):
+    """保存先がコピー元へのリンクなら先に消す（書き込みでコピー元を壊さないため）"""
+    try:
+        dst_stat = os.lstat(dst)
+    except FileNotFoundError:
+        return
+    if stat.S_ISLNK(dst_stat.st_mode) or os.path.samestat(dst_stat, src_stat):
+        os.remove(dst)
+
+
+def _is_link_to(src: str, dst: str, src_stat: os.stat_result, symbolic: bool) -> bool:
+    """保存先がすでにコピー元へのリンク（symbolic ならシンボリックリンク）か"""
+    try:
+        dst_stat = os.lstat(dst)
+        if symbolic:
+            return stat.S_ISLNK(dst_stat.st_mode) and os.readlink(dst) == src
+        return os.path.samestat(dst_stat, src_stat)
+    except OSError:
+        return False
+
+
+def _replace_with_link(make_link, src: str, dst: str):
+    """リンクを一時名で作ってから保存先に置き換える（既存のファイルも上書きする）"""
+    tmp = f"{dst}.{os.getpid()}-{threading.get_ident()}.tmp"
+    make_link(src, tmp)
+    try:
+        os.replace(tmp, dst)
+    except OSError:
+        os.remove(tmp)
+        raise
+    # 一時名と保存先が同じファイルへのハードリンクだと、rename は何もせずに成功する
+    if os.path.lexists(tmp):
+        os.remove(tmp)
+
+
+class FileCopier:
+    """指定した方法で1ファイルをコピーする
+
+    auto はリフリンク → copy_file_range → sendfile → 通常コピーの順に試し、
+    使えなかった方法を (コピー元, 保存先) のデバイスの組ごとに覚えて次から飛ばす。
+    hardlink は別のファイルシステムなどでリンクできなければ auto でコピーする。
+    コピーした場合は shutil.copy2 と同じく更新日時・権限も写す。
+    """
+
+    def __init__(self, method: str = "auto"):
+        if method not in COPY_METHODS:
+            raise ValueError(f"不明なコピー方法です: {method}")
+        self.method = method
+        self._unsupported = set()  # {(方法, コピー元のデバイス, 保存先のデバイス)}
+
+    def copy(self, src: str, dst: str, src_stat: os.stat_result) -> str:
+        """コピーし、実際に使った方法を返す"""
+        if self.method == "symlink":
+            target = os.path.abspath(src)
+            # すでにコピー元を指していればそのまま使う（2回目以降の保存）
+            if not _is_link_to(target, dst, src_stat, symbolic=True):
+                _replace_with_link(os.symlink, target, dst)
+            return "symlink"
+        if self.method == "hardlink":
+            if _is_link_to(src, dst, src_stat, symbolic=False):
+                return "hardlink"
+            try:
+                _replace_with_link(os.link, src, dst)
+                return "hardlink"
+            except OSError as e:
+                if e.errno not in LINK_FALLBACK_ERRNOS:
+                    raise
+
+        _remove_if_aliased(src_stat, dst)
+        if self.method == "full":
+            shutil.copyfile(src, dst)
+            used = "buffered"
+        else:
+            used = self._fast_copy(src, dst, src_stat)
+        shutil.copystat(src, dst)
+        return used
+
+    def _fast_copy(self, src: str, dst: str, src_stat: os.stat_result) -> str:
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            devices = (src_stat.st_dev, os.fstat(fdst.fileno()).st_dev)
+            for name, func in FAST_COPIES:
+                if (name, *devices) in self._unsupported:
+                    continue
+                try:
+                    func(fsrc.fileno(), fdst.fileno())
+                    return name
+                except OSError as e:
+                    if e.errno not in FALLBACK_ERRNOS:
+                        raise
+                    self._unsupported.add((name, *devices))
+                    # 途中まで書いた分を捨てて次の方法でやり直す
+                    fsrc.seek(0)
+                    fdst.seek(0)
+                    fdst.truncate()
+            shutil.copyfileobj(fsrc, fdst, COPY_BUFSIZE)
+            return "buffered"
+
+
+# ========= 再開用の記録 =========
+class CopyJournal:
+    """保存先に置くコピーの記録（途中で止まったコピーを再開するため）
+
+    1行目に設定と件数、続けてコピー対象（task）を1行ずつ書き、以降はコピーを始めた
+    ファイル（start）と終えたファイル（done）を1行ずつ追記する。
+    プロセスが落ちても書けた行までは残る。すべて終わったら削除する。
+    """
+
+    def __init__(self, dest: str):
+        self.dest = dest
+        self.path = os.path.join(dest, JOURNAL_NAME)
+        self._f = None
+
+    def exists(self) -> bool:
+        return os.path.isfile(self.path)
+
+    def create(self, tasks, options: dict):
+        """予定を書いて記録を始める（既存の記録は置き換える）"""
+        header = {
+            "version": JOURNAL_VERSION,
+            "created": time.time(),
+            "options": options,
+            "total": len(tasks),
+        }
+        self._f = open(self.path, "w", encoding="utf-8")
+        lines = [header] + [{"task": list(t)} for t in tasks]
+        self._f.writelines(json.dumps(r, ensure_ascii=False) + "\n" for r in lines)
+        self._f.flush()
+
+    def reopen(self):
+        """既存の記録に追記する"""
+        self._f = open(self.path, "a", encoding="utf-8")
+
+    def started(self, rel: str):
+        self._write({"start": rel})
+
+    def finished(self, rel: str, sha256: str = None):
+        """ファイルを終えたことを書く（チェックサムを取った場合はその SHA-256 も）"""
+        record = {"done": rel}
+        if sha256:
+            record["sha256"] = sha256
+        self._write(record)
+
+    def _write(self, record: dict):
+        self._f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._f.flush()
+
+    def close(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+    def remove(self):
+        self.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def read_header(self):
+        """予定の件数と作成日時を (件数, 作成時刻) で返す（読めなければ None）"""
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                header = json.loads(f.readline())
+            return header["total"], header["created"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def load(self):
+        """記録を読み、(予定の CopyTask のリスト, 設定, 完了した相対パス, コピー中だった相対パス,
+        完了したファイルの SHA-256 {相対パス: SHA-256}) を返す
+
+        最後の行が書きかけで壊れていても、それまでの行は使う。
+
+        Raises:
+            OSError, ValueError: 記録が読めない
+        """
+        with open(self.path, encoding="utf-8") as f:
+            header = json.loads(f.readline())
+            if header.get("version") != JOURNAL_VERSION:
+                raise ValueError(f"対応していない記録の形式です: {header.get('version')}")
+            tasks = []
+            done = set()
+            started = set()
+            digests = {}
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if "done" in record:
+                    done.add(record["done"])
+                    if "sha256" in record:
+                        digests[record["done"]] = record["sha256"]
+                elif "start" in record:
+                    started.add(record["start"])
+                elif "task" in record:
+                    tasks.append(CopyTask(*record["task"]))
+        if len(tasks) != header["total"]:
+            raise ValueError("記録の予定が途中で切れています")
+        return tasks, header["options"], done, started - done, digests
+
+
+# ========= 並列コピー =========
+def copy_one(
+    task: CopyTask,
+    dirs: DirCache,
+    copier: FileCopier,
+    report: CopyReport = None,
+    sync: bool = False,
+    compare_hash: bool = False,
+):
+    """1ファイルをコピーし、(使った方法, バイト数) を返す
+
+    sync を指定した場合、保存先が最新ならコピーせずに ("", バイト数) を返す。
+
+    Raises:
+        FileNotFoundError: コピー元が（通常のファイルとして）存在しない
+        OSError: コピーに失敗した
+    """
+    if report is not None:
+        with report.lock:
+            report.active[task.rel] = time.monotonic()
+    try:
+        st = os.stat(task.src)
+        if not stat.S_ISREG(st.st_mode):
+            raise FileNotFoundError(task.src)
+        if sync and is_up_to_date(task.src, st, task.dst, compare_hash):
+            return "", st.st_size
+        dirs.ensure(os.path.dirname(task.dst))
+        return copier.copy(task.src, task.dst, st), st.st_size
+    finally:
+        if report is not None:
+            with report.lock:
+                report.active.pop(task.rel, None)
+
+
+def _discard(f, path: str):
+    """書きかけの保存先を閉じて消す"""
+    try:
+        f.close()
+    except OSError:
+        pass
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _write_chunk(chunk: bytes, outs: dict, results: dict, writers: ThreadPoolExecutor):
+    """チャンクを開いている保存先すべてへ同時に書き込み、失敗した保存先は外して消す"""
+    roots = list(outs)
+    # 1つ目は呼び出し元のスレッドで書き、残りを writers で並行に書く
+    futures = {root: writers.submit(outs[root][0].write, chunk) for root in roots[1:]}
+    errors = {}
+    try:
+        outs[roots[0]][0].write(chunk)
+    except OSError as e:
+        errors[roots[0]] = e
+    for root, fut in futures.items():
+        e = fut.exception()
+        if e is not None:
+            errors[root] = e
+    for root, e in errors.items():
+        f, dst = outs.pop(root)
+        _discard(f, dst)
+        results[root] = str(e)
+
+
+def fan_out_one(
+    task: CopyTask,
+    roots,
+    dirs: DirCache,
+    writers: ThreadPoolExecutor,
+    report: CopyReport = None,
+    sync: bool = False,
+    compare_hash: bool = False,
+    hashers: ThreadPoolExecutor = None,
+):
+    """1ファイルを1回だけ読み、各保存先（roots 下の task.rel）へ同時に書き込む
+
+    保存先ごとの結果を {保存先: 結果} で返す。結果は書き込んだら "fanout"、
+    sync で保存先が最新だったら ""、それ以外はエラーメッセージ。
+    書き込みに失敗した保存先は書きかけを消し、他の保存先への書き込みは続ける。
+    hashers を渡すと、読んだチャンクの SHA-256 を hashers で計算する
+    （次のチャンクの読み書きと重ねるので、コピーを待たせない）。書いたのは読んだチャンクそのもの
+    なので、これが保存先の SHA-256 になる。読んでいる間にコピー元が変わった場合は、
+    書いた内容が1つの版にならないので失敗にする。
+
+    Returns:
+        (保存先ごとの結果, コピー元の stat, コピー元の SHA-256（計算しなければ None）)
+
+    Raises:
+        FileNotFoundError: コピー元が（通常のファイルとして）存在しない
+        OSError: コピー元が読めない（書きかけはすべて消す）
+    """
+    if report is not None:
+        with report.lock:
+            report.active[task.rel] = time.monotonic()
+    outs = {}  # {保存先: (ファイル, パス)}
+    try:
+        st = os.stat(task.src)
+        if not stat.S_ISREG(st.st_mode):
+            raise FileNotFoundError(task.src)
+        results = {}
+        for root in roots:
+            dst = os.path.join(root, task.rel)
+            if sync and is_up_to_date(task.src, st, dst, compare_hash):
+                results[root] = ""
+                continue
+            try:
+                dirs.ensure(os.path.dirname(dst))
+                _remove_if_aliased(st, dst)
+                outs[root] = (open(dst, "wb"), dst)
+            except OSError as e:
+                results[root] = str(e)
+        digest = None
+        if outs:
+            sha = hashlib.sha256() if hashers is not None else None
+            hashing = None  # 計算中のチャンク（順に足すので前のチャンクを待ってから投入する）
+            with open(task.src, "rb") as fsrc:
+                while outs:
+                    chunk = fsrc.read(COPY_BUFSIZE)
+                    if not chunk:
+                        break
+                    if sha is not None:
+                        if hashing is not None:
+                            hashing.result()
+                        hashing = hashers.submit(sha.update, chunk)
+                    _write_chunk(chunk, outs, results, writers)
+                if sha is not None and outs:
+                    after = os.fstat(fsrc.fileno())
+                    if (after.st_size, after.st_mtime_ns) != (st.st_size, st.st_mtime_ns):
+                        while outs:
+                            root, (f, dst) = outs.popitem()
+                            _discard(f, dst)
+                            results[root] = "コピー中にコピー元が変更されました"
+            if hashing is not None:
+                hashing.result()
+            if sha is not None:
+                digest = sha.hexdigest()
+        while outs:
+            root, (f, dst) = outs.popitem()
+            try:
+                f.close()
+                shutil.copystat(task.src, dst)
+                results[root] = "fanout"
+            except OSError as e:
+                _discard(f, dst)
+                results[root] = str(e)
+        return results, st, digest
+    finally:
+        # コピー元が読めなかった場合は書きかけをすべて消す
+        for f, dst in outs.values():
+            _discard(f, dst)
+        if report is not None:
+            with report.lock:
+                report.active.pop(task.rel, None)
+
+
+def remove_extra_files(
+    dest: str, keep_paths, report: CopyReport, stats: DestStats = None
+):
+    """保存先にあって keep_paths に含まれないファイルを削除し、空になったフォルダも消す
+
+    stats を渡した場合（保存先が複数の場合）は、結果を保存先ごとにも数え、
+    report には絶対パスで記録する。
+    """
+    keep = {os.path.normcase(os.path.abspath(p)) for p in keep_paths}
+    emptied = set()
+    for dirpath, _, filenames in os.walk(dest):
+        for fn in filenames:
+            path = os.path.join(dirpath, fn)
+            if os.path.normcase(os.path.abspath(path)) in keep:
+                continue
+            rel = os.path.relpath(path, dest)
+            try:
+                os.remove(path)
+            except OSError as e:
+                with report.lock:
+                    if stats is None:
+                        report.failed.append((rel, str(e)))
+                    else:
+                        report.failed.append((path, str(e)))
+                        stats.failed.append((rel, str(e)))
+                continue
+            with report.lock:
+                if stats is None:
+                    report.deleted.append(rel)
+                else:
+                    report.deleted.append(path)
+                    stats.deleted += 1
+            emptied.add(dirpath)
+
+    # 深いフォルダから順に、空になったものを保存先の手前まで消す
+    dest = os.path.abspath(dest)
+    for dirpath in sorted(emptied, key=len, reverse=True):
+        dirpath = os.path.abspath(dirpath)
+        while dirpath != dest and dirpath.startswith(dest):
+            try:
+                os.rmdir(dirpath)
+            except OSError:
+                break
+            dirpath = os.path.dirname(dirpath)
+
+
+def copy_files(
+    tasks,
+    workers: int = DEFAULT_COPY_WORKERS,
+    on_progress=None,
+    report: CopyReport = None,
+    cancel: threading.Event = None,
+    sync: bool = False,
+    compare_hash: bool = False,
+    delete_extra_in: str = "",
+    method: str = "auto",
+    journal: CopyJournal = None,
+    verify=(),
+    keep_rels=(),
+    dests=(),
+    checksum: bool = False,
+    manifest_format: str = "csv",
+    verify_from_disk: bool = False,
+    known_digests=None,
+) -> CopyReport:
+    """ファイルをスレッドプールで並列にコピーする
+
+    コピー元フォルダ順に並べ替えて投入し（同じフォルダの読み出しが続くようにする）、
+    失敗したファイルは中断せずに結果へ記録する。
+    cancel がセットされたら新しいコピーは始めず、コピー中のファイルを終えて戻る。
+    dests に保存先を2つ以上渡した場合は、各ファイルを1回だけ読んで全保存先へ同時に書き込み
+    （method は使わない）、保存先ごとの結果を report.dests に入れる。
+    このとき1つでも失敗した保存先があるファイルは失敗として記録する。
+
+    checksum を指定した場合は、コピー元の SHA-256 を読み込みながら計算し（書き込むのは
+    読んだチャンクそのものなので、保存先を読み直さない）、中止しなければ各保存先に
+    マニフェストを書く。最新だった保存先は、前回のマニフェストか known_digests に
+    同じサイズ・更新日時の SHA-256 があればそれを使い、なければ保存先を読んで計算する。
+    verify_from_disk を指定すると、書き込んだ保存先もすべて読み直して照合する
+    （照合は別のスレッドプールで行い、一致しなければ失敗として記録する）。
+
+    Args:
+        tasks: CopyTask のリスト
+        on_progress: 進捗の通知先 on_progress(report)（呼び出し元のスレッドで呼ぶ）
+        report: 進捗を書き込む CopyReport（別スレッドから読む場合に渡す）
+        sync: 保存先のファイルがサイズ・更新日時とも同じならコピーしない
+        compare_hash: sync で内容のハッシュも比較する
+        delete_extra_in: 指定したフォルダから、コピー対象にないファイルを最後に削除する
+            （中止した場合は削除しない。保存先が複数なら各保存先から削除する）
+        method: コピー方法（COPY_METHODS のキー）
+        journal: 開始・完了したファイルを追記する CopyJournal
+        verify: 保存先が最新ならコピーしないファイルの相対パス
+            （sync でなくても、再開時に書きかけだった可能性のあるファイルを確かめる）
+        keep_rels: delete_extra_in で削除しないファイルの相対パス（tasks に加えて）
+        dests: 保存先のフォルダ（2つ以上なら tasks の dst の代わりに 保存先/rel へコピーする）
+        checksum: チェックサムで確かめてマニフェストを書く（dests が必要。method は使わない）
+        manifest_format: マニフェストの形式（MANIFEST_FORMATS のキー）
+        verify_from_disk: checksum で、保存先をディスクから読み直して照合する
+        known_digests: 前回までにチェックサムを取ったファイルの {相対パス: SHA-256}
+            （再開時に、済んでいたファイルを読み直さないため）
+    """
+    tasks = sorted(tasks, key=lambda t: os.path.dirname(t.src))
+    if report is None:
+        report = CopyReport()
+    report.total = len(tasks)
+    dirs = DirCache()
+    copier = FileCopier(method)
+    workers = max(1, int(workers))
+    todo = iter(tasks)
+    last_notified = 0.0
+    dests = list(dests)
+    checksum = checksum and bool(dests)
+    # 保存先が複数か、チェックサムを取る場合は、1回読んで各保存先へ書き込む
+    streaming = len(dests) >= 2 or checksum
+    dest_stats = {root: DestStats() for root in dests}
+    if len(dests) >= 2:
+        report.dests = dest_stats
+    writers = hashers = None
+    if streaming:
+        # 各コピーが自分で1つ目の保存先に書くので、残りの保存先の分だけ書き込み用に用意する
+        writers = ThreadPoolExecutor(max_workers=workers * max(1, len(dests) - 1))
+    if checksum:
+        hashers = ThreadPoolExecutor(max_workers=workers)
+    checks = {}  # 保存先を読み直すハッシュ {future: (相対パス, 保存先)}
+    checking = {}  # 照合待ちのファイル {相対パス: _Checking}
+    manifests = {root: [] for root in dests}
+    # 最新だった保存先のハッシュを読まずに済ませるため、前回のマニフェストを読んでおく
+    previous = {}
+    if checksum and not verify_from_disk:
+        previous = {root: read_manifest(root, manifest_format) for root in dests}
+    known_digests = known_digests or {}
+
+    def finish(rel: str, results: dict, src_stat: os.stat_result, digest=None):
+        if _record_stream(report, dest_stats, rel, results, src_stat.st_size, checksum):
+            if journal is not None:
+                journal.finished(rel, digest)
+
+    def known_digest(root: str, rel: str, src_stat: os.stat_result):
+        """最新だった保存先の、読まずに分かる SHA-256（分からなければ None）"""
+        digest = known_sha256(previous[root].get(rel), src_stat)
+        return digest or known_digests.get(rel)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {}
+        while True:
+            if cancel is not None and cancel.is_set():
+                report.cancelled = True
+            else:
+                for task in todo:
+                    if journal is not None:
+                        journal.started(task.rel)
+                    task_sync = sync or task.rel in verify
+                    if streaming:
+                        fut = pool.submit(
+                            fan_out_one,
+                            task,
+                            dests,
+                            dirs,
+                            writers,
+                            report,
+                            task_sync,
+                            compare_hash,
+                            hashers,
+                        )
+                    else:
+                        fut = pool.submit(
+                            copy_one, task, dirs, copier, report, task_sync, compare_hash
+                        )
+                    pending[fut] = task
+                    if len(pending) >= workers * PENDING_PER_WORKER:
+                        break
+            if not pending and not checks:
+                break
+            # 中止要求を確認できるよう待ち時間を区切る
+            done, _ = wait(
+                list(pending) + list(checks),
+                timeout=PROGRESS_INTERVAL_SEC,
+                return_when=FIRST_COMPLETED,
+            )
+            for fut in done:
+                if fut in checks:
+                    rel, root = checks.pop(fut)
+                    item = checking[rel]
+                    try:
+                        item.digests[root] = fut.result()
+                    except OSError as e:
+                        item.results[root] = f"チェックサムを計算できません: {e}"
+                    item.remaining -= 1
+                    if not item.remaining:
+                        del checking[rel]
+                        item.compare(manifests)
+                        finish(rel, item.results, item.src_stat, item.source_digest())
+                    continue
+
+                task = pending.pop(fut)
+                try:
+                    result = fut.result()
+                except FileNotFoundError:
+                    with report.lock:
+                        report.missing.append(task.rel)
+                    if journal is not None:
+                        journal.finished(task.rel)  # 再開しても見つからないので済みにする
+                except OSError as e:
+                    with report.lock:
+                        report.failed.append((task.rel, str(e)))
+                        for stats in report.dests.values():
+                            stats.failed.append((task.rel, str(e)))
+                else:
+                    if not streaming:
+                        used, size = result
+                        with report.lock:
+                            if used:
+                                report.bytes += size
+                                report.copied += 1
+                                report.methods[used] = report.methods.get(used, 0) + 1
+                            else:
+                                report.skipped_bytes += size
+                                report.skipped += 1
+                        if journal is not None:
+                            journal.finished(task.rel)
+                        continue
+                    results, src_stat, digest = result
+                    if not checksum:
+                        finish(task.rel, results, src_stat)
+                        continue
+                    if verify_from_disk:
+                        # 書き込んだ保存先は照合のため、最新だった保存先はマニフェストのために読む
+                        roots = [r for r, res in results.items() if res in ("fanout", "")]
+                    else:
+                        # 書き込んだ保存先は読みながら計算したハッシュをそのまま使い、
+                        # 最新だった保存先はハッシュが分からないものだけ読む
+                        roots = []
+                        for root, res in results.items():
+                            sha256 = digest if res == "fanout" else None
+                            if res == "":
+                                sha256 = known_digest(root, task.rel, src_stat)
+                                digest = digest or sha256
+                                if sha256 is None:
+                                    roots.append(root)
+                                    continue
+                            if sha256 is not None:
+                                manifests[root].append(
+                                    ManifestEntry(
+                                        task.rel, src_stat.st_size, src_stat.st_mtime, sha256
+                                    )
+                                )
+                    if not roots:
+                        finish(task.rel, results, src_stat, digest)
+                        continue
+                    checking[task.rel] = _Checking(task.rel, results, src_stat, digest, len(roots))
+                    for root in roots:
+                        check = hashers.submit(file_sha256, os.path.join(root, task.rel))
+                        checks[check] = (task.rel, root)
+            now = time.monotonic()
+            if on_progress is not None and now - last_notified >= PROGRESS_INTERVAL_SEC:
+                last_notified = now
+                on_progress(report)
+    for executor in (writers, hashers):
+        if executor is not None:
+            executor.shutdown()
+
+    if delete_extra_in and not report.cancelled:
+        rels = [t.rel for t in tasks] + list(keep_rels)
+        if len(dests) >= 2:
+            for root in dests:
+                keep = [os.path.join(root, rel) for rel in rels]
+                remove_extra_files(root, keep, report, report.dests[root])
+        else:
+            keep = [os.path.join(delete_extra_in, rel) for rel in rels]
+            remove_extra_files(delete_extra_in, keep, report)
+
+    if checksum and not report.cancelled:
+        for root in dests:
+            try:
+                path = write_manifest(root, manifests[root], manifest_format)
+            except OSError as e:
+                with report.lock:
+                    report.failed.append((manifest_name(manifest_format), str(e)))
+                continue
+            with report.lock:
+                report.manifests.append(path)
+
+    report.end = time.monotonic()
+    if on_progress is not None:
+        on_progress(report)
+    return report
+
+
+class _Checking:
+    """保存先を読み直したハッシュを待っている1ファイル（verify_from_disk か、最新だった保存先）"""
+
+    def __init__(self, rel: str, results: dict, src_stat: os.stat_result, digest, remaining: int):
+        self.rel = rel
+        self.results = results
+        self.src_stat = src_stat
+        self.digest = digest  # コピー元の SHA-256（コピーせず、前回の値も分からなければ None）
+        self.digests = {}  # {保存先: 保存先の SHA-256}
+        self.remaining = remaining
+
+    def source_digest(self):
+        """記録に残すコピー元の SHA-256（読み直した保存先の値でもよい。分からなければ None）"""
+        if self.digest is not None:
+            return self.digest
+        return next((d for root, d in self.digests.items() if self.results[root] == ""), None)
+
+    def compare(self, manifests: dict):
+        """読み直した保存先をコピー元と照合し、確かめられた保存先をマニフェストに加える"""
+        for root, digest in self.digests.items():
+            if self.results[root] == "fanout" and digest != self.digest:
+                self.results[root] = "チェックサムが一致しません（コピー後の内容が異なります）"
+                # 再開・差分コピーで最新と見なされないよう、壊れた保存先は消す
+                try:
+                    os.remove(os.path.join(root, self.rel))
+                except OSError:
+                    pass
+                continue
+            manifests[root].append(
+                ManifestEntry(self.rel, self.src_stat.st_size, self.src_stat.st_mtime, digest)
+            )
+
+
+def _record_stream(
+    report: CopyReport, dest_stats: dict, rel: str, results: dict, size: int, checksum: bool
+) -> bool:
+    """fan_out_one の結果を保存先ごと・全体に記録し、すべての保存先で済んだかを返す"""
+    errors = []
+    with report.lock:
+        for root, stats in dest_stats.items():
+            result = results[root]
+            if result == "fanout":
+                stats.copied += 1
+                stats.bytes += size
+            elif result == "":
+                stats.skipped += 1
+            else:
+                stats.failed.append((rel, result))
+                errors.append(f"{root}: {result}" if len(results) > 1 else result)
+        if errors:
+            report.failed.append((rel, " / ".join(errors)))
+        elif "fanout" in results.values():
+            report.bytes += size  # 読み込みは1回なので1回分だけ数える
+            report.copied += 1
+            used = "fanout" if len(results) > 1 else "stream"
+            report.methods[used] = report.methods.get(used, 0) + 1
+            if checksum:
+                report.verified += 1
+        else:
+            report.skipped_bytes += size
+            report.skipped += 1
+    return not errors
+
+
+# ========= バックグラウンドコピー =========
+class CopyJob:
+    """コピーをバックグラウンドスレッドで実行する（中止・再開可能）
+
+    UI は report を読んで進捗を描画し、done になったら結果を表示する。
+    想定外の例外で止まった場合は error にメッセージが入る。
+    保存先には CopyJournal を書き、すべて成功したら消す（中止・失敗・異常終了時は残る）。
+    resume=True の場合は tasks と設定の代わりに保存先の記録を読み、残りだけをコピーする。
+    extra_dests を渡すと、各ファイルを1回だけ読んで dest と extra_dests へ同時にコピーする
+    （記録は dest にだけ置く）。
+    checksum を指定すると、チェックサムで確かめて各保存先にマニフェストを書く
+    （verify_from_disk を指定すると、書き込んだ保存先も読み直して照合する）。
+    """
+
+    def __init__(
+        self,
+        tasks,
+        dest: str,
+        workers: int = DEFAULT_COPY_WORKERS,
+        sync: bool = False,
+        compare_hash: bool = False,
+        delete_extra: bool = False,
+        method: str = "auto",
+        resume: bool = False,
+        extra_dests=(),
+        checksum: bool = False,
+        manifest_format: str = "csv",
+        verify_from_disk: bool = False,
+    ):
+        self.dest = dest
+        self.extra_dests = unique_dests(dest, extra_dests)
+        self.checksum = checksum
+        self.manifest_format = manifest_format
+        self.verify_from_disk = verify_from_disk
+        self.method = method
+        self.workers = workers
+        self.sync = sync
+        self.compare_hash = compare_hash
+        self.delete_extra = delete_extra
+        self.resume = resume
+        self.resumed = 0  # 再開前に済んでいたファイル数
+        self.report = CopyReport(len(tasks))
+        self.error = ""
+        self._cancel = threading.Event()
+        self._done = threading.Event()
+        threading.Thread(target=self._run, args=(list(tasks),), daemon=True).start()
+
+    @property
+    def options(self) -> dict:
+        return {
+            "method": self.method,
+            "sync": self.sync,
+            "compare_hash": self.compare_hash,
+            "delete_extra": self.delete_extra,
+            "extra_dests": self.extra_dests,
+            "checksum": self.checksum,
+            "manifest_format": self.manifest_format,
+            "verify_from_disk": self.verify_from_disk,
+        }
+
+    @property
+    def dests(self) -> list:
+        """すべての保存先（最初が dest）"""
+        return [self.dest] + self.extra_dests
+
+    def _run(self, tasks):
+        journal = CopyJournal(self.dest)
+        try:
+            verify = ()
+            digests = {}
+            keep_rels = [JOURNAL_NAME]
+            if self.resume:
+                planned, options, done, verify, digests = journal.load()
+                for key in self.options:
+                    if key in options:
+                        setattr(self, key, options[key])
+                tasks = [t for t in planned if t.rel not in done]
+                keep_rels += [t.rel for t in planned]
+                self.resumed = len(planned) - len(tasks)
+                if self.checksum:
+                    # マニフェストに全件を載せるため、済んだファイルも保存先が最新か確かめる
+                    # （記録したハッシュがあれば読み直さない）
+                    tasks = planned
+                    verify = verify | done
+                journal.reopen()
+            else:
+                os.makedirs(self.dest, exist_ok=True)
+                journal.create(tasks, self.options)
+            copy_files(
+                tasks,
+                self.workers,
+                report=self.report,
+                cancel=self._cancel,
+                sync=self.sync,
+                compare_hash=self.compare_hash,
+                delete_extra_in=self.dest if self.delete_extra else "",
+                method=self.method,
+                journal=journal,
+                verify=verify,
+                keep_rels=keep_rels + [manifest_name(self.manifest_format)],
+                dests=self.dests,
+                checksum=self.checksum,
+                manifest_format=self.manifest_format,
+                verify_from_disk=self.verify_from_disk,
+                known_digests=digests,
+            )
+            if not self.report.cancelled and not self.report.failed:
+                journal.remove()
+        except Exception as e:
+            self.report.end = time.monotonic()
+            self.error = str(e) or type(e).__name__
+        finally:
+            journal.close()
+            self._done.set()
+
+    def cancel(self):
+        """中止を要求（コピー中のファイルは最後までコピーする）"""
+        self._cancel.set()
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    @property
+    def cancelling(self) -> bool:
+        """中止を要求済みか"""
+        return self._cancel.is_set()
@@ -0,0 +1,272 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import NamedTuple
+
+from copier import file_digest
+
+# ========= デフォルト設定 =========
+DEFAULT_HASH_WORKERS = 8
+PARTIAL_BLOCK_SIZE = 64 * 1024  # 部分ハッシュで読む先頭・末尾のバイト数
+DEFAULT_HASH_CACHE_ITEMS = 500_000  # 覚えておくハッシュの件数の上限
+
+# 検出の段階（表示用）
+DUPLICATE_STAGE_LABELS = {
+    "size": "サイズで分類中",
+    "partial": "部分ハッシュを計算中",
+    "full": "全体のハッシュを計算中",
+}
+
+
+# ========= ハッシュ =========
+def partial_digest(path: str, size: int) -> bytes:
+    """先頭と末尾のブロックのハッシュ（BLAKE2b）
+
+    2ブロック以下の小さいファイルは全体を読むので、file_digest と同じ値になる。
+    """
+    with open(path, "rb") as f:
+        if size <= 2 * PARTIAL_BLOCK_SIZE:
+            return hashlib.blake2b(f.read()).digest()
+        h = hashlib.blake2b(f.read(PARTIAL_BLOCK_SIZE))
+        f.seek(size - PARTIAL_BLOCK_SIZE)
+        h.update(f.read(PARTIAL_BLOCK_SIZE))
+        return h.digest()
+
+
+def is_fully_hashed(size: int) -> bool:
+    """部分ハッシュでファイル全体を読んでいるか"""
+    return size <= 2 * PARTIAL_BLOCK_SIZE
+
+
+class HashCache:
+    """ファイルのハッシュを (種類, パス, サイズ, mtime) ごとに覚えておく
+
+    サイズか mtime が変われば別のキーになるので、変更されたファイルは読み直す。
+    件数の上限を超えたら最後に使われたのが古いものから捨てる。
+    プロセス内の全セッションで共有してよい（スレッドセーフ）。
+    """
+
+    def __init__(self, max_items: int = DEFAULT_HASH_CACHE_ITEMS):
+        self.max_items = max_items
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            digest = self._items.get(key)
+            if digest is not None:
+                self._items.move_to_end(key)
+            return digest
+
+    def put(self, key, digest: bytes):
+        with self._lock:
+            self._items[key] = digest
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def __len__(self):
+        return len(self._items)
+
+
+# ========= 重複の検出 =========
+class DuplicateSet(NamedTuple):
+    """内容が同じファイルの組"""
+
+    size: int
+    paths: list  # 絶対パス（検索結果の順）
+
+    @property
+    def wasted(self) -> int:
+        """1つを残して消せば空くバイト数"""
+        return self.size * (len(self.paths) - 1)
+
+
+class DuplicateProgress:
+    """重複検出の進捗（検出を進めるスレッドが更新し、UI が読む）"""
+
+    def __init__(self):
+        self.total = 0  # 検索結果のファイル数
+        self.candidates = 0  # サイズが同じファイルがあり、読む必要のあるファイル数
+        self.partial = 0  # 部分ハッシュを取ったファイル数
+        self.full = 0  # 全体のハッシュを取ったファイル数
+        self.cache_hits = 0  # キャッシュで済んだファイル数
+        self.bytes_read = 0
+        self.errors = 0  # 読めなかったファイル数
+        self.stage = "size"  # "size" → "partial" → "full"
+        self.stage_done = 0  # 現在の段階で済んだ件数
+        self.stage_total = 0
+        self.cancelled = False
+        self.start = time.monotonic()
+        self.end = None
+        self.lock = threading.Lock()
+
+    @property
+    def elapsed(self) -> float:
+        return (self.end or time.monotonic()) - self.start
+
+
+def _hash_one(kind: str, path: str, size: int, mtime_ns: int, cache, progress):
+    """1ファイルのハッシュ（読めなければ None）"""
+    key = (kind, path, size, mtime_ns)
+    digest = cache.get(key) if cache is not None and mtime_ns >= 0 else None
+    if digest is not None:
+        with progress.lock:
+            progress.cache_hits += 1
+            progress.stage_done += 1
+        return digest
+    try:
+        if kind == "partial":
+            digest = partial_digest(path, size)
+            read = min(size, 2 * PARTIAL_BLOCK_SIZE)
+        else:
+            digest = file_digest(path)
+            read = size
+    except OSError:
+        with progress.lock:
+            progress.errors += 1
+            progress.stage_done += 1
+        return None
+    if cache is not None and mtime_ns >= 0:
+        cache.put(key, digest)
+    with progress.lock:
+        progress.bytes_read += read
+        progress.stage_done += 1
+        if kind == "partial":
+            progress.partial += 1
+        else:
+            progress.full += 1
+    return digest
+
+
+def _refine(groups, kind: str, entries, pool, cache, progress, cancel):
+    """各組のファイルのハッシュを取り、同じハッシュの2件以上の組に分け直す
+
+    中止された場合は None を返す。
+    """
+    with progress.lock:
+        progress.stage = kind
+        progress.stage_done = 0
+        progress.stage_total = sum(len(g) for g in groups)
+    futures = {}
+    for group in groups:
+        for i in group:
+            args = (kind, entries.abs_path(i), entries.sizes[i], entries.mtimes[i])
+            futures[pool.submit(_hash_one, *args, cache, progress)] = i
+    digests = {}
+    for fut in as_completed(futures):
+        digests[futures[fut]] = fut.result()
+        if cancel is not None and cancel.is_set():
+            for f in futures:
+                f.cancel()
+            return None
+
+    refined = []
+    for group in groups:
+        by_digest = defaultdict(list)
+        for i in group:
+            if digests[i] is not None:
+                by_digest[digests[i]].append(i)
+        refined.extend(g for g in by_digest.values() if len(g) > 1)
+    return refined
+
+
+def find_duplicates(
+    entries,
+    workers: int = DEFAULT_HASH_WORKERS,
+    cache: HashCache = None,
+    progress: DuplicateProgress = None,
+    cancel: threading.Event = None,
+) -> list:
+    """検索結果（EntryTable）から内容が同じファイルの組を探す
+
+    サイズでまとめ、同じサイズのファイルがあるものだけ先頭・末尾の部分ハッシュを取り、
+    それでも同じものだけ全体のハッシュを取る（小さいファイルは部分ハッシュで確定）。
+    読むのはサイズが重なったファイルだけで、ハッシュは workers 個のスレッドで並列に取る。
+    空のファイルとサイズ不明のファイルは対象にしない。
+
+    Returns:
+        DuplicateSet のリスト（消せば空くバイト数の多い順。中止した場合は空）
+    """
+    if progress is None:
+        progress = DuplicateProgress()
+    by_size = defaultdict(list)
+    for i, size in enumerate(entries.sizes):
+        if size > 0:
+            by_size[size].append(i)
+    groups = [g for g in by_size.values() if len(g) > 1]
+    with progress.lock:
+        progress.total = len(entries)
+        progress.candidates = sum(len(g) for g in groups)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, int(workers))) as pool:
+            groups = _refine(groups, "partial", entries, pool, cache, progress, cancel)
+            if groups is None:
+                progress.cancelled = True
+                return []
+            settled = [g for g in groups if is_fully_hashed(entries.sizes[g[0]])]
+            large = [g for g in groups if not is_fully_hashed(entries.sizes[g[0]])]
+            large = _refine(large, "full", entries, pool, cache, progress, cancel)
+            if large is None:
+                progress.cancelled = True
+                return []
+    finally:
+        progress.end = time.monotonic()
+
+    sets = [
+        DuplicateSet(entries.sizes[g[0]], [entries.abs_path(i) for i in sorted(g)])
+        for g in settled + large
+    ]
+    sets.sort(key=lambda s: (-s.wasted, s.paths[0]))
+    return sets
+
+
+def one_per_set(sets, selected) -> set:
+    """重複の組ごとに1つだけ選んだ選択を返す（組の中に選択中のものがあればそれを残す）"""
+    new_selected = set(selected)
+    for dup in sets:
+        keep = next((p for p in dup.paths if p in selected), dup.paths[0])
+        new_selected.difference_update(dup.paths)
+        new_selected.add(keep)
+    return new_selected
+
+
+# ========= バックグラウンド検出 =========
+class DuplicateJob:
+    """重複の検出をバックグラウンドスレッドで実行する（中止可能）
+
+    UI は progress を読んで進捗を描画し、done になったら result を表示する。
+    """
+
+    def __init__(self, entries, workers: int = DEFAULT_HASH_WORKERS, cache: HashCache = None):
+        self.entries = entries
+        self.progress = DuplicateProgress()
+        self.result = []
+        self.error = ""
+        self._cancel = threading.Event()
+        self._done = threading.Event()
+        threading.Thread(target=self._run, args=(workers, cache), daemon=True).start()
+
+    def _run(self, workers, cache):
+        try:
+            self.result = find_duplicates(
+                self.entries, workers, cache, self.progress, self._cancel
+            )
+        except Exception as e:
+            self.error = str(e) or type(e).__name__
+        finally:
+            self._done.set()
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    @property
+    def cancelling(self) -> bool:
+        return self._cancel.is_set()
@@ -0,0 +1,200 @@
+from array import array
+
+import numpy as np
+import pandas as pd
+
+from entry_table import EntryRow, EntryTable
+from scanner import iter_dirs, normalize_exts
+
+# ========= デフォルト設定 =========
+VECTORIZE_MIN_ROWS = 50_000  # これより少ない件数は Python のループの方が速い
+STRING_DTYPE = "string[pyarrow]"  # 文字列の一致判定を pyarrow でまとめて行う
+
+# ========= 概算サイズ =========
+FRAME_ROW_BYTES = 8 + 4 + 16 + 48  # 1行分（名前への参照・フォルダ番号・サイズと mtime・小文字の名前）
+
+
+# ========= 列の判定 =========
+def as_strings(values) -> pd.Series:
+    """文字列のリストを pyarrow の文字列列にする"""
+    return pd.Series(values, dtype=STRING_DTYPE)
+
+
+def lower_strings(values) -> pd.Series:
+    """文字列を小文字にした列（str.lower と同じ結果にするため Python で変換する）"""
+    return as_strings([v.lower() for v in values])
+
+
+def ext_mask(lower: pd.Series, include_exts_norm) -> np.ndarray:
+    """小文字にしたファイル名の列のうち、拡張子（正規化済み）が一致する行（filter_names と同じ判定）
+
+    os.path.splitext と同じく、先頭のドットだけの部分（".md" など）は拡張子とみなさない。
+    """
+    mask = np.zeros(len(lower), dtype=bool)
+    for ext in include_exts_norm:
+        if "." in ext[1:]:
+            continue  # splitext の拡張子はドットを1つしか含まない
+        hit = lower.str.endswith(ext).to_numpy(dtype=bool, na_value=False)
+        rows = np.flatnonzero(hit & ~mask)
+        if not len(rows):
+            continue
+        stems = lower.iloc[rows].str.slice(stop=-len(ext)).str.lstrip(".")
+        mask[rows[stems.str.len().to_numpy(dtype=np.int64) > 0]] = True
+    return mask
+
+
+def pattern_mask(names: list, patterns) -> np.ndarray:
+    """ファイル名のうち、コンパイル済み正規表現のどれかが search でマッチする行
+
+    pyarrow の正規表現（RE2）は先読みや後方参照を扱えず、Python の re と結果も
+    異なりうるので、除外パターンは is_excluded_filename と同じく re で判定する。
+    """
+    searches = [pattern.search for pattern in patterns]
+    return np.fromiter(
+        (any(search(name) for search in searches) for name in names),
+        dtype=bool,
+        count=len(names),
+    )
+
+
+def terms_mask(lower: pd.Series, and_terms=(), or_terms=(), exclude_terms=()) -> np.ndarray:
+    """小文字にした文字列の列を AND / OR / 除外条件（小文字）で絞り込む（match_filter の演算子モード）
+
+    条件ごとに、それまでの条件に残った行だけを判定する。
+    """
+    rows = np.arange(len(lower))
+
+    def contains(rows, term):
+        column = lower if len(rows) == len(lower) else lower.iloc[rows]
+        return column.str.contains(term, regex=False).to_numpy(dtype=bool, na_value=False)
+
+    for term in and_terms:
+        rows = rows[contains(rows, term)]
+    if or_terms:
+        any_mask = np.zeros(len(rows), dtype=bool)
+        for term in or_terms:
+            any_mask |= contains(rows, term)
+        rows = rows[any_mask]
+    for term in exclude_terms:
+        rows = rows[~contains(rows, term)]
+    mask = np.zeros(len(lower), dtype=bool)
+    mask[rows] = True
+    return mask
+
+
+def take(values: list, positions) -> list:
+    """位置（numpy の配列またはブールのマスク）の要素のリスト"""
+    positions = np.asarray(positions)
+    if positions.dtype == bool:
+        positions = np.flatnonzero(positions)
+    return [values[i] for i in positions.tolist()]
+
+
+def worth_vectorizing(listings: dict) -> bool:
+    """走査結果のファイル数が、列でまとめて処理した方が速い件数か"""
+    return sum(len(lst.files) for lst in listings.values()) >= VECTORIZE_MIN_ROWS
+
+
+# ========= 並べ替え =========
+def descending_order(values) -> np.ndarray:
+    """値の大きい順に並べた位置（同じ値は元の順。値が不明（負）のものは最後）"""
+    values = np.asarray(values, dtype=np.float64)
+    return np.argsort(-values, kind="stable")
+
+
+def sort_table_rows(table: EntryTable, rows, order: str) -> np.ndarray:
+    """表の行番号を size / mtime の大きい順（entry_sort_key と同じ順）に並べる"""
+    rows = np.asarray(rows, dtype=np.int64)
+    column = table.mtimes if order == "mtime" else table.sizes
+    return rows[descending_order(np.frombuffer(column, dtype=np.int64)[rows])]
+
+
+def sort_entry_rows(rows, order: str):
+    """同じ EntryTable の行ビューを size / mtime の大きい順に並べる（別の表の行が混ざれば None）"""
+    table = rows[0].table if rows and isinstance(rows[0], EntryRow) else None
+    if table is None or not all(
+        isinstance(e, EntryRow) and e.table is table for e in rows
+    ):
+        return None
+    ordered = sort_table_rows(table, [e.index for e in rows], order)
+    return [EntryRow(table, i) for i in ordered.tolist()]
+
+
+# ========= 走査結果の列 =========
+class ListingFrame:
+    """走査結果のファイルを列（pandas）で持つ表
+
+    フォルダは iter_dirs の順、ファイルは各フォルダの一覧の順に並べるので、
+    絞り込んだ行の順序は build_table と同じになる。ファイル名は走査結果の文字列を
+    そのまま共有するリスト（names）と、拡張子の判定用に小文字にした pyarrow の文字列列
+    （frame["lower"]）の両方で持つ。除外パターンは names に対して判定する。
+    """
+
+    def __init__(self, listings: dict, exclude_dirs=()):
+        self.dirs = []
+        self.names = []
+        dir_codes = []
+        sizes = array("q")
+        mtimes = array("q")
+        for rel_dir in iter_dirs(listings, exclude_dirs):
+            listing = listings[rel_dir]
+            if not listing.files:
+                continue
+            dir_codes.append(np.full(len(listing.files), len(self.dirs), dtype=np.int32))
+            self.dirs.append(rel_dir)
+            self.names.extend(listing.files)
+            if listing.sizes is None:
+                # サイズを持たない古い走査結果
+                sizes.extend(array("q", [-1]) * len(listing.files))
+                mtimes.extend(array("q", [-1]) * len(listing.files))
+            else:
+                sizes.extend(listing.sizes)
+                mtimes.extend(listing.mtimes)
+        self.frame = pd.DataFrame(
+            {
+                "dir": np.concatenate(dir_codes) if dir_codes else np.zeros(0, np.int32),
+                "lower": lower_strings(self.names),
+                "size": np.frombuffer(sizes, dtype=np.int64),
+                "mtime": np.frombuffer(mtimes, dtype=np.int64),
+            }
+        )
+
+    def __len__(self):
+        return len(self.names)
+
+    def mask(self, include_exts=(), exclude_file_patterns=()) -> np.ndarray:
+        """拡張子と除外パターン（コンパイル済み正規表現）の条件に合う行"""
+        include_exts_norm = normalize_exts(include_exts)
+        if include_exts_norm:
+            mask = ext_mask(self.frame["lower"], include_exts_norm)
+        else:
+            mask = np.ones(len(self), dtype=bool)
+        if exclude_file_patterns:
+            rows = np.flatnonzero(mask)
+            mask[rows] = ~pattern_mask(take(self.names, rows), exclude_file_patterns)
+        return mask
+
+    def table(self, root: str, mask, dir_fields=None, file_fields=None) -> EntryTable:
+        """mask の行の EntryTable を作る（ファイルのないフォルダは含めない）"""
+        rows = np.flatnonzero(mask)
+        counts = np.bincount(self.frame["dir"].to_numpy()[rows], minlength=len(self.dirs))
+        kept = np.flatnonzero(counts)
+        dir_starts = array("I", [0])
+        dir_starts.extend(np.cumsum(counts[kept]).tolist())
+        sizes = array("q", self.frame["size"].to_numpy()[rows].tobytes())
+        mtimes = array("q", self.frame["mtime"].to_numpy()[rows].tobytes())
+        return EntryTable(
+            root,
+            [self.dirs[d] for d in kept.tolist()],
+            dir_starts,
+            take(self.names, rows),
+            dir_fields,
+            file_fields,
+            sizes,
+            mtimes,
+        )
+
+    @property
+    def nbytes(self) -> int:
+        """列の概算サイズ（ファイル名のリストは走査結果と共有しているので含めない）"""
+        return len(self.names) * FRAME_ROW_BYTES
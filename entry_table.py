@@ -0,0 +1,396 @@
+import os
+from array import array
+from bisect import bisect_right
+
+from scanner import dir_abs_path, filter_names, iter_dirs, join_rel, normalize_exts
+
+# ========= 概算サイズ =========
+DIR_BYTES = 300  # フォルダ1件分（相対パス・連結用の接頭辞・付加列）
+ROW_BYTES = 8 + 4 + 16  # エントリ1件分（ファイル名への参照・行の開始位置の一部・サイズと mtime）
+
+
+# ========= 行ビュー =========
+class EntryRow:
+    """EntryTable の1行を dict と同じ書き方で読むためのビュー
+
+    値は保持せず、e["abs_path"] などで参照されたときに表から生成する。
+    """
+
+    __slots__ = ("table", "index")
+
+    def __init__(self, table, index: int):
+        self.table = table
+        self.index = index
+
+    def __getitem__(self, key):
+        return self.table.value(self.index, key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return self.table.fields
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, EntryRow)
+            and other.table is self.table
+            and other.index == self.index
+        )
+
+    def __hash__(self):
+        return hash((id(self.table), self.index))
+
+    def __repr__(self):
+        return f"EntryRow({self.index}, {self.table.rel_path(self.index)!r})"
+
+
+# ========= エントリ表 =========
+class EntryTable:
+    """検索結果のエントリを列ごとに保持するコンパクトな表
+
+    フォルダは相対パスの表（dirs）に一度だけ持ち、各エントリはファイル名
+    （走査結果の文字列をそのまま共有）だけを持つ。エントリはフォルダごとに
+    連続して並び、フォルダ d の行は dir_starts[d] から dir_starts[d + 1] の手前まで。
+    rel_path / abs_path は必要になったときに連結する。
+    サイズと mtime（ns）は走査時に取った値を行と同じ順の配列で持つ（不明なら -1）。
+
+    付加列は、フォルダから決まる値（dir_fields: 相対フォルダパス → 値）を
+    フォルダごとに一度だけ計算し、ファイル名から決まる値（file_fields: ファイル名 → 値）は
+    参照のたびに計算する。
+    """
+
+    BASE_FIELDS = ("file_name", "rel_path", "abs_path", "size", "mtime")
+
+    def __init__(
+        self,
+        root: str,
+        dirs: list,
+        dir_starts: array,
+        names: list,
+        dir_fields: dict = None,
+        file_fields: dict = None,
+        sizes: array = None,
+        mtimes: array = None,
+    ):
+        self.root = root
+        self.dirs = dirs
+        self.dir_starts = dir_starts
+        self.names = names
+        self.sizes = sizes if sizes is not None else array("q", [-1]) * len(names)
+        self.mtimes = mtimes if mtimes is not None else array("q", [-1]) * len(names)
+        self.dir_fields = dir_fields or {}
+        self.file_fields = file_fields or {}
+        self.fields = self.BASE_FIELDS + tuple(self.dir_fields) + tuple(self.file_fields)
+        self._dir_values = {
+            key: [func(d) for d in dirs] for key, func in self.dir_fields.items()
+        }
+        self._rel_prefix = [join_rel(d, "") for d in dirs]
+        self._abs_prefix = [os.path.join(dir_abs_path(root, d), "") for d in dirs]
+        self._dir_index = None  # {相対フォルダパス: フォルダ番号}（遅延生成）
+        self._abs_dir_index = None  # {絶対パスの接頭辞: フォルダ番号}（遅延生成）
+        self._name_index = [None] * len(dirs)  # フォルダごとの {ファイル名: 行オフセット}
+        self._folder_tree = None  # フォルダ階層の索引（遅延生成）
+
+    @classmethod
+    def empty(cls, root: str = "", dir_fields=None, file_fields=None):
+        return cls(root, [], array("I", [0]), [], dir_fields, file_fields)
+
+    # ---------- 行の参照 ----------
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        return (EntryRow(self, i) for i in range(len(self.names)))
+
+    def __getitem__(self, index: int) -> EntryRow:
+        return EntryRow(self, index)
+
+    def dir_of(self, index: int) -> int:
+        """行が属するフォルダ番号"""
+        return bisect_right(self.dir_starts, index) - 1
+
+    def dir_rows(self, d: int) -> range:
+        """フォルダ d に属する行番号の範囲"""
+        return range(self.dir_starts[d], self.dir_starts[d + 1])
+
+    def file_name(self, index: int) -> str:
+        return self.names[index]
+
+    def rel_path(self, index: int) -> str:
+        return self._rel_prefix[self.dir_of(index)] + self.names[index]
+
+    def abs_path(self, index: int) -> str:
+        return self._abs_prefix[self.dir_of(index)] + self.names[index]
+
+    def size(self, index: int):
+        """ファイルサイズ（不明なら None）"""
+        size = self.sizes[index]
+        return size if size >= 0 else None
+
+    def mtime(self, index: int):
+        """更新日時（エポック秒、不明なら None）"""
+        mtime_ns = self.mtimes[index]
+        return mtime_ns / 1e9 if mtime_ns >= 0 else None
+
+    def value(self, index: int, key: str):
+        """行の列の値（存在しない列は KeyError）"""
+        if key == "file_name":
+            return self.names[index]
+        if key == "rel_path":
+            return self.rel_path(index)
+        if key == "abs_path":
+            return self.abs_path(index)
+        if key == "size":
+            return self.size(index)
+        if key == "mtime":
+            return self.mtime(index)
+        if key in self._dir_values:
+            return self._dir_values[key][self.dir_of(index)]
+        if key in self.file_fields:
+            return self.file_fields[key](self.names[index])
+        raise KeyError(key)
+
+    def iter_abs_paths(self):
+        """全行の絶対パスを表の順に返す"""
+        for d, prefix in enumerate(self._abs_prefix):
+            for i in self.dir_rows(d):
+                yield prefix + self.names[i]
+
+    # ---------- パスからの検索 ----------
+    def dir_index(self) -> dict:
+        """{相対フォルダパス: フォルダ番号}"""
+        if self._dir_index is None:
+            self._dir_index = {d: i for i, d in enumerate(self.dirs)}
+        return self._dir_index
+
+    def name_index(self, d: int) -> dict:
+        """フォルダ d の {ファイル名: フォルダ内の行オフセット}（遅延生成）"""
+        index = self._name_index[d]
+        if index is None:
+            start = self.dir_starts[d]
+            index = {
+                name: i for i, name in enumerate(self.names[start : self.dir_starts[d + 1]])
+            }
+            self._name_index[d] = index
+        return index
+
+    def find(self, abs_path: str) -> int:
+        """絶対パスの行番号を返す（なければ -1）
+
+        フォルダ → ファイル名の2段のハッシュ索引で引くので、件数によらず定数時間。
+        """
+        if self._abs_dir_index is None:
+            self._abs_dir_index = {p: i for i, p in enumerate(self._abs_prefix)}
+        name = os.path.basename(abs_path)
+        d = self._abs_dir_index.get(abs_path[: len(abs_path) - len(name)])
+        if d is None or not name:
+            return -1
+        offset = self.name_index(d).get(name)
+        return -1 if offset is None else self.dir_starts[d] + offset
+
+    def __contains__(self, abs_path) -> bool:
+        return isinstance(abs_path, str) and self.find(abs_path) >= 0
+
+    def get(self, abs_path: str):
+        """絶対パスの行ビューを返す（なければ None）"""
+        i = self.find(abs_path)
+        return EntryRow(self, i) if i >= 0 else None
+
+    def rows_for(self, abs_paths) -> list:
+        """指定した絶対パスのうち表にある行ビューを、表の順に返す"""
+        found = sorted(i for i in map(self.find, abs_paths) if i >= 0)
+        return [EntryRow(self, i) for i in found]
+
+    def total_size(self, abs_paths) -> int:
+        """指定した絶対パスのうち表にあるファイルの合計サイズ（サイズ不明のものは数えない）"""
+        sizes = self.sizes
+        return sum(max(sizes[i], 0) for i in map(self.find, abs_paths) if i >= 0)
+
+    def folder_tree(self) -> "FolderTree":
+        """フォルダ階層の索引（遅延生成）"""
+        if self._folder_tree is None:
+            self._folder_tree = FolderTree(self)
+        return self._folder_tree
+
+    # ---------- 差分反映 ----------
+    def splice(self, listings: dict, changed_dirs, new_table, exclude_dirs=()):
+        """再列挙したフォルダの行を new_table の行に差し替えた新しい表を返す
+
+        変化のないフォルダの行はそのまま再利用し、全体の順序は
+        フル走査と同じ（os.walk 順）になる。フォルダ内の検索索引も
+        フォルダ単位で引き継ぐので、作り直すのは変化したフォルダの分だけ。
+        """
+        changed_dirs = set(changed_dirs)
+        old_index = self.dir_index()
+        new_index = new_table.dir_index()
+        dirs = []
+        dir_starts = array("I", [0])
+        names = []
+        sizes = array("q")
+        mtimes = array("q")
+        name_index = []
+        for rel_dir in iter_dirs(listings, exclude_dirs):
+            src, index = (
+                (new_table, new_index) if rel_dir in changed_dirs else (self, old_index)
+            )
+            d = index.get(rel_dir)
+            if d is None:
+                continue
+            start, end = src.dir_starts[d], src.dir_starts[d + 1]
+            names.extend(src.names[start:end])
+            sizes.extend(src.sizes[start:end])
+            mtimes.extend(src.mtimes[start:end])
+            dirs.append(rel_dir)
+            dir_starts.append(len(names))
+            name_index.append(src._name_index[d])
+        table = EntryTable(
+            self.root,
+            dirs,
+            dir_starts,
+            names,
+            self.dir_fields,
+            self.file_fields,
+            sizes,
+            mtimes,
+        )
+        table._name_index = name_index
+        return table
+
+    # ---------- 状態 ----------
+    @property
+    def nbytes(self) -> int:
+        """表の概算サイズ（ファイル名の文字列は走査結果と共有しているので含めない）"""
+        return len(self.dirs) * DIR_BYTES + len(self.names) * ROW_BYTES
+
+
+# ========= フォルダ索引 =========
+class FolderTree:
+    """EntryTable のフォルダ階層の索引
+
+    フォルダは "/" 区切りの相対パス（ルートは ""）で表し、ファイルを持たない
+    途中の階層も含む。ツリー表示で開いたフォルダの中身だけを組み立てたり、
+    閉じたフォルダの配下をまとめて選択したりするのに使う。
+    """
+
+    def __init__(self, table: EntryTable):
+        self.table = table
+        self.subfolders = {"": []}  # {フォルダ: 直下のフォルダ（名前順）}
+        self.file_counts = {"": 0}  # {フォルダ: 配下のファイル数（サブフォルダを含む）}
+        self._dir = {}  # {フォルダ: 表のフォルダ番号}（ファイルのあるフォルダだけ）
+        self._folder = []  # 表のフォルダ番号 → フォルダ
+        for d, rel_dir in enumerate(table.dirs):
+            folder = rel_dir.replace("\\", "/")
+            count = table.dir_starts[d + 1] - table.dir_starts[d]
+            self._dir[folder] = d
+            self._folder.append(folder)
+            self.file_counts[""] += count
+            parent = ""
+            for path in self.ancestors(folder):
+                if path not in self.subfolders:
+                    self.subfolders[path] = []
+                    self.subfolders[parent].append(path)
+                    self.file_counts[path] = 0
+                self.file_counts[path] += count
+                parent = path
+        for children in self.subfolders.values():
+            children.sort()
+
+    @staticmethod
+    def ancestors(folder: str):
+        """フォルダ自身とその上の階層を、ルート（""）を除いて上から順に返す"""
+        if not folder:
+            return
+        end = folder.find("/")
+        while end >= 0:
+            yield folder[:end]
+            end = folder.find("/", end + 1)
+        yield folder
+
+    @staticmethod
+    def name(folder: str) -> str:
+        return folder.rsplit("/", 1)[-1]
+
+    def file_rows(self, folder: str) -> range:
+        """フォルダ直下のファイルの行番号"""
+        d = self._dir.get(folder)
+        return self.table.dir_rows(d) if d is not None else range(0)
+
+    def rows_under(self, folder: str):
+        """フォルダ配下（サブフォルダを含む）のファイルの行番号"""
+        stack = [folder]
+        while stack:
+            current = stack.pop()
+            yield from self.file_rows(current)
+            stack.extend(self.subfolders.get(current, ()))
+
+    def selected_counts(self, abs_paths) -> dict:
+        """{フォルダ: 配下で選択されているファイル数}（選択のあるフォルダだけ）"""
+        counts = {}
+        table = self.table
+        for i in map(table.find, abs_paths):
+            if i < 0:
+                continue
+            for path in self.ancestors(self._folder[table.dir_of(i)]):
+                counts[path] = counts.get(path, 0) + 1
+        return counts
+
+
+# ========= 表の生成 =========
+def build_table(
+    root: str,
+    listings: dict,
+    exclude_dirs=(),
+    include_exts=(),
+    exclude_file_patterns=(),
+    rel_dirs=None,
+    dir_fields: dict = None,
+    file_fields: dict = None,
+) -> EntryTable:
+    """走査結果から条件に合うファイルの EntryTable を作る（順序・条件は iter_entries と同じ）
+
+    Args:
+        exclude_file_patterns: コンパイル済み正規表現のリスト（search でマッチしたら除外）
+        rel_dirs: 指定した場合はそのフォルダ直下だけを対象にする（再帰しない）
+    """
+    include_exts_norm = normalize_exts(include_exts)
+    if rel_dirs is None:
+        rel_dirs = iter_dirs(listings, exclude_dirs)
+
+    dirs = []
+    dir_starts = array("I", [0])
+    names = []
+    sizes = array("q")
+    mtimes = array("q")
+    for rel_dir in rel_dirs:
+        listing = listings.get(rel_dir)
+        if listing is None:
+            continue
+        matched = filter_names(listing.files, include_exts_norm, exclude_file_patterns)
+        if not matched:
+            continue
+        names.extend(matched)
+        if listing.sizes is None:
+            # サイズを持たない古い走査結果
+            sizes.extend(array("q", [-1]) * len(matched))
+            mtimes.extend(array("q", [-1]) * len(matched))
+        elif len(matched) == len(listing.files):
+            sizes.extend(listing.sizes)
+            mtimes.extend(listing.mtimes)
+        else:
+            # matched は files の部分列なので、先頭から突き合わせれば位置が分かる
+            it = iter(zip(listing.files, listing.sizes, listing.mtimes))
+            for name in matched:
+                for file_name, size, mtime_ns in it:
+                    if file_name == name:
+                        sizes.append(size)
+                        mtimes.append(mtime_ns)
+                        break
+        dirs.append(rel_dir)
+        dir_starts.append(len(names))
+    return EntryTable(
+        root, dirs, dir_starts, names, dir_fields, file_fields, sizes, mtimes
+    )
@@ -0,0 +1,191 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import threading
+import time
+
+from scanner import dir_abs_path
+
+# inotify は Linux のみ（他の環境ではライブ更新を無効にする）
+try:
+    _libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    _libc.inotify_init1.argtypes = [ctypes.c_int]
+    _libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    _libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    HAS_INOTIFY = True
+except (OSError, AttributeError):
+    HAS_INOTIFY = False
+
+# ========= inotify 定数 =========
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (
+    IN_CREATE
+    | IN_DELETE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+    | IN_ONLYDIR
+    | IN_DONT_FOLLOW
+)
+EVENT_HEADER = struct.Struct("iIII")
+
+# ========= デフォルト設定 =========
+DEFAULT_SETTLE_SEC = 0.5  # 最後のイベントからこの時間静かになったら反映
+DEFAULT_MAX_DELAY_SEC = 5.0  # イベントが続いても最初のイベントからこの時間で反映
+
+
+class LiveWatcher:
+    """inotify で走査済みフォルダを監視し、変更のあったフォルダを集約する
+
+    イベントはフォルダ単位にまとめ、一定時間静かになるまで（最大 max_delay 秒）
+    ため込んでから take_dirty() で一括して返す。大量のファイル展開でも
+    反映は数回にまとまる。
+    """
+
+    def __init__(
+        self,
+        root: str,
+        listings: dict,
+        settle: float = DEFAULT_SETTLE_SEC,
+        max_delay: float = DEFAULT_MAX_DELAY_SEC,
+    ):
+        if not HAS_INOTIFY:
+            raise OSError(errno.ENOSYS, "inotify はこの環境では利用できません")
+        fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+        self.root = root
+        self.settle = settle
+        self.max_delay = max_delay
+        self.error = None
+        self._fd = fd
+        self._lock = threading.Lock()
+        self._wd_to_dir = {}
+        self._dir_to_wd = {}
+        self._dirty = set()
+        self._first_event = 0.0
+        self._last_event = 0.0
+        self._synced = None
+        self._stop = threading.Event()
+
+        self.sync(listings)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    # ---------- 監視対象の管理 ----------
+    def sync(self, listings: dict):
+        """監視対象を走査結果のフォルダに合わせる（追加・削除）"""
+        if listings is self._synced:
+            return
+        with self._lock:
+            for rel_dir in set(self._dir_to_wd) - set(listings):
+                wd = self._dir_to_wd.pop(rel_dir)
+                self._wd_to_dir.pop(wd, None)
+                _libc.inotify_rm_watch(self._fd, wd)
+            for rel_dir in listings:
+                if rel_dir in self._dir_to_wd:
+                    continue
+                path = os.fsencode(dir_abs_path(self.root, rel_dir))
+                wd = _libc.inotify_add_watch(self._fd, path, WATCH_MASK)
+                if wd < 0:
+                    err = ctypes.get_errno()
+                    if err == errno.ENOSPC:
+                        # 監視数の上限（fs.inotify.max_user_watches）に達した
+                        self.error = OSError(err, os.strerror(err))
+                        break
+                    continue
+                self._wd_to_dir[wd] = rel_dir
+                self._dir_to_wd[rel_dir] = wd
+        self._synced = listings
+
+    def stop(self):
+        """監視を停止"""
+        self._stop.set()
+        self._thread.join(timeout=2)
+        try:
+            os.close(self._fd)
+        except OSError:
+            pass
+
+    @property
+    def alive(self) -> bool:
+        return self._thread.is_alive()
+
+    # ---------- 変更の取得 ----------
+    def take_dirty(self) -> set:
+        """反映すべき変更フォルダをまとめて取り出す（まだため込み中なら空）"""
+        with self._lock:
+            if not self._dirty:
+                return set()
+            now = time.monotonic()
+            if (
+                now - self._last_event < self.settle
+                and now - self._first_event < self.max_delay
+            ):
+                return set()
+            dirty = self._dirty
+            self._dirty = set()
+            return dirty
+
+    # ---------- 監視スレッド ----------
+    def _mark(self, rel_dir: str):
+        now = time.monotonic()
+        if not self._dirty:
+            self._first_event = now
+        self._last_event = now
+        self._dirty.add(rel_dir)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                ready, _, _ = select.select([self._fd], [], [], 0.5)
+                if not ready:
+                    continue
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                continue
+            except (OSError, ValueError) as e:
+                if not self._stop.is_set():
+                    self.error = e
+                return
+
+            with self._lock:
+                offset = 0
+                while offset + EVENT_HEADER.size <= len(data):
+                    wd, mask, _cookie, name_len = EVENT_HEADER.unpack_from(data, offset)
+                    offset += EVENT_HEADER.size + name_len
+
+                    if mask & IN_Q_OVERFLOW:
+                        # イベントがあふれた場合は全フォルダを再列挙
+                        self._mark("")
+                        self._dirty.update(self._dir_to_wd)
+                        continue
+                    rel_dir = self._wd_to_dir.get(wd)
+                    if rel_dir is None:
+                        continue
+                    if mask & IN_IGNORED:
+                        self._wd_to_dir.pop(wd, None)
+                        self._dir_to_wd.pop(rel_dir, None)
+                        continue
+                    if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                        # フォルダ自身が消えた場合は親フォルダを再列挙
+                        rel_dir = os.path.dirname(rel_dir)
+                    self._mark(rel_dir)
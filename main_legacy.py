@@ -1,11 +1,64 @@
+import functools
 import os
 import re
 import json
-import shutil
+import sqlite3
 import time
 import streamlit as st
 from pathlib import Path
 from streamlit_tree_select import tree_select
+from scanner import (
+    DEFAULT_SCAN_WORKERS,
+    ScanJob,
+    ScanLimits,
+    ScanProgress,
+    estimate_tree,
+    revalidate_tree,
+    update_tree,
+)
+from archiver import (
+    ARCHIVE_FORMATS,
+    ARCHIVE_METHOD_LABELS,
+    DEFAULT_STORE_EXTS,
+    ArchiveJob,
+)
+from copier import (
+    COPY_METHOD_LABELS,
+    COPY_METHODS,
+    DEFAULT_COPY_WORKERS,
+    MANIFEST_FORMATS,
+    CopyJob,
+    CopyJournal,
+    format_size,
+    free_space,
+    make_tasks,
+)
+from duplicates import (
+    DEFAULT_HASH_WORKERS,
+    DUPLICATE_STAGE_LABELS,
+    DuplicateJob,
+    HashCache,
+    one_per_set,
+)
+from entry_frame import (
+    VECTORIZE_MIN_ROWS,
+    ListingFrame,
+    descending_order,
+    lower_strings,
+    sort_entry_rows,
+    take,
+    terms_mask,
+    worth_vectorizing,
+)
+from entry_table import build_table
+from fs_watcher import HAS_INOTIFY, LiveWatcher
+from scan_index import (
+    DEFAULT_INDEX_MAX_MB,
+    DEFAULT_INDEX_PATH,
+    IndexRevalidation,
+    ScanIndex,
+)
+from scan_store import NODE_BYTES, ScanStore, entries_size
 
 # ========= 設定ファイルパス =========
 CONFIG_PATH = Path("filecollect_config.json")
@@ -23,6 +76,8 @@ DEFAULT_EXCLUDE_DIRS = [
 
 ]
 DEFAULT_INCLUDE_EXTS = [".docx", ".xlsx", ".xls", ".pptx", ".pdf", ".txt", ".md"]
+SAVE_MODES = {"copy": "フォルダにコピー", "archive": "アーカイブ（ZIP / tar）"}
+SORT_ORDERS = {"name": "名前順", "mtime": "更新日時が新しい順", "size": "サイズが大きい順"}
 DEFAULT_EXCLUDE_FILE_PATTERNS = [
     r"^~.*", 
     r".*コピー.*", 
@@ -32,6 +87,8 @@ VERSION_REGEX = re.compile(r"\d+[_\.]\d+(?:[_\.]\d+)*")
 DATE_REGEX = re.compile(r"_(\d{8})(?=\.|$)")
 DEFAULT_PAGE_SIZE = 50
 MAX_HISTORY = 10
+PROGRESS_INTERVAL_SEC = 0.25  # 検索中の進捗表示の更新間隔
+PROGRESS_MAX_ROWS = 1000  # 検索中に表示するグループ数の上限
 # fmt: on
 
 
@@ -70,18 +127,62 @@ def init_state():
         "selected_group": {},
         "selected_abs_paths": set(),  # パスベースの選択状態（タブ間共有）
         "_need_sync_to_group": False,  # ツリービューからグループビューへの同期フラグ
+        "_synced_abs_paths": None,  # 最後にグループ選択へ同期したパス選択（None なら全体を同期）
         "_tree_key_version": 0,  # ツリーコンポーネントのバージョン（外部同期時にインクリメント）
+        "tree_expanded": [],  # ツリービューで開いているフォルダ
+        "_tree_cache_key": None,  # 直前に描画したツリーの共有ストアのキー
+        "_tree_view": None,  # 前回描画した遅延ツリー（操作結果の解釈用）
+        "_tree_result": None,  # 処理済みの遅延ツリーの操作結果
         "_group_ui_version": 0,  # グループビューのUIコンポーネントのバージョン（外部同期時にインクリメント）
         "_pending_toasts": [],  # 保留中のトーストメッセージ（rerun後に表示）
+        "_copy_job": None,  # 実行中のコピー
+        "_copy_summary": None,  # 直近に終わったコピー（結果表示用）
+        "_app_running": False,  # アプリ全体を実行中か（フラグメントだけの再実行中は False）
+        "_dup_job": None,  # 実行中の重複検出
+        "_duplicates": None,  # 直近に終わった重複検出（結果表示用）
         "page": 1,
         "page_size": DEFAULT_PAGE_SIZE,
         "filter_text": "",
         "filter_use_regex": False,
+        "_group_filter": None,  # 直近のフィルタ結果（(キー, グループ, グループキーのリスト)）
+        "_group_names_lower": None,  # 小文字にしたグループキーの列（(グループ, 列)）
         "search_path": DEFAULT_SEARCH_PATH,
         "dest_path": "",
         "exclude_dirs": DEFAULT_EXCLUDE_DIRS.copy(),
         "include_exts": DEFAULT_INCLUDE_EXTS.copy(),
         "exclude_file_patterns": DEFAULT_EXCLUDE_FILE_PATTERNS.copy(),
+        "scan_workers": DEFAULT_SCAN_WORKERS,
+        "copy_workers": DEFAULT_COPY_WORKERS,
+        "copy_method": "auto",
+        "save_mode": "copy",
+        "archive_format": "zip",
+        "archive_name": "files",
+        "archive_store_exts": DEFAULT_STORE_EXTS.copy(),  # ZIP で無圧縮で格納する拡張子
+        "copy_sync": False,  # 差分コピー（保存先が最新のファイルはコピーしない）
+        "copy_compare_hash": False,
+        "copy_delete_extra": False,
+        "extra_dests": [],  # 保存先と同時にコピーする追加の保存先
+        "copy_checksum": False,  # チェックサムで確かめてマニフェストを書く
+        "copy_verify_disk": False,  # チェックサムで、保存先を読み直して照合する
+        "manifest_format": "csv",
+        "sort_order": "name",  # ファイル・グループの並び順（SORT_ORDERS のキー）
+        "tree_lazy": True,  # ツリーは開いたフォルダの中身だけを組み立てる
+        "index_path": DEFAULT_INDEX_PATH,
+        "index_max_mb": DEFAULT_INDEX_MAX_MB,
+        "incremental_scan": True,
+        "live_mode": False,
+        "scan_max_files": 0,  # 0 = 無制限
+        "scan_max_depth": 0,
+        "scan_timeout": 0,  # 秒
+        "scan_listings": None,  # 直近の走査結果（除外フォルダも含むフォルダ一覧と mtime）
+        "_last_scan_note": "",  # 直近の検索方法（完了メッセージ用）
+        "_scan_partial": "",  # 途中で打ち切った理由（完走した場合は空）
+        "_scan_job": None,  # 実行中のフル走査
+        "_scan_job_params": None,  # 実行中のフル走査の検索条件
+        "_scan_params": None,  # 直近の検索条件 (root, exclude_dirs, include_exts, exclude_file_patterns)
+        "_scan_generation": None,  # scan_listings の世代番号（共有ストアのキー）
+        "_revalidation": None,  # インデックスのバックグラウンド再検証
+        "_watcher": None,  # ライブ更新の監視スレッド
         "search_history": [],
         "dest_history": [],
         "_config_just_loaded": False,
@@ -101,49 +202,94 @@ def init_state():
 
 
 init_state()
+st.session_state._app_running = True
 
-# ツリービューからの同期要求を処理（ウィジェット描画前に実行）
-if st.session_state.get("_need_sync_to_group"):
+
+# ========= 選択状態同期ヘルパー（早期に必要なため上部に配置） =========
+def get_entry_by_abs_path(abs_path):
+    """パスからエントリ（EntryTable の行ビュー）を取得（ハッシュ索引で定数時間）"""
+    entries = st.session_state.entries
+    return entries.get(abs_path) if entries else None
+
+
+def apply_group_selection(group_key, selected: set):
+    """グループ内で選択中のパスからグループ選択を作り直す"""
+    members = [
+        e for e in st.session_state.groups.get(group_key, ()) if e["abs_path"] in selected
+    ]
+    st.session_state.selected_group[group_key] = bool(members)
+    for e in members[:1]:
+        ver = e["version"]
+        st.session_state.selected_version[group_key] = ver
+        if group_key not in st.session_state.selected_subversion:
+            st.session_state.selected_subversion[group_key] = {}
+        st.session_state.selected_subversion[group_key][ver] = e["subversion"]
+
+
+def sync_paths_to_group():
+    """パス選択 → グループ選択に同期
+
+    前回同期したパス選択との差分に含まれるグループだけを作り直す
+    （前回の同期がなければ全グループを作り直す）。
+
+    Returns:
+        選択状態を作り直したグループキーの集合
+    """
+    selected = st.session_state.selected_abs_paths
+    synced = st.session_state._synced_abs_paths
+    if synced is None:
+        changed = {fn for fn, sel in st.session_state.selected_group.items() if sel}
+        paths = selected
+    else:
+        changed = set()
+        paths = selected ^ synced
+
+    for abs_path in paths:
+        entry = get_entry_by_abs_path(abs_path)
+        if entry:
+            # グループキーを使用（base_nameではなくrel_pathから生成）
+            changed.add(get_group_key(entry["rel_path"]))
+    for group_key in changed:
+        apply_group_selection(group_key, selected)
+
+    st.session_state._synced_abs_paths = set(selected)
+    if synced is None:
+        return set(st.session_state.selected_group)
+    return changed
+
+
+def apply_pending_group_sync():
+    """ツリービューからの同期要求を処理（グループビューのウィジェット描画前に呼ぶ）"""
+    if not st.session_state.get("_need_sync_to_group"):
+        return
     st.session_state._need_sync_to_group = False
-    # 選択状態をリセットし、selected_abs_pathsから再構築
-    for fn in st.session_state.selected_group:
-        st.session_state.selected_group[fn] = False
-    for abs_path in st.session_state.selected_abs_paths:
-        for e in st.session_state.entries:
-            if e["abs_path"] == abs_path:
-                group_key = get_group_key(e["rel_path"])
-                ver = e["version"]
-                subver = e["subversion"]
-                st.session_state.selected_group[group_key] = True
-                st.session_state.selected_version[group_key] = ver
-                if group_key not in st.session_state.selected_subversion:
-                    st.session_state.selected_subversion[group_key] = {}
-                st.session_state.selected_subversion[group_key][ver] = subver
-                break
+    changed_groups = sync_paths_to_group()
 
     # ウィジェットキーも同期（ウィジェット描画前なので安全）
-    for fn in st.session_state.selected_group:
-        st.session_state[f"sel_{fn}"] = st.session_state.selected_group[fn]
+    for fn in changed_groups:
+        st.session_state[f"sel_{fn}"] = st.session_state.selected_group.get(fn, False)
 
     # グループビューのセレクトボックスを再初期化（外部から同期されたため）
     st.session_state._group_ui_version += 1
 
-# 保留中のトーストを表示（rerun後に実行される）
-if st.session_state._pending_toasts:
-    for msg in st.session_state._pending_toasts:
-        st.toast(msg)
-    st.session_state._pending_toasts = []
 
+def show_pending_toasts():
+    """保留中のトーストを表示（rerun後に実行される）"""
+    if st.session_state._pending_toasts:
+        for msg in st.session_state._pending_toasts:
+            st.toast(msg)
+        st.session_state._pending_toasts = []
+
+
+def rerun_results():
+    """メインエリアのフラグメントを再実行（アプリ全体の実行中なら全体を再実行）"""
+    st.rerun(scope="app" if st.session_state._app_running else "fragment")
 
-# ========= 選択状態同期ヘルパー =========
-def get_entry_by_abs_path(abs_path):
-    """パスからエントリを取得"""
-    for e in st.session_state.entries:
-        if e["abs_path"] == abs_path:
-            return e
-    return None
 
+show_pending_toasts()
 
+
+# ========= 選択状態同期ヘルパー =========
 def sync_group_to_paths():
     """グループ選択 → パス選択に同期"""
     new_paths = set()
@@ -162,30 +308,10 @@ def sync_group_to_paths():
         if entry:
             new_paths.add(entry["abs_path"])
     st.session_state.selected_abs_paths = new_paths
+    st.session_state._synced_abs_paths = set(new_paths)  # グループ選択と一致している
     st.session_state._tree_key_version += 1  # ツリーコンポーネントを再作成
 
 
-def sync_paths_to_group():
-    """パス選択 → グループ選択に同期"""
-    # 現在のグループ選択をクリア
-    for fn in st.session_state.selected_group:
-        st.session_state.selected_group[fn] = False
-
-    # パスからグループ選択を再構築
-    for abs_path in st.session_state.selected_abs_paths:
-        entry = get_entry_by_abs_path(abs_path)
-        if entry:
-            # グループキーを使用（base_nameではなくrel_pathから生成）
-            group_key = get_group_key(entry["rel_path"])
-            ver = entry["version"]
-            subver = entry["subversion"]
-            st.session_state.selected_group[group_key] = True
-            st.session_state.selected_version[group_key] = ver
-            if group_key not in st.session_state.selected_subversion:
-                st.session_state.selected_subversion[group_key] = {}
-            st.session_state.selected_subversion[group_key][ver] = subver
-
-
 def resolve_version_conflict(new_selected: set, old_selected: set) -> tuple:
     """
     同じグループの複数バージョン選択を解決
@@ -194,85 +320,310 @@ def resolve_version_conflict(new_selected: set, old_selected: set) -> tuple:
     Returns:
         (resolved_set, removed_groups): 解決後のセット, 除外されたグループ名のリスト
     """
-    added = new_selected - old_selected
-
-    # 追加されたパスのグループキーを取得
-    added_groups = {}
-    for abs_path in added:
-        entry = get_entry_by_abs_path(abs_path)
-        if entry:
-            group_key = get_group_key(entry["rel_path"])
-            added_groups[group_key] = abs_path
-
-    # 結果セットと除外グループリストを作成
-    result = set()
+    result = set(new_selected)
     removed_group_names = []
+    resolved_groups = set()
 
-    for abs_path in new_selected:
+    # 追加されたパスのグループだけを調べる（グループ内で1つだけ残す）
+    for abs_path in new_selected - old_selected:
         entry = get_entry_by_abs_path(abs_path)
-        if entry:
-            group_key = get_group_key(entry["rel_path"])
-            if group_key in added_groups:
-                if abs_path == added_groups[group_key]:
-                    result.add(abs_path)
-                else:
-                    # 同じグループの古いパスを除外
-                    if group_key not in removed_group_names:
-                        removed_group_names.append(group_key)
-            else:
-                result.add(abs_path)
-        else:
-            result.add(abs_path)
+        if not entry:
+            continue
+        group_key = get_group_key(entry["rel_path"])
+        if group_key in resolved_groups:
+            continue  # 同じグループで先に追加されたパスの処理で除外済み
+        resolved_groups.add(group_key)
+        for e in st.session_state.groups.get(group_key, ()):
+            other = e["abs_path"]
+            if other != abs_path and other in result:
+                # 同じグループの古いパスを除外
+                result.discard(other)
+                if group_key not in removed_group_names:
+                    removed_group_names.append(group_key)
 
     return result, removed_group_names
 
 
+# ========= 表示ヘルパー =========
+def format_mtime(mtime) -> str:
+    """更新日時を表示用の文字列にする（不明なら空）"""
+    if mtime is None:
+        return ""
+    return time.strftime("%Y-%m-%d %H:%M", time.localtime(mtime))
+
+
+def file_label(name: str, size, mtime) -> str:
+    """ファイル名にサイズと更新日時を添えた表示名"""
+    details = [format_size(size) if size is not None else "", format_mtime(mtime)]
+    details = [s for s in details if s]
+    return f"{name}（{' / '.join(details)}）" if details else name
+
+
+def entry_sort_key(order: str):
+    """size / mtime を持つエントリを並び順（SORT_ORDERS の name 以外）で並べるキー関数
+
+    大きい順・新しい順で、値が不明なものは最後にする。
+    """
+    field = "mtime" if order == "mtime" else "size"
+    return lambda e: -(e[field] if e[field] is not None else -1)
+
+
+def sort_rows(rows, order: str) -> list:
+    """エントリを並び順で並べる（名前順はパス順）"""
+    if order in ("mtime", "size"):
+        # 件数が多いときは表のサイズ・mtime の列を numpy で並べる
+        if len(rows) >= VECTORIZE_MIN_ROWS:
+            ordered = sort_entry_rows(rows, order)
+            if ordered is not None:
+                return ordered
+        return sorted(rows, key=entry_sort_key(order))
+    return sorted(rows, key=lambda e: e["abs_path"])
+
+
+def render_file_table(rows):
+    """ファイルをパス・サイズ・更新日時の表で表示（並び順に従う）"""
+    st.dataframe(
+        [
+            {
+                "パス": e["abs_path"],
+                "サイズ": format_size(e["size"]) if e["size"] is not None else "",
+                "更新日時": format_mtime(e["mtime"]),
+            }
+            for e in sort_rows(rows, st.session_state.sort_order)
+        ],
+        use_container_width=True,
+        hide_index=True,
+    )
+
+
+def space_dests() -> list:
+    """空き容量を確かめる保存先（未指定なら空。コピーでは追加の保存先も含む）"""
+    if not st.session_state.dest_path:
+        return []
+    dests = [st.session_state.dest_path]
+    if st.session_state.save_mode == "copy":
+        dests += st.session_state.extra_dests
+    return dests
+
+
+def short_dests(need: int, dests) -> list:
+    """空き容量が need に足りない保存先を (保存先, 空き容量) のリストで返す"""
+    short = []
+    for dest in dests:
+        free = free_space(dest)
+        if free is not None and free < need:
+            short.append((dest, free))
+    return short
+
+
+def render_save_target(slot, selected: set, need: int):
+    """保存対象の件数・合計サイズと、空き容量が足りない保存先を slot に描画
+
+    選択はメインエリアのフラグメントの中で変わるので、サイドバーに置いた slot へ
+    フラグメントから描き直す。
+    """
+    with slot.container():
+        if not selected:
+            return
+        st.caption(f"保存対象: {len(selected):,} 件 / {format_size(need)}")
+        for dest, free in short_dests(need, space_dests()):
+            st.warning(f"{dest} の空き容量（{format_size(free)}）が足りません。")
+
+
+def current_group_entry(fn):
+    """グループで選択中のバージョン・サブバージョンのエントリ（なければ None）"""
+    ver = st.session_state.selected_version.get(fn, "-")
+    subver_dict = st.session_state.selected_subversion.get(fn, {})
+    subver = subver_dict.get(ver, "-") if isinstance(subver_dict, dict) else "-"
+    return st.session_state.ver_subver_to_entry_map.get(fn, {}).get(ver, {}).get(subver)
+
+
 # ========= ツリー構造生成（streamlit-tree-select用） =========
-def build_tree_nodes(entries):
-    """streamlit-tree-select用のノードリストを構築"""
-    # 中間構造を構築
-    tree = {}
-    for entry in entries:
-        parts = entry["rel_path"].replace("\\", "/").split("/")
-        current = tree
-        for i, part in enumerate(parts[:-1]):
-            if part not in current:
-                current[part] = {"_children": {}, "_is_folder": True}
-            current = current[part]["_children"]
-        # ファイルノード
-        filename = parts[-1]
-        current[filename] = {
-            "_is_file": True,
-            "_abs_path": entry["abs_path"],
+def build_file_nodes(entries, d: int, sort_order: str = "name") -> list:
+    """フォルダ d 直下のファイルのノード（名前順で、sort_order が name 以外ならその順）"""
+    rows = sorted(entries.dir_rows(d), key=entries.file_name)
+    if sort_order in ("mtime", "size"):
+        by_entry = entry_sort_key(sort_order)
+        rows.sort(key=lambda i: by_entry(entries[i]))
+    return [
+        {
+            "label": file_label(entries.file_name(i), entries.size(i), entries.mtime(i)),
+            "value": entries.abs_path(i),  # ファイルは絶対パス
         }
+        for i in rows
+    ]
+
 
-    def convert_to_nodes(tree_dict, prefix=""):
-        """dictをstreamlit-tree-select形式のノードリストに変換"""
+def build_tree_nodes(entries, sort_order: str = "name", file_nodes: dict = None):
+    """streamlit-tree-select用のノードリストを構築（EntryTable をフォルダ単位でたどる）
+
+    ファイルはサイズと更新日時を添えて表示し、フォルダ内で sort_order の順に並べる。
+    file_nodes（{相対フォルダパス: ファイルのノード}）にあるフォルダはそのノードを使い、
+    新しく作ったフォルダの分は file_nodes に追加する。
+    """
+    if file_nodes is None:
+        file_nodes = {}
+    tree = {"_children": {}, "_files": []}
+    for d, rel_dir in enumerate(entries.dirs):
+        current = tree
+        if rel_dir:
+            for part in rel_dir.replace("\\", "/").split("/"):
+                current = current["_children"].setdefault(
+                    part, {"_children": {}, "_files": []}
+                )
+        nodes = file_nodes.get(rel_dir)
+        if nodes is None:
+            nodes = file_nodes[rel_dir] = build_file_nodes(entries, d, sort_order)
+        current["_files"] = nodes
+
+    def convert_to_nodes(folder, prefix=""):
+        """フォルダを streamlit-tree-select 形式のノードリストに変換（フォルダが先）"""
         nodes = []
-        # フォルダを先に、ファイルを後に
-        folders = sorted([k for k, v in tree_dict.items() if v.get("_is_folder")])
-        files = sorted([k for k, v in tree_dict.items() if v.get("_is_file")])
-
-        for folder_name in folders:
-            folder_data = tree_dict[folder_name]
-            folder_path = f"{prefix}/{folder_name}" if prefix else folder_name
-            children = convert_to_nodes(folder_data["_children"], folder_path)
+        for name in sorted(folder["_children"]):
+            folder_path = f"{prefix}/{name}" if prefix else name
             nodes.append({
-                "label": folder_name,
+                "label": name,
                 "value": f"folder:{folder_path}",  # フォルダにはprefixを付ける
-                "children": children,
+                "children": convert_to_nodes(folder["_children"][name], folder_path),
             })
+        nodes.extend(folder["_files"])
+        return nodes
+
+    return convert_to_nodes(tree)
+
+
+def cached_tree_nodes(sort_order: str) -> list:
+    """現在の検索結果のツリーのノードを共有ストアから取得（なければ作成して登録）
+
+    走査結果の世代番号・検索条件・並び順をキーにするので、チェックや開閉による
+    再実行では作り直さない。走査結果が変わったときは、直前のツリーのうち
+    ファイル一覧が同じフォルダのノードをそのまま使い、変化したフォルダの分だけ作る。
+    """
+    entries = st.session_state.entries
+    store = get_scan_store()
+    key = shared_key("tree", st.session_state._scan_params) + (sort_order,)
+    prev_key = st.session_state._tree_cache_key
+    st.session_state._tree_cache_key = key
+    cached = store.get(key)
+    if cached is not None and cached[0] is entries:
+        return cached[1]
+
+    # 同じ検索条件・並び順の直前のツリーから、ファイル一覧が変わっていないフォルダを引き継ぐ
+    listings = st.session_state.scan_listings or {}
+    prev = store.get(prev_key) if prev_key and prev_key[2:] == key[2:] else None
+    file_nodes = {}
+    if prev is not None:
+        for rel_dir, (files, nodes) in prev[2].items():
+            listing = listings.get(rel_dir)
+            if listing is not None and listing.files is files:
+                file_nodes[rel_dir] = nodes
+    nodes = build_tree_nodes(entries, sort_order, file_nodes)
+    dir_nodes = {
+        rel_dir: (listings[rel_dir].files if rel_dir in listings else None, n)
+        for rel_dir, n in file_nodes.items()
+    }
+    store.put(key, (entries, nodes, dir_nodes), len(entries) * NODE_BYTES)
+    return nodes
+
+
+def build_lazy_tree_nodes(entries, sort_order: str, expanded, selected: set):
+    """開いているフォルダの中身だけを組み立てたノードリストを構築（大きなツリー用）
+
+    閉じているフォルダは子を空のリストにして送り、配下のファイル数（選択があれば選択数も）を
+    ラベルに添える。閉じているフォルダのチェックは配下がすべて選択されているときだけ付ける。
 
-        for file_name in files:
-            file_data = tree_dict[file_name]
+    Returns:
+        (nodes, checked, view): view は操作結果の解釈に使う
+            {"folders": {閉じているフォルダ: チェックを付けたか}, "files": 表示したファイルの絶対パス}
+    """
+    tree = entries.folder_tree()
+    opened = {v[len("folder:"):] for v in expanded if v.startswith("folder:")}
+    counts = tree.selected_counts(selected)
+    checked = []
+    view = {"folders": {}, "files": set()}
+    by_entry = entry_sort_key(sort_order) if sort_order in ("mtime", "size") else None
+
+    def folder_nodes(folder):
+        nodes = []
+        for sub in tree.subfolders[folder]:
+            value = f"folder:{sub}"
+            if sub in opened:
+                nodes.append({
+                    "label": tree.name(sub),
+                    "value": value,
+                    "children": folder_nodes(sub),
+                })
+                continue
+            n, total = counts.get(sub, 0), tree.file_counts[sub]
+            view["folders"][sub] = n == total
+            if n == total:
+                checked.append(value)
             nodes.append({
-                "label": file_name,
-                "value": file_data["_abs_path"],  # ファイルは絶対パス
+                "label": f"{tree.name(sub)}（{n:,} / {total:,} 件を選択）"
+                if n
+                else f"{tree.name(sub)}（{total:,} 件）",
+                "value": value,
+                "children": [],  # 空のリストなら開けるフォルダとして表示される
             })
 
+        rows = sorted(tree.file_rows(folder), key=entries.file_name)
+        if by_entry is not None:
+            rows.sort(key=lambda i: by_entry(entries[i]))
+        for i in rows:
+            abs_path = entries.abs_path(i)
+            view["files"].add(abs_path)
+            if abs_path in selected:
+                checked.append(abs_path)
+            nodes.append({
+                "label": file_label(entries.file_name(i), entries.size(i), entries.mtime(i)),
+                "value": abs_path,
+            })
         return nodes
 
-    return convert_to_nodes(tree)
+    return folder_nodes(""), checked, view
+
+
+def apply_lazy_tree_result(entries, result: dict, selected: set, view: dict) -> set:
+    """遅延ツリーの操作結果を反映した新しい選択を返す
+
+    表示していたファイルはチェックの有無をそのまま使い、閉じていたフォルダは
+    チェックを付けた・外したときだけ配下のファイルをまとめて選択・解除する。
+    """
+    checked = set(result.get("checked", []))
+    tree = entries.folder_tree()
+    new_selected = (set(selected) - view["files"]) | {
+        v for v in checked & view["files"] if v in entries
+    }
+    for folder, was_checked in view["folders"].items():
+        now_checked = f"folder:{folder}" in checked
+        if now_checked == was_checked or folder not in tree.subfolders:
+            continue
+        paths = {entries.abs_path(i) for i in tree.rows_under(folder)}
+        if now_checked:
+            new_selected |= paths
+        else:
+            new_selected -= paths
+    return new_selected
+
+
+def read_lazy_tree_result(result, checked: list, view: dict, selected: set):
+    """遅延ツリーの操作結果から新しい選択を返す（新しい操作がなければ None）
+
+    コンポーネントは最後の操作結果を返し続けるので、処理済みの結果と、
+    今回送った状態と同じ結果（作り直した直後）は無視する。
+    結果は前回描画したツリー（view）に対するものとして解釈し、開閉は tree_expanded に反映する。
+    """
+    prev_view = st.session_state._tree_view
+    st.session_state._tree_view = view
+    if not result or prev_view is None or result == st.session_state._tree_result:
+        return None
+    if set(result.get("checked", [])) == set(checked) and set(
+        result.get("expanded", [])
+    ) == set(st.session_state.tree_expanded):
+        return None
+    st.session_state._tree_result = result
+    st.session_state.tree_expanded = result.get("expanded", [])
+    return apply_lazy_tree_result(st.session_state.entries, result, selected, prev_view)
 
 
 # ========= 設定保存 =========
@@ -283,6 +634,29 @@ def save_config():
         "exclude_dirs": list(st.session_state.exclude_dirs),
         "include_exts": list(st.session_state.include_exts),
         "exclude_file_patterns": list(st.session_state.exclude_file_patterns),
+        "scan_workers": st.session_state.scan_workers,
+        "copy_workers": st.session_state.copy_workers,
+        "copy_method": st.session_state.copy_method,
+        "save_mode": st.session_state.save_mode,
+        "archive_format": st.session_state.archive_format,
+        "archive_name": st.session_state.archive_name,
+        "archive_store_exts": list(st.session_state.archive_store_exts),
+        "copy_sync": st.session_state.copy_sync,
+        "copy_compare_hash": st.session_state.copy_compare_hash,
+        "copy_delete_extra": st.session_state.copy_delete_extra,
+        "extra_dests": list(st.session_state.extra_dests),
+        "copy_checksum": st.session_state.copy_checksum,
+        "copy_verify_disk": st.session_state.copy_verify_disk,
+        "manifest_format": st.session_state.manifest_format,
+        "sort_order": st.session_state.sort_order,
+        "tree_lazy": st.session_state.tree_lazy,
+        "index_path": st.session_state.index_path,
+        "index_max_mb": st.session_state.index_max_mb,
+        "incremental_scan": st.session_state.incremental_scan,
+        "live_mode": st.session_state.live_mode,
+        "scan_max_files": st.session_state.scan_max_files,
+        "scan_max_depth": st.session_state.scan_max_depth,
+        "scan_timeout": st.session_state.scan_timeout,
         "search_history": list(st.session_state.search_history),
         "dest_history": list(st.session_state.dest_history),
         "selected_group": st.session_state.selected_group,
@@ -316,6 +690,29 @@ def load_config():
         "exclude_dirs",
         "include_exts",
         "exclude_file_patterns",
+        "scan_workers",
+        "copy_workers",
+        "copy_method",
+        "save_mode",
+        "archive_format",
+        "archive_name",
+        "archive_store_exts",
+        "copy_sync",
+        "copy_compare_hash",
+        "copy_delete_extra",
+        "extra_dests",
+        "copy_checksum",
+        "copy_verify_disk",
+        "manifest_format",
+        "sort_order",
+        "tree_lazy",
+        "index_path",
+        "index_max_mb",
+        "incremental_scan",
+        "live_mode",
+        "scan_max_files",
+        "scan_max_depth",
+        "scan_timeout",
         "search_history",
         "dest_history",
         "selected_group",
@@ -335,6 +732,8 @@ def load_config():
         # 古い設定ファイル：グループ選択から同期（entriesがロードされた後に実行）
         st.session_state.selected_abs_paths = set()
 
+    st.session_state._synced_abs_paths = None
+
     # ウィジェットキーはここでは更新しない（ウィジェット描画後は変更不可）
     # 代わりに _config_loaded フラグを立てて、再描画時に init で同期する
     st.session_state._config_just_loaded = True
@@ -366,10 +765,205 @@ def store_search_results(
     st.session_state.ver_to_entry_map = ver_to_entry_map
     st.session_state.ver_subver_to_entry_map = ver_subver_to_entry_map
     st.session_state.subversions_map = subversions_map
+    st.session_state._synced_abs_paths = None  # グループが変わったので全体を同期し直す
+
+
+def merge_selection_state(groups, versions_map, subversions_map):
+    """新しい検索結果に対して以前の選択状態をマージ"""
+    # 以前の選択状態を保持
+    old_selected_group = st.session_state.selected_group.copy()
+    old_selected_version = st.session_state.selected_version.copy()
+    old_selected_subversion = st.session_state.selected_subversion.copy()
+
+    # 新しいグループに対して選択状態をマージ
+    st.session_state.selected_group = {
+        fn: old_selected_group.get(fn, False) for fn in groups
+    }
+
+    # バージョン選択をマージ
+    st.session_state.selected_version = {}
+    for fn in versions_map:
+        if (
+            fn in old_selected_version
+            and old_selected_version[fn] in versions_map[fn]
+        ):
+            st.session_state.selected_version[fn] = old_selected_version[fn]
+        else:
+            st.session_state.selected_version[fn] = versions_map[fn][0]
+
+    # サブバージョン選択をマージ
+    st.session_state.selected_subversion = {}
+    for fn in versions_map:
+        ver = st.session_state.selected_version[fn]
+        available_subvers = subversions_map.get(fn, {}).get(ver, ["-"])
+        old_fn_subvers = old_selected_subversion.get(fn, {})
+        if isinstance(old_fn_subvers, dict) and ver in old_fn_subvers:
+            old_subver = old_fn_subvers[ver]
+            if old_subver in available_subvers:
+                st.session_state.selected_subversion[fn] = {ver: old_subver}
+            else:
+                st.session_state.selected_subversion[fn] = {
+                    ver: available_subvers[0]
+                }
+        else:
+            st.session_state.selected_subversion[fn] = {
+                ver: available_subvers[0]
+            }
+
+
+def apply_search_results(entries):
+    """エントリからグループ構造を再構築し、選択状態を維持したまま差し替える"""
+    (
+        groups,
+        versions_map,
+        ver_to_entry_map,
+        ver_subver_to_entry_map,
+        subversions_map,
+    ) = get_group_struct(entries)
+    store_search_results(
+        entries,
+        groups,
+        versions_map,
+        ver_to_entry_map,
+        ver_subver_to_entry_map,
+        subversions_map,
+    )
+    merge_selection_state(groups, versions_map, subversions_map)
+    # 消えたファイルをパス選択から外す
+    st.session_state.selected_abs_paths = {
+        p for p in st.session_state.selected_abs_paths if p in entries
+    }
+    st.session_state._need_sync_to_group = True
+    st.session_state._tree_key_version += 1
+
+
+@st.fragment(run_every=1.0)
+def poll_revalidation():
+    """インデックス再検証の完了を待ち、変化があれば検索結果を差し替える"""
+    job = st.session_state._revalidation
+    if job is None:
+        return
+    if not job.done:
+        st.caption("インデックスを再検証中...")
+        return
+
+    st.session_state._revalidation = None
+    if job.error:
+        st.session_state._pending_toasts.append(f"再検証に失敗しました: {job.error}")
+    elif job.changed or job.removed:
+        if st.session_state.scan_listings is job.base:
+            apply_listing_changes(job.listings, job.changed)
+        else:
+            # 再検証中にライブ更新が入った場合は、変化したフォルダを現在の結果に対して再列挙
+            listings, changed, _ = update_tree(
+                st.session_state._scan_params[0],
+                st.session_state.scan_listings,
+                job.changed,
+                workers=st.session_state.scan_workers,
+            )
+            apply_listing_changes(listings, changed)
+        st.session_state._pending_toasts.append(
+            f"{len(job.changed) + len(job.removed)} フォルダの変更を反映しました"
+        )
+    else:
+        return
+    st.rerun()
+
+
+def refilter_entries():
+    """拡張子・除外フォルダ・除外パターンが変わっていれば、手元の走査結果から作り直す
+
+    ディスクは読まず、メモリ上のフォルダ一覧を絞り込むだけなので即座に反映される。
+    """
+    listings = st.session_state.scan_listings
+    params = st.session_state._scan_params
+    if listings is None or params is None:
+        return False
+    root = params[0]
+    new_params = (
+        root,
+        normalize_exclude_dirs(st.session_state.exclude_dirs),
+        normalize_include_exts(st.session_state.include_exts),
+        list(st.session_state.exclude_file_patterns),
+    )
+    if new_params == params:
+        return False
+    st.session_state._scan_params = new_params
+    apply_search_results(derive_entries(new_params))
+    return True
+
+
+def apply_listing_changes(listings: dict, changed_dirs):
+    """フォルダ一覧の変更を検索結果とグループ構造に反映"""
+    set_scan_listings(
+        st.session_state._scan_params[0],
+        listings,
+        share=not st.session_state._scan_partial,
+    )
+    apply_search_results(refresh_entries(listings, changed_dirs))
+
+
+# ========= ライブ更新 =========
+def ensure_watcher():
+    """ライブ更新が有効なら検索結果のフォルダを監視（検索フォルダが変わったら張り直す）"""
+    watcher = st.session_state._watcher
+    listings = st.session_state.scan_listings
+    want = st.session_state.live_mode and listings is not None
+    root = st.session_state._scan_params[0] if want else None
+
+    if watcher is not None and not watcher.alive:
+        st.warning(f"ライブ更新が停止しました: {watcher.error}")
+        st.session_state.live_mode = want = False
+    if watcher is not None and (not want or watcher.root != root or not watcher.alive):
+        watcher.stop()
+        st.session_state._watcher = watcher = None
+
+    if want and watcher is None:
+        try:
+            st.session_state._watcher = LiveWatcher(root, listings)
+        except OSError as e:
+            st.warning(f"ライブ更新を開始できません: {e}")
+            st.session_state.live_mode = False
+    elif watcher is not None:
+        watcher.sync(listings)
+
+
+@st.fragment(run_every=1.0)
+def poll_live_changes():
+    """監視スレッドがため込んだ変更をまとめて検索結果に反映"""
+    watcher = st.session_state._watcher
+    if watcher.error:
+        st.caption(f"ライブ更新中（一部のフォルダは監視できません: {watcher.error}）")
+    else:
+        st.caption("ライブ更新中")
+
+    dirty = watcher.take_dirty()
+    if not dirty:
+        return
+
+    root = st.session_state._scan_params[0]
+    listings, changed, removed = update_tree(
+        root, st.session_state.scan_listings, dirty, workers=st.session_state.scan_workers
+    )
+    if not changed and not removed:
+        return
+    apply_listing_changes(listings, changed)
+    watcher.sync(listings)
+    try:
+        get_scan_index().update(root, (), listings, changed, removed)
+    except (sqlite3.Error, OSError) as e:
+        st.session_state._pending_toasts.append(f"インデックスを保存できません: {e}")
+    st.rerun()
 
 
 def clear_search_results():
     """検索結果をクリア"""
+    cancel_scan_job()
+    st.session_state._scan_partial = ""
+    st.session_state._revalidation = None
+    st.session_state.scan_listings = None
+    st.session_state._scan_generation = None
+    st.session_state._scan_params = None
     st.session_state.entries = []
     st.session_state.groups = {}
     st.session_state.versions_map = {}
@@ -379,6 +973,7 @@ def clear_search_results():
     st.session_state.selected_group = {}
     st.session_state.selected_version = {}
     st.session_state.selected_subversion = {}
+    st.session_state._synced_abs_paths = None
     st.session_state.page = 1
 
 
@@ -485,49 +1080,103 @@ def parse_filter_query(query: str):
     return and_terms, or_terms, exclude_terms
 
 
-def match_filter(filename: str, filter_text: str, use_regex: bool = False) -> bool:
-    """ファイル名がフィルタ条件にマッチするか判定
+@functools.lru_cache(maxsize=64)
+def compile_filter(filter_text: str, use_regex: bool = False):
+    """フィルタ文字列をファイル名の判定関数（name -> bool）にコンパイル（空なら None）
 
-    Args:
-        filename: チェック対象のファイル名
-        filter_text: フィルタ文字列
-        use_regex: True=正規表現モード, False=演算子モード
-
-    Returns:
-        マッチすればTrue
+    正規表現モードはパターンを一度だけコンパイルし、不正なパターンは通常の部分一致にする。
+    演算子モードの AND / OR / 除外条件は、小文字にしたファイル名に対する
+    1つの正規表現（先読みの組み合わせ）にまとめる。
     """
     if not filter_text.strip():
-        return True
-
-    fn_lower = filename.lower()
+        return None
 
     # 正規表現モード
     if use_regex:
         try:
-            return bool(re.search(filter_text, filename, re.IGNORECASE))
+            pattern = re.compile(filter_text, re.IGNORECASE)
         except re.error:
             # 正規表現エラーの場合は通常の部分一致にフォールバック
-            return filter_text.lower() in fn_lower
+            text = filter_text.lower()
+            return lambda filename: text in filename.lower()
+        return lambda filename: pattern.search(filename) is not None
 
     # 演算子モード
     and_terms, or_terms, exclude_terms = parse_filter_query(filter_text)
+    parts = []
+    if exclude_terms:
+        parts.append("(?!.*(?:" + "|".join(map(re.escape, exclude_terms)) + "))")
+    if or_terms:
+        parts.append("(?=.*(?:" + "|".join(map(re.escape, or_terms)) + "))")
+    parts.extend(f"(?=.*{re.escape(term)})" for term in and_terms)
+    if not parts:
+        return None
+    pattern = re.compile("".join(parts), re.DOTALL)
+    return lambda filename: pattern.match(filename.lower()) is not None
 
-    # 除外条件チェック（1つでもマッチしたらFalse）
-    for term in exclude_terms:
-        if term in fn_lower:
-            return False
 
-    # OR条件チェック（1つでもマッチすればOK、空ならスキップ）
-    if or_terms:
-        if not any(term in fn_lower for term in or_terms):
-            return False
+def match_filter(filename: str, filter_text: str, use_regex: bool = False) -> bool:
+    """ファイル名がフィルタ条件にマッチするか判定
 
-    # AND条件チェック（全てマッチする必要あり）
-    for term in and_terms:
-        if term not in fn_lower:
-            return False
+    Args:
+        filename: チェック対象のファイル名
+        filter_text: フィルタ文字列
+        use_regex: True=正規表現モード, False=演算子モード
+    Returns:
+        マッチすればTrue
+    """
+    matcher = compile_filter(filter_text, use_regex)
+    return matcher is None or matcher(filename)
 
-    return True
+
+def filtered_group_names(filter_text: str, use_regex: bool = False) -> list:
+    """フィルタに合うグループキーのリスト（グループの順）
+
+    走査結果の世代番号とフィルタをキーにセッションに覚えておき、
+    ページ送りや選択による再実行ではフィルタし直さない。
+    """
+    groups = st.session_state.groups
+    key = (st.session_state._scan_generation, filter_text, use_regex)
+    cached = st.session_state._group_filter
+    if cached is not None and cached[0] == key and cached[1] is groups:
+        return cached[2]
+    matcher = compile_filter(filter_text, use_regex)
+    if matcher is None:
+        names = list(groups)
+    elif not use_regex and len(groups) >= VECTORIZE_MIN_ROWS:
+        # 件数が多いときは演算子の条件を列でまとめて判定する
+        mask = terms_mask(group_names_lower(groups), *parse_filter_query(filter_text))
+        names = take(list(groups), mask)
+    else:
+        names = [fn for fn in groups if matcher(fn)]
+    st.session_state._group_filter = (key, groups, names)
+    return names
+
+
+def group_names_lower(groups):
+    """小文字にしたグループキーの列（グループが変わるまでセッションに覚えておく）"""
+    cached = st.session_state._group_names_lower
+    if cached is None or cached[0] is not groups:
+        cached = (groups, lower_strings(list(groups)))
+        st.session_state._group_names_lower = cached
+    return cached[1]
+
+
+def sort_group_names(names: list, order: str) -> list:
+    """グループキーを、グループで選択中のバージョンのファイルの更新日時・サイズの順に並べる"""
+    if len(names) < VECTORIZE_MIN_ROWS:
+        by_entry = entry_sort_key(order)
+        return sorted(
+            names,
+            key=lambda fn: by_entry(current_group_entry(fn) or {"size": None, "mtime": None}),
+        )
+    # 件数が多いときは値だけを集めて numpy で並べる（不明な値は最後）
+    values = []
+    for fn in names:
+        entry = current_group_entry(fn)
+        value = entry[order] if entry is not None else None
+        values.append(value if value is not None else -1)
+    return take(names, descending_order(values))
 
 
 def extract_date_from_filename(filename):
@@ -549,7 +1198,11 @@ def get_base_filename(filename):
 
 def find_version_from_relpath(rel_path: str):
     """相対パスからバージョンフォルダを検出（フォルダ名が完全にバージョン番号の場合のみ）"""
-    dir_part = os.path.dirname(rel_path)
+    return find_version_from_dir(os.path.dirname(rel_path))
+
+
+def find_version_from_dir(dir_part: str):
+    """相対フォルダパスからバージョンフォルダを検出"""
     if not dir_part:
         return "-"
     for part in reversed(dir_part.split(os.sep)):
@@ -585,49 +1238,306 @@ def subversion_key(subver: str):
         return (0,)
 
 
-@st.cache_data(show_spinner=False)
-def search_files(
-    root: str, exclude_dirs: list, include_exts: list, exclude_file_patterns: list
+def get_scan_index():
+    """設定中の保存先・サイズ上限でインデックスを開く"""
+    return ScanIndex(st.session_state.index_path, st.session_state.index_max_mb)
+
+
+@st.cache_resource
+def get_scan_store():
+    """全セッションで共有する走査結果のストア（読み取り専用で参照する）"""
+    return ScanStore()
+
+
+def set_scan_listings(root: str, listings: dict, share: bool = True):
+    """走査結果をセッションに設定（share なら共有ストアに root の最新版として登録）"""
+    store = get_scan_store()
+    st.session_state._scan_generation = (
+        store.publish_listings(root, listings) if share else store.new_generation()
+    )
+    st.session_state.scan_listings = listings
+
+
+def shared_key(kind: str, params: tuple):
+    """共有ストアのキー（走査結果の世代番号と検索条件の組）"""
+    root, ex_dirs, inc_exts, ex_patterns = params
+    return (
+        kind,
+        st.session_state._scan_generation,
+        (root, tuple(ex_dirs), tuple(inc_exts), tuple(ex_patterns)),
+    )
+
+
+def derive_entries(params: tuple, build=None):
+    """検索条件に合うエントリを共有ストアから取得（なければ作成して登録）
+
+    build を省略した場合は、セッションの走査結果から生成する。
+    """
+    if build is None:
+
+        def build():
+            listings = st.session_state.scan_listings
+            # 拡張子・除外パターンで絞り込む場合、件数が多ければ列でまとめて判定する
+            if (params[2] or params[3]) and worth_vectorizing(listings):
+                return build_entries_from_frame(params)
+            return build_entries(params[0], listings, *params[1:])
+
+    return get_scan_store().get_or_build(
+        shared_key("entries", params), build, entries_size
+    )
+
+
+def listing_frame(root: str, exclude_dirs):
+    """走査結果を列で持つ表（ListingFrame）を共有ストアから取得（なければ作成して登録）
+
+    拡張子・除外パターンを変えて絞り込み直すときは、同じ走査結果から作った表を使い回す。
+    """
+    key = ("frame", st.session_state._scan_generation, root, tuple(exclude_dirs))
+    return get_scan_store().get_or_build(
+        key,
+        lambda: ListingFrame(st.session_state.scan_listings, exclude_dirs),
+        entries_size,
+    )
+
+
+def get_group_struct(entries):
+    """現在の検索結果のグループ構造を共有ストアから取得（なければ構築して登録）"""
+    return get_scan_store().get_or_build(
+        shared_key("groups", st.session_state._scan_params),
+        lambda: build_group_struct(entries),
+        lambda _: entries_size(entries),
+    )
+
+
+def load_cached_listings(root: str, workers: int):
+    """共有ストアかインデックスにあるフォルダ一覧をセッションに設定し、
+    バックグラウンドで再検証（どちらにもなければ None）
+    """
+    st.session_state._revalidation = None
+    index = get_scan_index()
+    shared = get_scan_store().latest_listings(root)
+    if shared is not None:
+        st.session_state._scan_generation, listings = shared
+        st.session_state.scan_listings = listings
+    else:
+        try:
+            listings = index.load(root)
+        except (sqlite3.Error, OSError) as e:
+            st.warning(f"インデックスを読み込めません: {e}")
+            return None
+        if listings is None:
+            return None
+        set_scan_listings(root, listings)
+
+    st.session_state._revalidation = IndexRevalidation(index, root, (), listings, workers)
+    return listings
+
+
+def start_scan_job(params: tuple, workers: int):
+    """フル走査をバックグラウンドで開始（設定中の打ち切り条件を適用）
+
+    除外フォルダも含めて走査し、除外は結果の抽出時に適用する（進捗表示のみ除外を反映）。
+    """
+    cancel_scan_job()
+    root, exclude_dirs, include_exts, exclude_file_patterns = params
+    limits = ScanLimits(
+        st.session_state.scan_max_files,
+        st.session_state.scan_max_depth,
+        st.session_state.scan_timeout,
+    )
+    progress = ScanProgress(
+        include_exts,
+        normalize_exclude_file_patterns(exclude_file_patterns),
+        group_key=get_group_key,
+        exclude_dirs=exclude_dirs,
+    )
+    st.session_state._scan_job = ScanJob(root, (), workers, limits, progress)
+    st.session_state._scan_job_params = params
+
+
+def cancel_scan_job():
+    """実行中のフル走査を中止して破棄"""
+    if st.session_state._scan_job is not None:
+        st.session_state._scan_job.cancel()
+        st.session_state._scan_job = None
+
+
+def wait_scan_job(status):
+    """フル走査の完了まで status（st.empty）に進捗を描画し、エントリを返す
+
+    待機中に「中止」などが押されると rerun で中断されるが、走査は続いているので
+    次の実行で再びここから待つ。打ち切った結果はインデックスに保存しない。
+    """
+    job = st.session_state._scan_job
+    while not job.done:
+        render_scan_progress(status, job.progress)
+        time.sleep(PROGRESS_INTERVAL_SEC)
+    status.empty()
+
+    params = st.session_state._scan_job_params
+    st.session_state._scan_job = None
+    if not job.partial:
+        try:
+            get_scan_index().save(params[0], (), job.listings)
+        except (sqlite3.Error, OSError) as e:
+            st.warning(f"インデックスを保存できません: {e}")
+
+    # 打ち切った結果は他のセッションと共有しない
+    set_scan_listings(params[0], job.listings, share=not job.partial)
+    st.session_state._scan_params = params
+    st.session_state._scan_partial = job.stop_reason
+    st.session_state._last_scan_note = ""
+    return derive_entries(params)
+
+
+def get_subversion(filename):
+    """ファイル名の日付をサブバージョンとして返す（日付がなければ "-"）"""
+    return extract_date_from_filename(filename) or "-"
+
+
+# エントリの付加列（version はフォルダごと、base_name / subversion はファイル名から求める）
+ENTRY_DIR_FIELDS = {"version": find_version_from_dir}
+ENTRY_FILE_FIELDS = {"base_name": get_base_filename, "subversion": get_subversion}
+
+
+def build_entries(
+    root: str,
+    listings: dict,
+    exclude_dirs: list,
+    include_exts: list,
+    exclude_file_patterns: list,
+    rel_dirs=None,
 ):
-    entries = []
-    exclude_dirs_norm = set(d.lower() for d in exclude_dirs)
-    include_exts_norm = set(e.lower() for e in include_exts)
+    """フォルダ一覧からエントリ（バージョン・日付付きの EntryTable）を生成
 
-    file_patterns = normalize_exclude_file_patterns(exclude_file_patterns)
+    rel_dirs を指定した場合はそのフォルダ直下のみを対象にする。
+    """
+    return build_table(
+        root,
+        listings,
+        exclude_dirs,
+        include_exts,
+        normalize_exclude_file_patterns(exclude_file_patterns),
+        rel_dirs,
+        ENTRY_DIR_FIELDS,
+        ENTRY_FILE_FIELDS,
+    )
 
-    for dirpath, dirnames, filenames in os.walk(root):
-        dirnames[:] = [d for d in dirnames if d.lower() not in exclude_dirs_norm]
-        for fn in filenames:
-            if is_excluded_filename(fn, file_patterns):
-                continue
 
-            ext = os.path.splitext(fn)[1].lower()
+def build_entries_from_frame(params: tuple):
+    """セッションの走査結果を列で絞り込んでエントリを生成（build_entries と同じ結果）"""
+    root, ex_dirs, inc_exts, ex_patterns = params
+    frame = listing_frame(root, ex_dirs)
+    mask = frame.mask(inc_exts, normalize_exclude_file_patterns(ex_patterns))
+    return frame.table(root, mask, ENTRY_DIR_FIELDS, ENTRY_FILE_FIELDS)
 
-            if include_exts_norm and ext not in include_exts_norm:
-                continue
 
-            abs_path = os.path.join(dirpath, fn)
-            rel_path = os.path.relpath(abs_path, root)
-            version = find_version_from_relpath(rel_path)
-
-            # ★ 追加：日付とベース名を抽出
-            date = extract_date_from_filename(fn)
-            base_name = get_base_filename(fn)
-
-            entries.append(
-                {
-                    "file_name": fn,
-                    "base_name": base_name,  # ← 追加
-                    "version": version,
-                    "subversion": date if date else "-",  # ← 追加
-                    "rel_path": rel_path,
-                    "abs_path": abs_path,
-                }
-            )
+def search_files(
+    root: str,
+    exclude_dirs: list,
+    include_exts: list,
+    exclude_file_patterns: list,
+    workers: int = DEFAULT_SCAN_WORKERS,
+):
+    """ファイルを検索してエントリを返す
+
+    走査結果は除外フォルダも含めてフォルダごとに保持し、拡張子・除外フォルダ・
+    除外パターンの絞り込みはメモリ上で行う。差分検索が有効で、前回と同じフォルダの
+    走査結果があれば mtime が変わったフォルダだけを再列挙して前回の結果に差し込む。
+    走査結果・エントリ・グループ構造は共有ストアに置き、他のセッションとコピーせずに共有する。
+    フル走査が必要な場合はバックグラウンドで開始して None を返す
+    （結果は wait_scan_job で受け取る）。
+    """
+    params = (root, list(exclude_dirs), list(include_exts), list(exclude_file_patterns))
+    prev_params = st.session_state._scan_params
+    prev_listings = st.session_state.scan_listings
+
+    if (
+        st.session_state.incremental_scan
+        and prev_listings is not None
+        and prev_params is not None
+        and prev_params[0] == root
+        and not st.session_state._scan_partial
+    ):
+        st.session_state._revalidation = None
+        # 他のセッションが新しい走査結果を共有していれば、それを基準に再検証する
+        reuse_entries = prev_params == params
+        shared = get_scan_store().latest_listings(root)
+        if shared is not None and shared[0] != st.session_state._scan_generation:
+            st.session_state._scan_generation, prev_listings = shared
+            st.session_state.scan_listings = prev_listings
+            reuse_entries = False
+        listings, changed = revalidate_tree(root, prev_listings, workers=workers)
+        removed = set(prev_listings) - set(listings)
+        entries = None
+        if changed or removed:
+            try:
+                get_scan_index().update(root, (), listings, changed, removed)
+            except (sqlite3.Error, OSError) as e:
+                st.warning(f"インデックスを保存できません: {e}")
+            set_scan_listings(root, listings)
+            if reuse_entries:
+                entries = refresh_entries(listings, changed)
+        elif reuse_entries:
+            entries = st.session_state.entries
+        if entries is None:
+            entries = derive_entries(params)
+        st.session_state._last_scan_note = (
+            f"差分: {len(changed) + len(removed)} フォルダ更新 / "
+        )
+    else:
+        if load_cached_listings(root, workers) is None:
+            # サブフォルダはスレッドプールで並列に走査（順序は os.walk と同じ）
+            start_scan_job(params, workers)
+            return None
+        entries = derive_entries(params)
+        st.session_state._last_scan_note = ""
+
+    cancel_scan_job()
+    st.session_state._scan_params = params
+    st.session_state._scan_partial = ""
     return entries
 
 
-@st.cache_data(show_spinner=False)
+def render_scan_progress(status, progress: ScanProgress):
+    """検索中の件数・現在のフォルダ・経過時間と、見つかったグループの一覧を描画"""
+    with progress.lock:
+        file_count, dir_count = progress.file_count, progress.dir_count
+        current_dir = progress.current_dir
+        group_count = len(progress.group_counts)
+        rows = [
+            {"グループ": k, "ファイル数": progress.group_counts[k]}
+            for k in sorted(progress.group_counts)[:PROGRESS_MAX_ROWS]
+        ]
+    with status.container():
+        st.info(
+            f"検索中... {file_count:,} 件 / {group_count:,} グループ / "
+            f"{dir_count:,} フォルダ / 経過 {progress.elapsed:.1f}秒"
+        )
+        st.caption(f"現在のフォルダ: {current_dir or '.'}")
+        st.dataframe(
+            rows,
+            use_container_width=True,
+            hide_index=True,
+        )
+
+
+def refresh_entries(listings: dict, changed_dirs):
+    """再列挙したフォルダの分だけ現在のエントリを差し替える"""
+    params = st.session_state._scan_params
+    root, ex_dirs, inc_exts, ex_patterns = params
+
+    def build():
+        new_entries = build_entries(
+            root, listings, ex_dirs, inc_exts, ex_patterns, rel_dirs=changed_dirs
+        )
+        return st.session_state.entries.splice(
+            listings, changed_dirs, new_entries, ex_dirs
+        )
+
+    return derive_entries(params, build)
+
+
 def build_group_struct(entries):
     groups = {}
     versions_map = {}
@@ -695,8 +1605,351 @@ def build_group_struct(entries):
     )
 
 
+def complete_search(entries, path, times: dict):
+    """検索結果からグループ構造を構築し、選択状態をマージして所要時間を表示"""
+    with st.spinner(f"グループ構造を構築中... ({len(entries)} 件)"):
+        start = time.time()
+        (
+            groups,
+            versions_map,
+            ver_to_entry_map,
+            ver_subver_to_entry_map,
+            subversions_map,
+        ) = get_group_struct(entries)
+        times["グループ構築"] = time.time() - start
+
+    with st.spinner("選択状態をマージ中..."):
+        start = time.time()
+        store_search_results(
+            entries,
+            groups,
+            versions_map,
+            ver_to_entry_map,
+            ver_subver_to_entry_map,
+            subversions_map,
+        )
+
+        merge_selection_state(groups, versions_map, subversions_map)
+
+        st.session_state.page = 1
+        st.session_state.search_history = push_history(
+            st.session_state.search_history, path
+        )
+        times["マージ"] = time.time() - start
+
+    # 経過時間を表示
+    total = sum(times.values())
+    time_str = " / ".join([f"{k}: {v:.1f}秒" for k, v in times.items()])
+    preserved_count = sum(
+        1 for v in st.session_state.selected_group.values() if v
+    )
+    note = st.session_state._last_scan_note
+    if st.session_state._scan_partial:
+        note = f"途中結果: {st.session_state._scan_partial} / {note}"
+        notify = st.warning
+    else:
+        notify = st.success
+    if preserved_count > 0:
+        notify(f"{len(entries)}件（{preserved_count}件維持）- {note}{time_str} / 合計: {total:.1f}秒")
+    else:
+        notify(f"{len(entries)}件 - {note}{time_str} / 合計: {total:.1f}秒")
+
+
+# ========= ファイル保存 =========
+def start_copy_job(targets, dest: str):
+    """エントリの保存先へのコピーをバックグラウンドで開始"""
+    st.session_state._copy_summary = None
+    sync = st.session_state.copy_sync
+    st.session_state._copy_job = CopyJob(
+        make_tasks(targets, dest),
+        dest,
+        st.session_state.copy_workers,
+        sync=sync,
+        compare_hash=sync and st.session_state.copy_compare_hash,
+        delete_extra=sync and st.session_state.copy_delete_extra,
+        method=st.session_state.copy_method,
+        extra_dests=st.session_state.extra_dests,
+        checksum=st.session_state.copy_checksum,
+        manifest_format=st.session_state.manifest_format,
+        verify_from_disk=st.session_state.copy_verify_disk,
+    )
+
+
+def render_dest_table(report):
+    """保存先ごとのコピー・スキップ・削除・失敗の件数とバイト数を表示（保存先が複数の場合）"""
+    with report.lock:
+        rows = [
+            {
+                "保存先": root,
+                "コピー": stats.copied,
+                "スキップ": stats.skipped,
+                "削除": stats.deleted,
+                "失敗": len(stats.failed),
+                "サイズ": format_size(stats.bytes),
+            }
+            for root, stats in report.dests.items()
+        ]
+    st.dataframe(rows, use_container_width=True, hide_index=True)
+
+
+def render_copy_progress(report):
+    """コピーの件数・バイト数・速度・残り時間と、時間のかかっているファイルを描画"""
+    st.progress(
+        report.done / report.total if report.total else 1.0,
+        text=f"コピー中... {report.done:,} / {report.total:,} 件",
+    )
+    eta = report.eta
+    st.caption(
+        f"{format_size(report.bytes)}（{format_size(report.throughput)}/秒）"
+        f" / 経過 {report.elapsed:.1f}秒"
+        + (f" / 残り 約 {eta:.0f}秒" if eta is not None else "")
+    )
+    slowest = report.slowest()
+    if slowest:
+        st.caption(f"コピー中: {slowest[0]}（{slowest[1]:.1f}秒）")
+    if report.dests:
+        render_dest_table(report)
+
+
+@st.fragment(run_every=1.0)
+def poll_copy_job():
+    """実行中のコピーの進捗を描画し、終わったら結果を残して全体を再描画"""
+    job = st.session_state._copy_job
+    if job is None:
+        return
+    if not job.done:
+        render_copy_progress(job.report)
+        if job.cancelling:
+            st.caption("中止しています（コピー中のファイルを待っています）...")
+        elif st.button("コピーを中止", key="cancel_copy", use_container_width=True):
+            job.cancel()
+        return
+
+    st.session_state._copy_job = None
+    st.session_state._copy_summary = job
+    st.rerun()
+
+
+def start_archive_job(targets, dest: str):
+    """エントリを保存先フォルダの1つのアーカイブにまとめる処理をバックグラウンドで開始"""
+    fmt = st.session_state.archive_format
+    name = st.session_state.archive_name or "files"
+    st.session_state._copy_summary = None
+    st.session_state._copy_job = ArchiveJob(
+        make_tasks(targets, dest),
+        os.path.join(dest, name + ARCHIVE_FORMATS[fmt].ext),
+        fmt,
+        st.session_state.archive_store_exts,
+    )
+
+
+def resume_copy_job(dest: str):
+    """保存先の記録から、途中で止まったコピーの残りをバックグラウンドで再開"""
+    st.session_state._copy_summary = None
+    st.session_state._copy_job = CopyJob(
+        (), dest, st.session_state.copy_workers, resume=True
+    )
+
+
+def render_copy_resume(journal: CopyJournal):
+    """保存先に途中で止まったコピーの記録があれば、再開・破棄のボタンを表示"""
+    if not journal.exists():
+        return
+    header = journal.read_header()
+    if header is None:
+        st.info("保存先に途中で止まったコピーの記録があります。")
+    else:
+        total, created = header
+        started = time.strftime("%Y-%m-%d %H:%M", time.localtime(created))
+        st.info(f"保存先に途中で止まったコピーがあります（{total:,} 件、{started} 開始）。")
+    resume_col = st.columns(2)
+    if resume_col[0].button("コピーを再開", key="resume_copy", use_container_width=True):
+        resume_copy_job(journal.dest)
+        st.rerun()
+    if resume_col[1].button("記録を破棄", key="discard_copy_journal", use_container_width=True):
+        journal.remove()
+        st.rerun()
+
+
+def render_copy_summary(job):
+    """終わったコピーの結果（成功数・スキップ・失敗したファイル）を表示"""
+    report = job.report
+    if job.error:
+        st.error(f"コピーに失敗しました: {job.error}")
+    elif report.cancelled:
+        st.warning(f"コピーを中止しました（{report.copied} / {report.total} 件）。")
+    elif isinstance(job, ArchiveJob):
+        st.success(f"{report.copied} 件をアーカイブに格納")
+        st.caption(f"アーカイブのサイズ: {format_size(job.archive_size)}")
+    elif report.dests:
+        st.success(f"{report.copied} 件を {len(report.dests)} か所にコピー")
+    else:
+        st.success(f"{report.copied} 件コピー")
+    st.caption(
+        f"保存先: {job.dest} / {format_size(report.bytes)} / {report.elapsed:.1f}秒"
+    )
+    if report.dests:
+        render_dest_table(report)
+    if report.manifests:
+        st.caption(
+            f"チェックサム確認: {report.verified:,} 件 / マニフェスト: "
+            + ", ".join(report.manifests)
+        )
+    if job.resumed:
+        st.caption(f"再開: 前回までに {job.resumed:,} 件済み")
+    if report.methods:
+        st.caption(
+            ("格納方法: " if isinstance(job, ArchiveJob) else "コピー方法: ")
+            + " / ".join(
+                f"{COPY_METHOD_LABELS.get(k) or ARCHIVE_METHOD_LABELS.get(k, k)} {v:,} 件"
+                for k, v in report.methods.items()
+            )
+        )
+    if job.sync:
+        st.caption(
+            f"最新のためスキップ: {report.skipped:,} 件"
+            f"（{format_size(report.skipped_bytes)} 節約） / "
+            f"削除: {len(report.deleted):,} 件"
+        )
+        if report.deleted:
+            with st.expander("保存先から削除したファイル", expanded=False):
+                st.write("\n".join(f"- {rel}" for rel in report.deleted[:1000]))
+    if report.missing:
+        st.warning(
+            f"{len(report.missing)} 件は見つからないためスキップ: "
+            + ", ".join(report.missing[:10])
+            + (" ..." if len(report.missing) > 10 else "")
+        )
+    if report.failed:
+        st.warning(f"{len(report.failed)} 件のファイルをコピーできませんでした。")
+        with st.expander("コピーできなかったファイル", expanded=False):
+            st.dataframe(
+                [{"ファイル": rel, "エラー": msg} for rel, msg in report.failed],
+                use_container_width=True,
+                hide_index=True,
+            )
+    if st.button("結果を閉じる", key="close_copy_summary", use_container_width=True):
+        st.session_state._copy_summary = None
+        st.rerun()
+
+
+# ========= 重複ファイル =========
+@st.cache_resource
+def get_hash_cache():
+    """全セッションで共有するファイルのハッシュのキャッシュ"""
+    return HashCache()
+
+
+def start_duplicate_job():
+    """検索結果から内容が同じファイルを探す処理をバックグラウンドで開始"""
+    st.session_state._duplicates = None
+    st.session_state._dup_job = DuplicateJob(
+        st.session_state.entries, DEFAULT_HASH_WORKERS, get_hash_cache()
+    )
+
+
+def render_duplicate_stats(progress):
+    """重複検出で読んだファイル数・バイト数を表示"""
+    st.caption(
+        f"サイズが同じファイル: {progress.candidates:,} / {progress.total:,} 件 / "
+        f"部分ハッシュ {progress.partial:,} 件・全体 {progress.full:,} 件・"
+        f"キャッシュ {progress.cache_hits:,} 件 / "
+        f"読み込み {format_size(progress.bytes_read)} / {progress.elapsed:.1f}秒"
+    )
+
+
+@st.fragment(run_every=1.0)
+def poll_duplicate_job():
+    """実行中の重複検出の進捗を描画し、終わったら結果を残して全体を再描画"""
+    job = st.session_state._dup_job
+    if job is None:
+        return
+    if not job.done:
+        progress = job.progress
+        total = progress.stage_total
+        st.progress(
+            progress.stage_done / total if total else 0.0,
+            text=f"{DUPLICATE_STAGE_LABELS[progress.stage]}... "
+            f"{progress.stage_done:,} / {total:,} 件",
+        )
+        render_duplicate_stats(progress)
+        if job.cancelling:
+            st.caption("中止しています...")
+        elif st.button("重複の検出を中止", key="cancel_duplicates", use_container_width=True):
+            job.cancel()
+        return
+
+    st.session_state._dup_job = None
+    st.session_state._duplicates = job
+    st.rerun()
+
+
+def render_duplicates(selected: set):
+    """重複の検出ボタン・進捗・結果（組ごとのファイル一覧）を表示
+
+    「重複ごとに1つだけ選択」が押されたら新しい選択を返す（それ以外は None）。
+    """
+    if st.session_state._dup_job is not None:
+        poll_duplicate_job()
+        return
+    if st.button("重複ファイルを探す", key="find_duplicates", use_container_width=True):
+        start_duplicate_job()
+        rerun_results()
+    job = st.session_state._duplicates
+    if job is None:
+        st.caption(
+            "サイズが同じファイルだけを読み、先頭・末尾のハッシュ、"
+            "さらに全体のハッシュで内容が同じファイルの組を探します。"
+        )
+        return
+    if job.error:
+        st.error(f"重複の検出に失敗しました: {job.error}")
+        return
+    if job.progress.cancelled:
+        st.warning("重複の検出を中止しました。")
+        return
+    if job.entries is not st.session_state.entries:
+        st.info("検索結果が更新されています。最新の結果で探すにはもう一度実行してください。")
+    render_duplicate_stats(job.progress)
+    if job.progress.errors:
+        st.warning(f"{job.progress.errors:,} 件のファイルを読めなかったため除外しました。")
+    sets = job.result
+    if not sets:
+        st.success("内容が同じファイルは見つかりませんでした。")
+        return
+
+    dup_col = st.columns(3)
+    dup_col[0].metric("重複の組", f"{len(sets):,}")
+    dup_col[1].metric("余分なファイル", f"{sum(len(d.paths) - 1 for d in sets):,}")
+    dup_col[2].metric("削減できるサイズ", format_size(sum(d.wasted for d in sets)))
+    new_selected = None
+    if st.button("重複ごとに1つだけ選択", key="select_one_per_duplicate", use_container_width=True):
+        new_selected = {
+            p for p in one_per_set(sets, selected) if p in st.session_state.entries
+        }
+    st.dataframe(
+        [
+            {
+                "組": n,
+                "サイズ": format_size(dup.size),
+                "パス": path,
+                "選択中": path in selected,
+            }
+            for n, dup in enumerate(sets, 1)
+            for path in dup.paths
+        ],
+        use_container_width=True,
+        hide_index=True,
+    )
+    return new_selected
+
+
 # ========= UI =========
 
+# メインエリアの見出しと、検索中の進捗表示枠（サイドバーの検索処理から描画する）
+st.header("ファイル検索・収集ツール")
+scan_status = st.empty()
+
 # ---------- サイドバー ----------
 with st.sidebar:
     # ---------- 設定保存・ロード ----------
@@ -718,56 +1971,62 @@ with st.sidebar:
                     inc_exts = normalize_include_exts(st.session_state.include_exts)
                     ex_patterns = st.session_state.exclude_file_patterns
                     entries = search_files(
-                        st.session_state.search_path, ex_dirs, inc_exts, ex_patterns
+                        st.session_state.search_path,
+                        ex_dirs,
+                        inc_exts,
+                        ex_patterns,
+                        st.session_state.scan_workers,
                     )
                     times["検索"] = time.time() - start
 
-                with st.spinner(f"グループ構造を構築中... ({len(entries)} 件)"):
-                    start = time.time()
-                    (
-                        groups,
-                        versions_map,
-                        ver_to_entry_map,
-                        ver_subver_to_entry_map,
-                        subversions_map,
-                    ) = build_group_struct(entries)
-                    times["グループ構築"] = time.time() - start
-
-                with st.spinner("選択状態をマージ中..."):
-                    start = time.time()
-                    store_search_results(
-                        entries,
-                        groups,
-                        versions_map,
-                        ver_to_entry_map,
-                        ver_subver_to_entry_map,
-                        subversions_map,
-                    )
-
-                    old_selected = st.session_state.selected_group.copy()
-                    st.session_state.selected_group = {
-                        fn: old_selected.get(fn, False) for fn in groups
-                    }
-
-                    for fn in groups:
-                        if fn not in st.session_state.selected_version:
-                            latest_ver = versions_map[fn][0]
-                            st.session_state.selected_version[fn] = latest_ver
-                            st.session_state.selected_subversion[fn] = {
-                                latest_ver: subversions_map[fn][latest_ver][0]
-                            }
-                    times["マージ"] = time.time() - start
-
-                with st.spinner("ツリービューと同期中..."):
-                    start = time.time()
-                    # グループ選択 → パス選択に同期（ツリービュー用）
-                    sync_group_to_paths()
-                    times["同期"] = time.time() - start
+                # フル走査の場合は完了待ち（下の検索処理）で結果を反映する
+                if entries is not None:
+                    with st.spinner(f"グループ構造を構築中... ({len(entries)} 件)"):
+                        start = time.time()
+                        (
+                            groups,
+                            versions_map,
+                            ver_to_entry_map,
+                            ver_subver_to_entry_map,
+                            subversions_map,
+                        ) = get_group_struct(entries)
+                        times["グループ構築"] = time.time() - start
+
+                    with st.spinner("選択状態をマージ中..."):
+                        start = time.time()
+                        store_search_results(
+                            entries,
+                            groups,
+                            versions_map,
+                            ver_to_entry_map,
+                            ver_subver_to_entry_map,
+                            subversions_map,
+                        )
+
+                        old_selected = st.session_state.selected_group.copy()
+                        st.session_state.selected_group = {
+                            fn: old_selected.get(fn, False) for fn in groups
+                        }
 
-                # 経過時間を表示
-                total = sum(times.values())
-                time_str = " / ".join([f"{k}: {v:.1f}秒" for k, v in times.items()])
-                st.info(f"完了（{len(entries)}件）- {time_str} / 合計: {total:.1f}秒")
+                        for fn in groups:
+                            if fn not in st.session_state.selected_version:
+                                latest_ver = versions_map[fn][0]
+                                st.session_state.selected_version[fn] = latest_ver
+                                st.session_state.selected_subversion[fn] = {
+                                    latest_ver: subversions_map[fn][latest_ver][0]
+                                }
+                        times["マージ"] = time.time() - start
+
+                    with st.spinner("ツリービューと同期中..."):
+                        start = time.time()
+                        # グループ選択 → パス選択に同期（ツリービュー用）
+                        sync_group_to_paths()
+                        times["同期"] = time.time() - start
+
+                    # 経過時間を表示
+                    total = sum(times.values())
+                    time_str = " / ".join([f"{k}: {v:.1f}秒" for k, v in times.items()])
+                    st.info(f"完了（{len(entries)}件）- {time_str} / 合計: {total:.1f}秒")
 
         if st.button("設定をロード", use_container_width=True):
             ok = load_config()
@@ -828,11 +2087,87 @@ with st.sidebar:
             label_visibility="collapsed",
         ).split("\n")
 
-    sidebar_col = st.columns(2)
+    st.session_state.incremental_scan = st.checkbox(
+        "差分検索",
+        value=st.session_state.incremental_scan,
+        help="前回の検索結果から、更新されたフォルダだけを再列挙します",
+    )
+    st.session_state.live_mode = st.checkbox(
+        "ライブ更新",
+        value=st.session_state.live_mode and HAS_INOTIFY,
+        disabled=not HAS_INOTIFY,
+        help="検索後のファイルの追加・削除・移動を監視して一覧に反映します（Linux のみ）",
+    )
+
+    with st.expander("インデックス", expanded=False):
+        st.session_state.index_path = st.text_input(
+            "保存先",
+            value=st.session_state.index_path,
+            help="検索結果を保存するファイル（次回以降の検索を高速化）",
+        )
+        st.session_state.index_max_mb = st.number_input(
+            "サイズ上限（MB）",
+            min_value=1,
+            value=int(st.session_state.index_max_mb),
+        )
+        if st.button("インデックスを削除", use_container_width=True):
+            get_scan_index().clear()
+            st.info("インデックスを削除しました。")
+        store_count, store_bytes = get_scan_store().stats()
+        st.caption(
+            f"共有キャッシュ: {store_count} 件 / 約 {store_bytes / 1024 / 1024:.1f} MB"
+        )
+
+    with st.expander("検索の制限", expanded=False):
+        st.session_state.scan_max_files = st.number_input(
+            "最大ファイル数（0=無制限）",
+            min_value=0,
+            step=1000,
+            value=int(st.session_state.scan_max_files),
+            help="走査したファイル数がこの数に達したら打ち切ります",
+        )
+        st.session_state.scan_max_depth = st.number_input(
+            "最大深さ（0=無制限）",
+            min_value=0,
+            value=int(st.session_state.scan_max_depth),
+            help="検索フォルダから何階層下まで潜るか",
+        )
+        st.session_state.scan_timeout = st.number_input(
+            "制限時間（秒、0=無制限）",
+            min_value=0,
+            value=int(st.session_state.scan_timeout),
+        )
+        if st.button("件数を見積もる", use_container_width=True):
+            path = st.session_state.search_path
+            if not path or not os.path.isdir(path):
+                st.error("検索フォルダが不正です。")
+            else:
+                start = time.monotonic()
+                est_dirs, est_files = estimate_tree(
+                    path, workers=st.session_state.scan_workers
+                )
+                st.info(
+                    f"推定: 約 {est_dirs:,.0f} フォルダ / 約 {est_files:,.0f} ファイル"
+                    f"（{time.monotonic() - start:.1f}秒）"
+                )
+
+    sidebar_col = st.columns([2, 2, 2])
     with sidebar_col[0]:
+        st.write("")  # スペーサー
+        st.write("")
         start_search = st.button("検索", type="primary", use_container_width=True)
     with sidebar_col[1]:
+        st.write("")
+        st.write("")
         clear_state = st.button("クリア", use_container_width=True)
+    with sidebar_col[2]:
+        st.session_state.scan_workers = st.number_input(
+            "並列数",
+            min_value=1,
+            max_value=64,
+            value=int(st.session_state.scan_workers),
+            help="フォルダ走査の並列スレッド数",
+        )
 
     # 検索処理
     if start_search:
@@ -847,91 +2182,42 @@ with st.sidebar:
                 ex_dirs = normalize_exclude_dirs(st.session_state.exclude_dirs)
                 inc_exts = normalize_include_exts(st.session_state.include_exts)
                 ex_patterns = st.session_state.exclude_file_patterns
-                entries = search_files(path, ex_dirs, inc_exts, ex_patterns)
-                times["検索"] = time.time() - start
-
-            with st.spinner(f"グループ構造を構築中... ({len(entries)} 件)"):
-                start = time.time()
-                (
-                    groups,
-                    versions_map,
-                    ver_to_entry_map,
-                    ver_subver_to_entry_map,
-                    subversions_map,
-                ) = build_group_struct(entries)
-                times["グループ構築"] = time.time() - start
-
-            with st.spinner("選択状態をマージ中..."):
-                start = time.time()
-                store_search_results(
-                    entries,
-                    groups,
-                    versions_map,
-                    ver_to_entry_map,
-                    ver_subver_to_entry_map,
-                    subversions_map,
+                entries = search_files(
+                    path,
+                    ex_dirs,
+                    inc_exts,
+                    ex_patterns,
+                    st.session_state.scan_workers,
                 )
+                times["検索"] = time.time() - start
 
-                # 以前の選択状態を保持
-                old_selected_group = st.session_state.selected_group.copy()
-                old_selected_version = st.session_state.selected_version.copy()
-                old_selected_subversion = st.session_state.selected_subversion.copy()
+            if entries is not None:
+                complete_search(entries, path, times)
 
-                # 新しいグループに対して選択状態をマージ
-                st.session_state.selected_group = {
-                    fn: old_selected_group.get(fn, False) for fn in groups
-                }
+    if clear_state:
+        clear_search_results()
+        st.info("クリアしました。")
 
-                # バージョン選択をマージ
-                st.session_state.selected_version = {}
-                for fn in versions_map:
-                    if (
-                        fn in old_selected_version
-                        and old_selected_version[fn] in versions_map[fn]
-                    ):
-                        st.session_state.selected_version[fn] = old_selected_version[fn]
-                    else:
-                        st.session_state.selected_version[fn] = versions_map[fn][0]
-
-                # サブバージョン選択をマージ
-                st.session_state.selected_subversion = {}
-                for fn in versions_map:
-                    ver = st.session_state.selected_version[fn]
-                    available_subvers = subversions_map.get(fn, {}).get(ver, ["-"])
-                    old_fn_subvers = old_selected_subversion.get(fn, {})
-                    if isinstance(old_fn_subvers, dict) and ver in old_fn_subvers:
-                        old_subver = old_fn_subvers[ver]
-                        if old_subver in available_subvers:
-                            st.session_state.selected_subversion[fn] = {ver: old_subver}
-                        else:
-                            st.session_state.selected_subversion[fn] = {
-                                ver: available_subvers[0]
-                            }
-                    else:
-                        st.session_state.selected_subversion[fn] = {
-                            ver: available_subvers[0]
-                        }
+    # フル走査の完了待ち（中止するとそれまでの結果を途中結果として表示）
+    if st.session_state._scan_job is not None:
+        if st.button("中止", use_container_width=True):
+            st.session_state._scan_job.cancel()
+        start = time.time()
+        entries = wait_scan_job(scan_status)
+        complete_search(
+            entries, st.session_state._scan_params[0], {"検索": time.time() - start}
+        )
 
-                st.session_state.page = 1
-                st.session_state.search_history = push_history(
-                    st.session_state.search_history, path
-                )
-                times["マージ"] = time.time() - start
+    # 検索条件の変更は再走査せずに反映
+    if st.session_state._scan_job is None and refilter_entries():
+        st.info(f"検索条件を反映しました（{len(st.session_state.entries)} 件）。")
 
-            # 経過時間を表示
-            total = sum(times.values())
-            time_str = " / ".join([f"{k}: {v:.1f}秒" for k, v in times.items()])
-            preserved_count = sum(
-                1 for v in st.session_state.selected_group.values() if v
-            )
-            if preserved_count > 0:
-                st.success(f"{len(entries)}件（{preserved_count}件維持）- {time_str} / 合計: {total:.1f}秒")
-            else:
-                st.success(f"{len(entries)}件 - {time_str} / 合計: {total:.1f}秒")
+    if st.session_state._revalidation is not None:
+        poll_revalidation()
 
-    if clear_state:
-        clear_search_results()
-        st.info("クリアしました。")
+    ensure_watcher()
+    if st.session_state._watcher is not None:
+        poll_live_changes()
 
     st.divider()
 
@@ -961,7 +2247,123 @@ with st.sidebar:
             on_change=on_dest_history_change,
         )
 
-    save_button = st.button("ファイルを保存", type="primary", use_container_width=True)
+    if st.session_state.save_mode not in SAVE_MODES:
+        st.session_state.save_mode = "copy"
+    st.session_state.save_mode = st.radio(
+        "保存形式",
+        list(SAVE_MODES),
+        index=list(SAVE_MODES).index(st.session_state.save_mode),
+        format_func=SAVE_MODES.get,
+        horizontal=True,
+    )
+    if st.session_state.save_mode == "archive":
+        if st.session_state.archive_format not in ARCHIVE_FORMATS:
+            st.session_state.archive_format = "zip"
+        archive_col = st.columns([2, 1])
+        st.session_state.archive_name = archive_col[0].text_input(
+            "アーカイブ名",
+            value=st.session_state.archive_name,
+            help="保存先フォルダに「アーカイブ名 + 拡張子」で作成します",
+        )
+        st.session_state.archive_format = archive_col[1].selectbox(
+            "形式",
+            list(ARCHIVE_FORMATS),
+            index=list(ARCHIVE_FORMATS).index(st.session_state.archive_format),
+            format_func=lambda k: ARCHIVE_FORMATS[k].label,
+        )
+        store_exts_input = st.text_input(
+            "無圧縮で格納する拡張子（ZIP）",
+            value=", ".join(st.session_state.archive_store_exts),
+            help="圧縮済みの形式は再圧縮せずにそのまま格納します（tar は全体を圧縮します）",
+        )
+        st.session_state.archive_store_exts = [
+            s.strip() for s in store_exts_input.split(",") if s.strip()
+        ]
+    else:
+        st.session_state.copy_workers = st.number_input(
+            "コピー並列数",
+            min_value=1,
+            max_value=64,
+            value=int(st.session_state.copy_workers),
+            help="ファイルコピーの並列スレッド数",
+        )
+        # 保存先の履歴から選ぶか、新しいフォルダを入力する
+        extra_options = [
+            d for d in st.session_state.dest_history if d != st.session_state.dest_path
+        ]
+        extra_options += [
+            d for d in st.session_state.extra_dests if d not in extra_options
+        ]
+        st.session_state.extra_dests = st.multiselect(
+            "追加の保存先",
+            extra_options,
+            default=st.session_state.extra_dests,
+            accept_new_options=True,
+            placeholder="フォルダのパスを入力",
+            help="各ファイルを1回だけ読み、保存先フォルダと同時にここへもコピーします",
+        )
+        if st.session_state.manifest_format not in MANIFEST_FORMATS:
+            st.session_state.manifest_format = "csv"
+        checksum_col = st.columns([2, 1])
+        st.session_state.copy_checksum = checksum_col[0].checkbox(
+            "チェックサムで確認",
+            value=st.session_state.copy_checksum,
+            help="コピーしながら SHA-256 を計算し、"
+            "保存先にマニフェスト（rel_path, size, mtime, sha256）を書きます",
+        )
+        st.session_state.manifest_format = checksum_col[1].selectbox(
+            "マニフェスト",
+            list(MANIFEST_FORMATS),
+            index=list(MANIFEST_FORMATS).index(st.session_state.manifest_format),
+            format_func=MANIFEST_FORMATS.get,
+            disabled=not st.session_state.copy_checksum,
+        )
+        st.session_state.copy_verify_disk = st.checkbox(
+            "保存先を読み直して照合",
+            value=st.session_state.copy_verify_disk,
+            disabled=not st.session_state.copy_checksum,
+            help="書き込んだ保存先をディスクから読み直し、コピー元の SHA-256 と照合します"
+            "（保存先をもう一度すべて読むので時間がかかります）",
+        )
+        if st.session_state.copy_method not in COPY_METHODS:
+            st.session_state.copy_method = "auto"
+        st.session_state.copy_method = st.selectbox(
+            "コピー方法",
+            list(COPY_METHODS),
+            index=list(COPY_METHODS).index(st.session_state.copy_method),
+            format_func=COPY_METHODS.get,
+            disabled=bool(st.session_state.extra_dests) or st.session_state.copy_checksum,
+            help="同じドライブ内ならリンクやリフリンクでデータのコピーを省けます"
+            "（ハードリンクは別のドライブでは通常のコピーになります。"
+            "追加の保存先やチェックサムがある場合は、1回読んで全保存先へ同時に書き込みます）",
+        )
+        st.session_state.copy_sync = st.checkbox(
+            "差分コピー",
+            value=st.session_state.copy_sync,
+            help="保存先にサイズと更新日時が同じファイルがあればコピーしません",
+        )
+        st.session_state.copy_compare_hash = st.checkbox(
+            "内容も比較する",
+            value=st.session_state.copy_compare_hash,
+            disabled=not st.session_state.copy_sync,
+            help="差分コピーで、ファイルの内容（ハッシュ）も比較します（保存先も読むため遅くなります）",
+        )
+        st.session_state.copy_delete_extra = st.checkbox(
+            "選択していないファイルを保存先から削除",
+            value=st.session_state.copy_delete_extra,
+            disabled=not st.session_state.copy_sync,
+            help="保存先フォルダにあって今回の選択に含まれないファイルを削除します",
+        )
+
+    # 保存する合計サイズと保存先の空き容量（選択が変わるとメインエリアから描き直す）
+    save_target_slot = st.empty()
+
+    save_button = st.button(
+        "ファイルを保存",
+        type="primary",
+        use_container_width=True,
+        disabled=st.session_state._copy_job is not None,
+    )
 
     if save_button:
         dest = st.session_state.dest_path
@@ -970,371 +2372,471 @@ with st.sidebar:
         else:
             os.makedirs(dest, exist_ok=True)
 
-            # selected_abs_paths からコピー対象エントリを取得
-            targets = []
-            for abs_path in st.session_state.selected_abs_paths:
-                entry = get_entry_by_abs_path(abs_path)
-                if entry:
-                    targets.append(entry)
+            # selected_abs_paths からコピー対象エントリを取得（検索結果の順）
+            targets = (
+                st.session_state.entries.rows_for(st.session_state.selected_abs_paths)
+                if st.session_state.entries
+                else []
+            )
 
+            # リンク・差分コピー・アーカイブは必要な容量が合計サイズより小さいので止めない
+            needs_full_space = (
+                st.session_state.save_mode == "copy"
+                and not st.session_state.copy_sync
+                and st.session_state.copy_method not in ("hardlink", "symlink")
+            )
             if not targets:
                 st.info("対象が選択されていません。")
+            elif needs_full_space and short_dests(
+                st.session_state.entries.total_size(st.session_state.selected_abs_paths),
+                space_dests(),
+            ):
+                st.error("保存先の空き容量が足りないため、保存しませんでした。")
             else:
+                if st.session_state.save_mode == "copy":
+                    for extra in reversed(st.session_state.extra_dests):
+                        st.session_state.dest_history = push_history(
+                            st.session_state.dest_history, extra
+                        )
                 st.session_state.dest_history = push_history(
                     st.session_state.dest_history, dest
                 )
 
-                prog = st.progress(0)
-                for i, e in enumerate(targets):
-                    src = e["abs_path"]
-                    rel = e["rel_path"]
-                    dst = os.path.join(dest, rel)
-                    os.makedirs(os.path.dirname(dst), exist_ok=True)
-                    shutil.copy2(src, dst)
-                    prog.progress((i + 1) / len(targets))
+                # 検索後に消えたファイルはスキップ、失敗したファイルは一覧で報告
+                if st.session_state.save_mode == "archive":
+                    start_archive_job(targets, dest)
+                else:
+                    start_copy_job(targets, dest)
 
-                st.success(f"{len(targets)} 件コピー")
+    # コピーはバックグラウンドで進め、進捗と結果をここに表示
+    if st.session_state._copy_job is not None:
+        poll_copy_job()
+    elif st.session_state._copy_summary is not None:
+        render_copy_summary(st.session_state._copy_summary)
+    if st.session_state._copy_job is None and st.session_state.dest_path:
+        render_copy_resume(CopyJournal(st.session_state.dest_path))
 
 # ---------- メインエリア ----------
-st.header("ファイル検索・収集ツール")
+@st.fragment
+def render_results(save_target_slot):
+    """検索結果（グループビュー・ツリービュー・重複ファイル）を描画
 
-# タブ
-tab_group, tab_tree = st.tabs(["グループビュー", "ツリービュー"])
-
-# ---------- グループビュー ----------
-with tab_group:
-    if st.session_state.groups:
-        total_files = len(st.session_state.entries)
-        total_groups = len(st.session_state.groups)
-        selected_count = sum(1 for v in st.session_state.selected_group.values() if v)
-
-        # メトリクス（コンパクト）
-        metric_col = st.columns([1, 1, 1, 3])
-        metric_col[0].metric("ファイル数", total_files)
-        metric_col[1].metric("グループ数", total_groups)
-        metric_col[2].metric("選択中", selected_count)
-
-        # 選択中ファイル一覧
-        if selected_count > 0:
-            with st.expander(f"選択中のファイル一覧 ({selected_count}件)", expanded=False):
-                selected_files = [
-                    fn
-                    for fn in st.session_state.groups
-                    if st.session_state.selected_group.get(fn)
-                ]
-                for fn in selected_files:
-                    ver = st.session_state.selected_version.get(fn, "-")
-                    subver_dict = st.session_state.selected_subversion.get(fn, {})
-                    subver = subver_dict.get(ver, "-") if isinstance(subver_dict, dict) else "-"
-                    # ver_subver_to_entry_map を使用してエントリを取得
-                    entry = st.session_state.ver_subver_to_entry_map.get(fn, {}).get(ver, {}).get(subver)
-                    if entry:
-                        st.text(entry["abs_path"])
-                    else:
-                        st.text(fn)
-
-        # フィルタ行
-        st.caption("フィルタ（スペース=AND, |=OR, -=除外）")
-        filter_col = st.columns([5, 1])
-        with filter_col[0]:
-            st.text_input(
-                "フィルタ",
-                key="_filter_text_input",
-                on_change=lambda: setattr(
-                    st.session_state, "filter_text", st.session_state._filter_text_input
-                ),
-                label_visibility="collapsed",
-            )
-        with filter_col[1]:
-            st.checkbox(
-                "正規表現",
-                key="_filter_use_regex",
-                value=st.session_state.filter_use_regex,
-                on_change=lambda: setattr(
-                    st.session_state, "filter_use_regex", st.session_state._filter_use_regex
-                ),
-            )
+    グループ・ツリーでの選択や表示の変更ではこのフラグメントだけを再実行し、
+    サイドバーの検索・保存の設定は描き直さない。選択で変わるサイドバーの
+    保存対象は save_target_slot に描き直す。
+    """
+    apply_pending_group_sync()
+    show_pending_toasts()
+    selected_size = (
+        st.session_state.entries.total_size(st.session_state.selected_abs_paths)
+        if st.session_state.entries
+        else 0
+    )
+    render_save_target(save_target_slot, st.session_state.selected_abs_paths, selected_size)
+
+    # タブ
+    tab_group, tab_tree, tab_dup = st.tabs(["グループビュー", "ツリービュー", "重複ファイル"])
+
+    # ---------- グループビュー ----------
+    with tab_group:
+        if st.session_state.groups:
+            total_files = len(st.session_state.entries)
+            total_groups = len(st.session_state.groups)
+            selected_count = sum(1 for v in st.session_state.selected_group.values() if v)
+
+            # メトリクス（コンパクト）
+            metric_col = st.columns([1, 1, 1, 1, 2])
+            metric_col[0].metric("ファイル数", total_files)
+            metric_col[1].metric("グループ数", total_groups)
+            metric_col[2].metric("選択中", selected_count)
+            metric_col[3].metric("選択サイズ", format_size(selected_size))
+
+            # 選択中ファイル一覧
+            if selected_count > 0:
+                with st.expander(f"選択中のファイル一覧 ({selected_count}件)", expanded=False):
+                    selected_entries = [
+                        current_group_entry(fn)
+                        for fn in st.session_state.groups
+                        if st.session_state.selected_group.get(fn)
+                    ]
+                    render_file_table([e for e in selected_entries if e is not None])
+
+            # フィルタ行
+            st.caption("フィルタ（スペース=AND, |=OR, -=除外）")
+            filter_col = st.columns([4, 1, 2])
+            with filter_col[0]:
+                st.text_input(
+                    "フィルタ",
+                    key="_filter_text_input",
+                    on_change=lambda: setattr(
+                        st.session_state, "filter_text", st.session_state._filter_text_input
+                    ),
+                    label_visibility="collapsed",
+                )
+            with filter_col[1]:
+                st.checkbox(
+                    "正規表現",
+                    key="_filter_use_regex",
+                    value=st.session_state.filter_use_regex,
+                    on_change=lambda: setattr(
+                        st.session_state, "filter_use_regex", st.session_state._filter_use_regex
+                    ),
+                )
 
-        filtered = [
-            fn
-            for fn in st.session_state.groups
-            if match_filter(
-                fn, st.session_state.filter_text, st.session_state.filter_use_regex
-            )
-        ]
+            with filter_col[2]:
+                if st.session_state.sort_order not in SORT_ORDERS:
+                    st.session_state.sort_order = "name"
+                st.session_state.sort_order = st.selectbox(
+                    "並び順",
+                    list(SORT_ORDERS),
+                    index=list(SORT_ORDERS).index(st.session_state.sort_order),
+                    format_func=SORT_ORDERS.get,
+                    label_visibility="collapsed",
+                )
 
-        # ページネーション計算
-        total_pages = max(
-            1,
-            (len(filtered) + st.session_state.page_size - 1) // st.session_state.page_size,
-        )
-        if st.session_state.page > total_pages:
-            st.session_state.page = total_pages
-
-        start_idx = (st.session_state.page - 1) * st.session_state.page_size
-        end_idx = start_idx + st.session_state.page_size
-        disp = filtered[start_idx:end_idx]
-
-        # ページネーション
-        page_col = st.columns([1, 1, 2, 1, 1, 3])
-        with page_col[0]:
-            if st.button("◀◀", key="page_first"):
-                st.session_state.page = 1
-        with page_col[1]:
-            if st.button("◀", key="page_prev"):
-                st.session_state.page = max(1, st.session_state.page - 1)
-        with page_col[2]:
-            st.write(f"**{st.session_state.page} / {total_pages} ページ**")
-        with page_col[3]:
-            if st.button("▶", key="page_next"):
-                st.session_state.page = min(total_pages, st.session_state.page + 1)
-        with page_col[4]:
-            if st.button("▶▶", key="page_last"):
-                st.session_state.page = total_pages
-        with page_col[5]:
-            st.session_state.page_size = st.selectbox(
-                "表示件数",
-                [25, 50, 100, 200],
-                index=[25, 50, 100, 200].index(st.session_state.page_size),
-                label_visibility="collapsed",
+            filtered = filtered_group_names(
+                st.session_state.filter_text, st.session_state.filter_use_regex
+            )
+            # 更新日時・サイズ順は、グループで選択中のバージョンのファイルで比べる
+            if st.session_state.sort_order in ("mtime", "size"):
+                filtered = sort_group_names(filtered, st.session_state.sort_order)
+
+            # ページネーション計算
+            total_pages = max(
+                1,
+                (len(filtered) + st.session_state.page_size - 1) // st.session_state.page_size,
             )
+            if st.session_state.page > total_pages:
+                st.session_state.page = total_pages
 
-        # 選択操作
-        with st.expander("選択操作", expanded=False):
-            cols = st.columns([1, 1, 0.3, 1.2, 1.2, 0.8])
-            with cols[0]:
-                if st.button("ページ全選択", key="page_select_all"):
-                    for fn in filtered[start_idx:end_idx]:
-                        st.session_state.selected_group[fn] = True
-                        st.session_state[f"sel_{fn}"] = True
-                    sync_group_to_paths()
-                    st.rerun()
-            with cols[1]:
-                if st.button("ページ全解除", key="page_unselect_all"):
-                    for fn in filtered[start_idx:end_idx]:
-                        st.session_state.selected_group[fn] = False
-                        st.session_state[f"sel_{fn}"] = False
-                    sync_group_to_paths()
-                    st.rerun()
-            with cols[2]:
-                st.write("")  # 区切り
-            with cols[3]:
-                if st.button("最新版を選択", key="all_select_latest", help="検索結果全体"):
-                    for fn in filtered:
-                        if st.session_state.versions_map.get(fn):
-                            latest = st.session_state.versions_map[fn][0]
-                            latest_subversions = st.session_state.subversions_map.get(
-                                fn, {}
-                            ).get(latest, ["-"])
-                            select_version_for_file(fn, latest, latest_subversions[0])
-                    sync_group_to_paths()
-                    st.rerun()
-            with cols[4]:
-                if st.button("最古版を選択", key="all_select_oldest", help="検索結果全体"):
-                    for fn in filtered:
-                        if st.session_state.versions_map.get(fn):
-                            oldest = st.session_state.versions_map[fn][-1]
-                            oldest_subversions = st.session_state.subversions_map.get(
-                                fn, {}
-                            ).get(oldest, ["-"])
-                            select_version_for_file(fn, oldest, oldest_subversions[-1])
-                    sync_group_to_paths()
-                    st.rerun()
-            with cols[5]:
-                if st.button("選択解除", key="all_unselect", help="検索結果全体"):
-                    for fn in filtered:
-                        st.session_state.selected_group[fn] = False
-                        st.session_state[f"sel_{fn}"] = False
-                    sync_group_to_paths()
-                    st.rerun()
-
-        st.divider()
-
-        # チェックボックス用コールバック関数を生成
-        def make_checkbox_callback(file_name):
-            def callback():
-                st.session_state.selected_group[file_name] = st.session_state[
-                    f"sel_{file_name}"
-                ]
-                sync_group_to_paths()  # 内部で _tree_key_version をインクリメント
-
-            return callback
-
-        for fn in disp:
-            versions = st.session_state.versions_map[fn]
-            ver = st.session_state.selected_version[fn]
-
-            # ★ 追加：サブバージョン（日付）の取得
-            subversions = st.session_state.subversions_map.get(fn, {}).get(ver, ["-"])
-
-            # サブバージョンの初期化
-            ensure_subversion_initialized(fn, ver, subversions[0])
-            subver = st.session_state.selected_subversion[fn][ver]
-
-            # 現在のバージョンの index を取得
-            try:
-                ver_idx = versions.index(ver)
-            except ValueError:
-                ver_idx = 0
-                st.session_state.selected_version[fn] = versions[0]
+            start_idx = (st.session_state.page - 1) * st.session_state.page_size
+            end_idx = start_idx + st.session_state.page_size
+            disp = filtered[start_idx:end_idx]
+
+            # ページネーション
+            page_col = st.columns([1, 1, 2, 1, 1, 3])
+            with page_col[0]:
+                if st.button("◀◀", key="page_first"):
+                    st.session_state.page = 1
+            with page_col[1]:
+                if st.button("◀", key="page_prev"):
+                    st.session_state.page = max(1, st.session_state.page - 1)
+            with page_col[2]:
+                st.write(f"**{st.session_state.page} / {total_pages} ページ**")
+            with page_col[3]:
+                if st.button("▶", key="page_next"):
+                    st.session_state.page = min(total_pages, st.session_state.page + 1)
+            with page_col[4]:
+                if st.button("▶▶", key="page_last"):
+                    st.session_state.page = total_pages
+            with page_col[5]:
+                st.session_state.page_size = st.selectbox(
+                    "表示件数",
+                    [25, 50, 100, 200],
+                    index=[25, 50, 100, 200].index(st.session_state.page_size),
+                    label_visibility="collapsed",
+                )
 
-            # 現在のサブバージョンの index を取得
-            try:
-                subver_idx = subversions.index(subver)
-            except ValueError:
-                subver_idx = 0
-                st.session_state.selected_subversion[fn][ver] = subversions[0]
+            # 選択操作
+            with st.expander("選択操作", expanded=False):
+                cols = st.columns([1, 1, 0.3, 1.2, 1.2, 0.8])
+                with cols[0]:
+                    if st.button("ページ全選択", key="page_select_all"):
+                        for fn in filtered[start_idx:end_idx]:
+                            st.session_state.selected_group[fn] = True
+                            st.session_state[f"sel_{fn}"] = True
+                        sync_group_to_paths()
+                        rerun_results()
+                with cols[1]:
+                    if st.button("ページ全解除", key="page_unselect_all"):
+                        for fn in filtered[start_idx:end_idx]:
+                            st.session_state.selected_group[fn] = False
+                            st.session_state[f"sel_{fn}"] = False
+                        sync_group_to_paths()
+                        rerun_results()
+                with cols[2]:
+                    st.write("")  # 区切り
+                with cols[3]:
+                    if st.button("最新版を選択", key="all_select_latest", help="検索結果全体"):
+                        for fn in filtered:
+                            if st.session_state.versions_map.get(fn):
+                                latest = st.session_state.versions_map[fn][0]
+                                latest_subversions = st.session_state.subversions_map.get(
+                                    fn, {}
+                                ).get(latest, ["-"])
+                                select_version_for_file(fn, latest, latest_subversions[0])
+                        sync_group_to_paths()
+                        rerun_results()
+                with cols[4]:
+                    if st.button("最古版を選択", key="all_select_oldest", help="検索結果全体"):
+                        for fn in filtered:
+                            if st.session_state.versions_map.get(fn):
+                                oldest = st.session_state.versions_map[fn][-1]
+                                oldest_subversions = st.session_state.subversions_map.get(
+                                    fn, {}
+                                ).get(oldest, ["-"])
+                                select_version_for_file(fn, oldest, oldest_subversions[-1])
+                        sync_group_to_paths()
+                        rerun_results()
+                with cols[5]:
+                    if st.button("選択解除", key="all_unselect", help="検索結果全体"):
+                        for fn in filtered:
+                            st.session_state.selected_group[fn] = False
+                            st.session_state[f"sel_{fn}"] = False
+                        sync_group_to_paths()
+                        rerun_results()
+
+            st.divider()
+
+            # チェックボックス用コールバック関数を生成
+            def make_checkbox_callback(file_name):
+                def callback():
+                    st.session_state.selected_group[file_name] = st.session_state[
+                        f"sel_{file_name}"
+                    ]
+                    sync_group_to_paths()  # 内部で _tree_key_version をインクリメント
+
+                return callback
+
+            for fn in disp:
+                versions = st.session_state.versions_map[fn]
+                ver = st.session_state.selected_version[fn]
+
+                # ★ 追加：サブバージョン（日付）の取得
+                subversions = st.session_state.subversions_map.get(fn, {}).get(ver, ["-"])
+
+                # サブバージョンの初期化
+                ensure_subversion_initialized(fn, ver, subversions[0])
+
+                # 現在のバージョンの index を取得
+                try:
+                    ver_idx = versions.index(ver)
+                except ValueError:
+                    ver_idx = 0
+                    st.session_state.selected_version[fn] = versions[0]
+
+                row = st.columns([1, 3, 2, 2, 6, 2])
+
+                with row[0]:
+                    # ウィジェットキーの初期化（まだ存在しない場合のみ）
+                    if f"sel_{fn}" not in st.session_state:
+                        st.session_state[f"sel_{fn}"] = st.session_state.selected_group.get(fn, False)
+                    st.checkbox(
+                        "選択",
+                        key=f"sel_{fn}",
+                        on_change=make_checkbox_callback(fn),
+                        label_visibility="collapsed",
+                    )
 
-            # エントリの取得（バージョン + サブバージョン）
-            entry = st.session_state.ver_subver_to_entry_map[fn][ver][subver]
+                with row[1]:
+                    st.write(fn)
 
-            row = st.columns([1, 3, 2, 2, 8])
+                with row[2]:
+                    new_ver = st.selectbox(
+                        "ver",
+                        versions,
+                        index=ver_idx,
+                        key=f"ver_{fn}_v{st.session_state._group_ui_version}",
+                        label_visibility="collapsed",
+                    )
 
-            with row[0]:
-                # ウィジェットキーの初期化（まだ存在しない場合のみ）
-                if f"sel_{fn}" not in st.session_state:
-                    st.session_state[f"sel_{fn}"] = st.session_state.selected_group.get(fn, False)
-                st.checkbox(
-                    "選択",
-                    key=f"sel_{fn}",
-                    on_change=make_checkbox_callback(fn),
-                    label_visibility="collapsed",
-                )
+                    # ★ 修正：バージョンが変更された場合の処理
+                    if new_ver != ver:
+                        st.session_state.selected_version[fn] = new_ver
+                        new_subversions = st.session_state.subversions_map.get(fn, {}).get(
+                            new_ver, ["-"]
+                        )
+                        # サブバージョンを強制的に最新に設定
+                        if fn not in st.session_state.selected_subversion:
+                            st.session_state.selected_subversion[fn] = {}
+                        st.session_state.selected_subversion[fn][new_ver] = new_subversions[0]
+                        sync_group_to_paths()
+                        rerun_results()  # 画面を再描画してサブバージョンselectboxを更新
+                    else:
+                        # 既に選択されているバージョンの場合は同期
+                        st.session_state.selected_version[fn] = new_ver
+
+                with row[3]:
+                    # ★ 修正：現在選択中のバージョンに基づいてサブバージョンを取得
+                    current_ver = st.session_state.selected_version[fn]
+                    current_subversions = st.session_state.subversions_map.get(fn, {}).get(
+                        current_ver, ["-"]
+                    )
 
-            with row[1]:
-                st.write(fn)
+                    # サブバージョンの初期化（現在のバージョン用）
+                    ensure_subversion_initialized(fn, current_ver, current_subversions[0])
+                    current_subver = st.session_state.selected_subversion[fn][current_ver]
+
+                    try:
+                        current_subver_idx = current_subversions.index(current_subver)
+                    except ValueError:
+                        current_subver_idx = 0
+                        st.session_state.selected_subversion[fn][current_ver] = (
+                            current_subversions[0]
+                        )
+
+                    new_subver = st.selectbox(
+                        "subver",
+                        current_subversions,
+                        index=current_subver_idx,
+                        key=f"subver_{fn}_{current_ver}_v{st.session_state._group_ui_version}",
+                        label_visibility="collapsed",
+                    )
+                    if new_subver != current_subver:
+                        st.session_state.selected_subversion[fn][current_ver] = new_subver
+                        sync_group_to_paths()
+
+                with row[4]:
+                    # ★ 修正：現在選択中のバージョン・サブバージョンでエントリを取得
+                    display_ver = st.session_state.selected_version[fn]
+                    display_subver = st.session_state.selected_subversion.get(fn, {}).get(
+                        display_ver, "-"
+                    )
+                    display_entry = st.session_state.ver_subver_to_entry_map[fn][display_ver][
+                        display_subver
+                    ]
+                    st.code(display_entry["rel_path"], language="")
+
+                with row[5]:
+                    size = display_entry["size"]
+                    st.caption(
+                        (format_size(size) if size is not None else "-")
+                        + "  \n"
+                        + (format_mtime(display_entry["mtime"]) or "-")
+                    )
+        else:
+            st.info("検索を実行してください。")
+
+    # ---------- ツリービュー ----------
+    with tab_tree:
+        if st.session_state.entries:
+            # 選択数を先に表示（session_state から）
+            selected_count_tree = len(st.session_state.selected_abs_paths)
+            tree_metric_col = st.columns([1, 1, 1, 3])
+            tree_metric_col[0].metric("選択中", selected_count_tree)
+            tree_metric_col[1].metric("選択サイズ", format_size(selected_size))
+            if st.session_state.sort_order not in SORT_ORDERS:
+                st.session_state.sort_order = "name"
+            st.session_state.sort_order = tree_metric_col[2].selectbox(
+                "ファイルの並び順",
+                list(SORT_ORDERS),
+                index=list(SORT_ORDERS).index(st.session_state.sort_order),
+                format_func=SORT_ORDERS.get,
+            )
+            tree_lazy = tree_metric_col[3].checkbox(
+                "開いたフォルダだけ表示",
+                value=st.session_state.tree_lazy,
+                help="閉じているフォルダの中身は開いたときに読み込みます（大量のファイル向け）。",
+            )
+            if tree_lazy != st.session_state.tree_lazy:
+                # 前の表示方式の操作結果を引き継がないようにツリーを作り直す
+                st.session_state.tree_lazy = tree_lazy
+                st.session_state._tree_view = None
+                st.session_state._tree_key_version += 1
+
+            # 選択中ファイル一覧
+            if selected_count_tree > 0:
+                with st.expander(f"選択中のファイル一覧 ({selected_count_tree}件)", expanded=False):
+                    render_file_table(
+                        st.session_state.entries.rows_for(st.session_state.selected_abs_paths)
+                    )
 
-            with row[2]:
-                new_ver = st.selectbox(
-                    "ver",
-                    versions,
-                    index=ver_idx,
-                    key=f"ver_{fn}_v{st.session_state._group_ui_version}",
-                    label_visibility="collapsed",
-                )
+            st.divider()
 
-                # ★ 修正：バージョンが変更された場合の処理
-                if new_ver != ver:
-                    st.session_state.selected_version[fn] = new_ver
-                    new_subversions = st.session_state.subversions_map.get(fn, {}).get(
-                        new_ver, ["-"]
+            # ツリー構造を構築
+            with st.spinner("ツリー構造を構築中..."):
+                if st.session_state.tree_lazy:
+                    nodes, checked, view = build_lazy_tree_nodes(
+                        st.session_state.entries,
+                        st.session_state.sort_order,
+                        st.session_state.tree_expanded,
+                        st.session_state.selected_abs_paths,
                     )
-                    # サブバージョンを強制的に最新に設定
-                    if fn not in st.session_state.selected_subversion:
-                        st.session_state.selected_subversion[fn] = {}
-                    st.session_state.selected_subversion[fn][new_ver] = new_subversions[0]
-                    sync_group_to_paths()
-                    st.rerun()  # 画面を再描画してサブバージョンselectboxを更新
                 else:
-                    # 既に選択されているバージョンの場合は同期
-                    st.session_state.selected_version[fn] = new_ver
-
-            with row[3]:
-                # ★ 修正：現在選択中のバージョンに基づいてサブバージョンを取得
-                current_ver = st.session_state.selected_version[fn]
-                current_subversions = st.session_state.subversions_map.get(fn, {}).get(
-                    current_ver, ["-"]
+                    nodes = cached_tree_nodes(st.session_state.sort_order)
+                    checked = list(st.session_state.selected_abs_paths)
+
+            # バージョン番号付きの key を使用
+            # グループビューから同期されると version がインクリメントされ、新しいコンポーネントが作成される
+            tree_key = f"file_tree_v{st.session_state._tree_key_version}"
+
+            result = tree_select(
+                nodes,
+                checked=checked,
+                expanded=st.session_state.tree_expanded,
+                only_leaf_checkboxes=False,
+                show_expand_all=True,
+                key=tree_key,
+            )
+
+            new_selected = None
+            if st.session_state.tree_lazy:
+                new_selected = read_lazy_tree_result(
+                    result, checked, view, st.session_state.selected_abs_paths
                 )
+                if new_selected == st.session_state.selected_abs_paths:
+                    # 開閉だけ：開いたフォルダの中身を組み立て直すため再描画
+                    rerun_results()
+            elif result:
+                # 有効なファイルパスのみ（フォルダ除外）
+                new_selected = set(
+                    v for v in result.get("checked", [])
+                    if v in st.session_state.entries
+                )
+                new_expanded = result.get("expanded", [])
 
-                # サブバージョンの初期化（現在のバージョン用）
-                ensure_subversion_initialized(fn, current_ver, current_subversions[0])
-                current_subver = st.session_state.selected_subversion[fn][current_ver]
+                # expanded 状態を更新
+                st.session_state.tree_expanded = new_expanded
 
-                try:
-                    current_subver_idx = current_subversions.index(current_subver)
-                except ValueError:
-                    current_subver_idx = 0
-                    st.session_state.selected_subversion[fn][current_ver] = (
-                        current_subversions[0]
+            if new_selected is not None:
+                # 選択状態が変わった場合、グループビューに同期して再描画
+                if new_selected != st.session_state.selected_abs_paths:
+                    # 競合を解決（同じグループの複数バージョン選択を防止）
+                    resolved, removed_groups = resolve_version_conflict(
+                        new_selected, st.session_state.selected_abs_paths
                     )
 
-                new_subver = st.selectbox(
-                    "subver",
-                    current_subversions,
-                    index=current_subver_idx,
-                    key=f"subver_{fn}_{current_ver}_v{st.session_state._group_ui_version}",
-                    label_visibility="collapsed",
-                )
-                if new_subver != current_subver:
-                    st.session_state.selected_subversion[fn][current_ver] = new_subver
-                    sync_group_to_paths()
-
-            with row[4]:
-                # ★ 修正：現在選択中のバージョン・サブバージョンでエントリを取得
-                display_ver = st.session_state.selected_version[fn]
-                display_subver = st.session_state.selected_subversion.get(fn, {}).get(
-                    display_ver, "-"
-                )
-                display_entry = st.session_state.ver_subver_to_entry_map[fn][display_ver][
-                    display_subver
-                ]
-                st.code(display_entry["rel_path"], language="")
-    else:
-        st.info("検索を実行してください。")
-
-# ---------- ツリービュー ----------
-with tab_tree:
-    if st.session_state.entries:
-        # 選択数を先に表示（session_state から）
-        selected_count_tree = len(st.session_state.selected_abs_paths)
-        st.metric("選択中", selected_count_tree)
-
-        # 選択中ファイル一覧
-        if selected_count_tree > 0:
-            with st.expander(f"選択中のファイル一覧 ({selected_count_tree}件)", expanded=False):
-                for abs_path in sorted(st.session_state.selected_abs_paths):
-                    st.text(abs_path)
-
-        st.divider()
-
-        # ツリー構造を構築
-        with st.spinner("ツリー構造を構築中..."):
-            nodes = build_tree_nodes(st.session_state.entries)
-
-            # 有効なファイルパスのセットを作成（フォルダ除外用）
-            valid_file_paths = {e["abs_path"] for e in st.session_state.entries}
-
-        # バージョン番号付きの key を使用
-        # グループビューから同期されると version がインクリメントされ、新しいコンポーネントが作成される
-        tree_key = f"file_tree_v{st.session_state._tree_key_version}"
-
-        result = tree_select(
-            nodes,
-            checked=list(st.session_state.selected_abs_paths),
-            expanded=st.session_state.get("tree_expanded", []),
-            only_leaf_checkboxes=False,
-            show_expand_all=True,
-            key=tree_key,
-        )
+                    # 競合があった場合はトーストメッセージをキューに追加（rerun後に表示）
+                    for group in removed_groups:
+                        st.session_state._pending_toasts.append(f"'{group}' は別バージョンに置き換えました")
 
-        if result:
-            new_selected = set(
-                v for v in result.get("checked", [])
-                if v in valid_file_paths
-            )
-            new_expanded = result.get("expanded", [])
+                    st.session_state.selected_abs_paths = resolved
+                    st.session_state._need_sync_to_group = True
 
-            # expanded 状態を更新
-            st.session_state.tree_expanded = new_expanded
+                    # 競合があった場合はツリーを再初期化（内部状態をリセット）
+                    if removed_groups:
+                        st.session_state._tree_key_version += 1
 
-            # 選択状態が変わった場合、グループビューに同期して再描画
-            if new_selected != st.session_state.selected_abs_paths:
-                # 競合を解決（同じグループの複数バージョン選択を防止）
+                    rerun_results()
+        else:
+            st.info("検索を実行してください。")
+
+    # ---------- 重複ファイル ----------
+    with tab_dup:
+        if st.session_state.entries:
+            new_selected = render_duplicates(st.session_state.selected_abs_paths)
+            if new_selected is not None:
+                # 組ごとに残したファイルが同じグループの別バージョンと重なる場合は新しい方を優先
                 resolved, removed_groups = resolve_version_conflict(
                     new_selected, st.session_state.selected_abs_paths
                 )
-
-                # 競合があった場合はトーストメッセージをキューに追加（rerun後に表示）
                 for group in removed_groups:
                     st.session_state._pending_toasts.append(f"'{group}' は別バージョンに置き換えました")
-
                 st.session_state.selected_abs_paths = resolved
                 st.session_state._need_sync_to_group = True
+                st.session_state._tree_key_version += 1
+                rerun_results()
+        else:
+            st.info("検索を実行してください。")
 
-                # 競合があった場合はツリーを再初期化（内部状態をリセット）
-                if removed_groups:
-                    st.session_state._tree_key_version += 1
 
-                st.rerun()
-    else:
-        st.info("検索を実行してください。")
+if st.session_state._scan_partial:
+    st.warning(
+        f"途中で打ち切った検索結果です（{st.session_state._scan_partial}）。"
+        "すべてのファイルは含まれていません。"
+    )
+
+render_results(save_target_slot)
+
+# ここから後のフラグメントの再実行は、フラグメントだけの再実行
+st.session_state._app_running = False
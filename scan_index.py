@@ -0,0 +1,278 @@
+import os
+import sqlite3
+import sys
+import threading
+import time
+from array import array
+from contextlib import closing
+from pathlib import Path
+
+from scanner import DEFAULT_SCAN_WORKERS, DirListing, revalidate_tree
+
+# ========= デフォルト設定 =========
+DEFAULT_INDEX_PATH = str(Path.home() / ".file_picker" / "scan_index.sqlite")
+DEFAULT_INDEX_MAX_MB = 512
+
+# 名前の連結に使う区切り（ファイル名・フォルダ名には現れない文字）
+NAME_SEP = "/"
+
+# スキーマを変えたら上げる（古い索引は捨てて作り直す）
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS roots (
+    id INTEGER PRIMARY KEY,
+    root TEXT NOT NULL,
+    exclude_key TEXT NOT NULL,
+    last_used REAL NOT NULL,
+    UNIQUE (root, exclude_key)
+);
+CREATE TABLE IF NOT EXISTS dirs (
+    root_id INTEGER NOT NULL,
+    rel_dir BLOB NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    subdirs BLOB NOT NULL,
+    files BLOB NOT NULL,
+    sizes BLOB,
+    mtimes BLOB,
+    PRIMARY KEY (root_id, rel_dir)
+) WITHOUT ROWID;
+"""
+
+
+# ========= エンコードヘルパー =========
+def _encode(s: str) -> bytes:
+    """文字列を BLOB に変換（OS 由来の不正な文字もそのまま保持）"""
+    return s.encode("utf-8", "surrogateescape")
+
+
+def _decode(b: bytes) -> str:
+    return b.decode("utf-8", "surrogateescape")
+
+
+def _encode_names(names) -> bytes:
+    return _encode(NAME_SEP.join(names))
+
+
+def _decode_names(b: bytes) -> list:
+    return _decode(b).split(NAME_SEP) if b else []
+
+
+def _encode_ints(values) -> bytes:
+    """ファイルごとのサイズ・mtime をリトルエンディアンの int64 列にする"""
+    if values is None:
+        return None
+    a = array("q", values)
+    if sys.byteorder != "little":
+        a.byteswap()
+    return a.tobytes()
+
+
+def _decode_ints(b: bytes):
+    if b is None:
+        return None
+    a = array("q")
+    a.frombytes(b)
+    if sys.byteorder != "little":
+        a.byteswap()
+    return a
+
+
+def make_exclude_key(exclude_dirs) -> str:
+    """除外フォルダ設定を索引キー用の文字列に正規化"""
+    return "\n".join(sorted({d.lower() for d in exclude_dirs}))
+
+
+# ========= 永続インデックス =========
+class ScanIndex:
+    """走査結果（フォルダ一覧と mtime）を SQLite に永続化する索引
+
+    ルートと除外フォルダの組ごとに保持し、サイズ上限を超えたら
+    最後に使われたのが古いルートから削除する。
+    """
+
+    def __init__(self, path: str = DEFAULT_INDEX_PATH, max_mb: float = DEFAULT_INDEX_MAX_MB):
+        self.path = str(path)
+        self.max_bytes = int(float(max_mb) * 1024 * 1024)
+
+    def _connect(self):
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            conn.executescript(
+                "DROP TABLE IF EXISTS dirs; DROP TABLE IF EXISTS roots; "
+                f"PRAGMA user_version = {SCHEMA_VERSION};"
+            )
+        conn.executescript(SCHEMA)
+        return conn
+
+    @staticmethod
+    def _root_key(root: str, exclude_dirs):
+        return os.path.abspath(root), make_exclude_key(exclude_dirs)
+
+    def load(self, root: str, exclude_dirs=()):
+        """索引済みの走査結果を返す（未索引なら None）"""
+        if not os.path.exists(self.path):
+            return None
+        with closing(self._connect()) as conn, conn:
+            row = conn.execute(
+                "SELECT id FROM roots WHERE root = ? AND exclude_key = ?",
+                self._root_key(root, exclude_dirs),
+            ).fetchone()
+            if row is None:
+                return None
+            root_id = row[0]
+            conn.execute(
+                "UPDATE roots SET last_used = ? WHERE id = ?", (time.time(), root_id)
+            )
+            cur = conn.execute(
+                "SELECT rel_dir, mtime_ns, subdirs, files, sizes, mtimes "
+                "FROM dirs WHERE root_id = ?",
+                (root_id,),
+            )
+            return {
+                _decode(rel_dir): DirListing(
+                    _decode_names(subdirs),
+                    _decode_names(files),
+                    mtime_ns,
+                    _decode_ints(sizes),
+                    _decode_ints(mtimes),
+                )
+                for rel_dir, mtime_ns, subdirs, files, sizes, mtimes in cur
+            }
+
+    def save(self, root: str, exclude_dirs, listings: dict):
+        """走査結果全体を保存（既存の内容は置き換える）"""
+        with closing(self._connect()) as conn:
+            with conn:
+                root_id = self._get_root_id(conn, root, exclude_dirs)
+                conn.execute("DELETE FROM dirs WHERE root_id = ?", (root_id,))
+                self._insert_dirs(conn, root_id, listings, listings)
+            self._enforce_limit(conn, root_id)
+
+    def update(self, root: str, exclude_dirs, listings: dict, changed, removed):
+        """再検証で変化したフォルダだけを書き換える"""
+        with closing(self._connect()) as conn:
+            with conn:
+                root_id = self._get_root_id(conn, root, exclude_dirs)
+                conn.executemany(
+                    "DELETE FROM dirs WHERE root_id = ? AND rel_dir = ?",
+                    ((root_id, _encode(d)) for d in removed),
+                )
+                self._insert_dirs(conn, root_id, listings, changed)
+            self._enforce_limit(conn, root_id)
+
+    def clear(self):
+        """索引をすべて削除"""
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.remove(self.path + suffix)
+            except FileNotFoundError:
+                pass
+
+    def _get_root_id(self, conn, root, exclude_dirs):
+        key = self._root_key(root, exclude_dirs)
+        conn.execute(
+            "INSERT INTO roots (root, exclude_key, last_used) VALUES (?, ?, ?) "
+            "ON CONFLICT (root, exclude_key) DO UPDATE SET last_used = excluded.last_used",
+            (*key, time.time()),
+        )
+        return conn.execute(
+            "SELECT id FROM roots WHERE root = ? AND exclude_key = ?", key
+        ).fetchone()[0]
+
+    @staticmethod
+    def _insert_dirs(conn, root_id, listings, rel_dirs):
+        conn.executemany(
+            "INSERT OR REPLACE INTO dirs "
+            "(root_id, rel_dir, mtime_ns, subdirs, files, sizes, mtimes) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                (
+                    root_id,
+                    _encode(d),
+                    listings[d].mtime_ns,
+                    _encode_names(listings[d].dirs),
+                    _encode_names(listings[d].files),
+                    _encode_ints(listings[d].sizes),
+                    _encode_ints(listings[d].mtimes),
+                )
+                for d in rel_dirs
+            ),
+        )
+
+    def _enforce_limit(self, conn, keep_root_id):
+        """サイズ上限を超えていれば古いルートから削除"""
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+
+        def used_bytes():
+            page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+            free_count = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            return (page_count - free_count) * page_size
+
+        evicted = False
+        while used_bytes() > self.max_bytes:
+            row = conn.execute(
+                "SELECT id FROM roots WHERE id != ? ORDER BY last_used LIMIT 1",
+                (keep_root_id,),
+            ).fetchone()
+            if row is None:
+                break
+            with conn:
+                conn.execute("DELETE FROM dirs WHERE root_id = ?", row)
+                conn.execute("DELETE FROM roots WHERE id = ?", row)
+            evicted = True
+        if evicted:
+            conn.execute("VACUUM")
+
+
+# ========= バックグラウンド再検証 =========
+class IndexRevalidation:
+    """索引から読み込んだ走査結果をバックグラウンドで再検証し、索引を更新する
+
+    UI 側は done を見て完了を判定し、changed / removed が空でなければ
+    listings で結果を差し替える。
+    """
+
+    def __init__(
+        self,
+        index: ScanIndex,
+        root: str,
+        exclude_dirs,
+        listings: dict,
+        workers: int = DEFAULT_SCAN_WORKERS,
+    ):
+        self.index = index
+        self.root = root
+        self.exclude_dirs = tuple(exclude_dirs)
+        self.base = listings  # 再検証の元になった走査結果
+        self.listings = listings
+        self.workers = workers
+        self.changed = []
+        self.removed = set()
+        self.error = None
+        self._done = threading.Event()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def _run(self):
+        try:
+            new_listings, changed = revalidate_tree(
+                self.root, self.listings, self.exclude_dirs, self.workers
+            )
+            removed = set(self.listings) - set(new_listings)
+            if changed or removed:
+                self.index.update(
+                    self.root, self.exclude_dirs, new_listings, changed, removed
+                )
+            self.listings = new_listings
+            self.changed = changed
+            self.removed = removed
+        except (OSError, sqlite3.Error) as e:
+            self.error = e
+        finally:
+            self._done.set()
@@ -0,0 +1,138 @@
+import threading
+import time
+from collections import OrderedDict
+
+# ========= デフォルト設定 =========
+DEFAULT_STORE_MAX_MB = 1024
+DEFAULT_STORE_MAX_ITEMS = 64
+DEFAULT_STORE_TTL_SEC = 3600  # この時間使われなかった結果は捨てる
+
+# 概算サイズ（バイト）：文字列・dict のオーバーヘッド込みの目安
+DIR_BYTES = 200  # フォルダ一覧の1フォルダ分（DirListing とリスト）
+NAME_BYTES = 96  # フォルダ一覧の名前1件（ファイルのサイズ・mtime を含む）
+ENTRY_BYTES = 600  # エントリ1件（dict とパス文字列）
+NODE_BYTES = 300  # ツリー表示のノード1件（dict とラベル）
+
+
+def listings_size(listings: dict) -> int:
+    """フォルダ一覧の概算サイズ"""
+    names = sum(len(lst.dirs) + len(lst.files) for lst in listings.values())
+    return len(listings) * DIR_BYTES + names * NAME_BYTES
+
+
+def entries_size(entries) -> int:
+    """エントリ一覧の概算サイズ（EntryTable なら nbytes を使う）"""
+    nbytes = getattr(entries, "nbytes", None)
+    return nbytes if nbytes is not None else len(entries) * ENTRY_BYTES
+
+
+# ========= 共有ストア =========
+class ScanStore:
+    """走査結果と抽出結果をプロセス内の全セッションで共有するストア
+
+    値はコピーせずに参照を返すので、受け取った側は変更してはならない（読み取り専用）。
+    件数・概算サイズの上限を超えたら最後に使われたのが古いものから捨て、
+    ttl 秒使われなかったものも捨てる。
+
+    フォルダ一覧は ("listings", root) に最新版を置き、登録ごとに世代番号を振る。
+    抽出結果は世代番号と検索条件をキーにすれば、同じ一覧から作った結果を共有できる。
+    """
+
+    def __init__(
+        self,
+        max_mb: float = DEFAULT_STORE_MAX_MB,
+        ttl: float = DEFAULT_STORE_TTL_SEC,
+        max_items: int = DEFAULT_STORE_MAX_ITEMS,
+    ):
+        self.max_bytes = int(float(max_mb) * 1024 * 1024)
+        self.ttl = ttl
+        self.max_items = max_items
+        self._items = OrderedDict()  # {key: (value, size, last_used)}
+        self._total = 0
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    # ---------- 基本操作 ----------
+    def get(self, key, default=None):
+        """値を返す（なければ default）"""
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            item = self._items.get(key)
+            if item is None:
+                return default
+            self._items[key] = (item[0], item[1], now)
+            self._items.move_to_end(key)
+            return item[0]
+
+    def put(self, key, value, size: int):
+        """値を登録（同じキーは置き換え）し、上限を超えた分を捨てる"""
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._total -= old[1]
+            self._items[key] = (value, size, time.monotonic())
+            self._total += size
+            self._evict(keep=key)
+        return value
+
+    def get_or_build(self, key, build, size_of):
+        """値を返し、なければ build() で作って登録（作成中はロックしない）"""
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        value = build()
+        with self._lock:
+            # 同時に作られた場合は先に登録された方を共有する
+            item = self._items.get(key)
+            if item is not None:
+                return item[0]
+        return self.put(key, value, size_of(value))
+
+    # ---------- フォルダ一覧 ----------
+    def new_generation(self) -> int:
+        """フォルダ一覧の世代番号を払い出す"""
+        with self._lock:
+            self._generation += 1
+            return self._generation
+
+    def publish_listings(self, root: str, listings: dict) -> int:
+        """フォルダ一覧を root の最新版として登録し、世代番号を返す"""
+        generation = self.new_generation()
+        self.put(("listings", root), (generation, listings), listings_size(listings))
+        return generation
+
+    def latest_listings(self, root: str):
+        """root の最新のフォルダ一覧を (世代番号, listings) で返す（なければ None）"""
+        return self.get(("listings", root))
+
+    # ---------- 状態 ----------
+    def stats(self):
+        """(登録数, 概算サイズ) を返す"""
+        with self._lock:
+            return len(self._items), self._total
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._total = 0
+
+    def _expire(self, now: float):
+        if not self.ttl:
+            return
+        expired = [k for k, item in self._items.items() if now - item[2] > self.ttl]
+        for k in expired:
+            self._total -= self._items.pop(k)[1]
+
+    def _evict(self, keep):
+        self._expire(time.monotonic())
+        while self._items and (
+            self._total > self.max_bytes or len(self._items) > self.max_items
+        ):
+            key = next(iter(self._items))
+            if key == keep:
+                break
+            self._total -= self._items.pop(key)[1]
+
+
+_MISSING = object()
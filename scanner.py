@@ -0,0 +1,497 @@
+import os
+import random
+import threading
+import time
+from array import array
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import NamedTuple
+
+# ========= デフォルト設定 =========
+DEFAULT_SCAN_WORKERS = 8
+DEFAULT_ESTIMATE_PROBES = 64  # 見積もりでたどるランダム経路の数
+POLL_INTERVAL_SEC = 0.2  # 中止・制限時間を確認する間隔
+
+# 走査を打ち切った理由（表示用）
+STOP_REASON_LABELS = {
+    "cancelled": "中止",
+    "max_files": "最大ファイル数に到達",
+    "max_depth": "最大深さで打ち切り",
+    "timeout": "制限時間に到達",
+}
+
+
+# ========= フォルダ一覧 =========
+class DirListing(NamedTuple):
+    """1フォルダ分の一覧（os.walk の dirnames / filenames に相当）"""
+
+    dirs: list
+    files: list
+    mtime_ns: int = -1  # 列挙直前のフォルダ mtime（取得できなければ -1）
+    sizes: array = None  # files と同じ順のファイルサイズ（取得できなければ -1）
+    mtimes: array = None  # files と同じ順のファイル mtime（ns、取得できなければ -1）
+
+
+def list_directory(path: str) -> DirListing:
+    """os.scandir でフォルダ直下を列挙する
+
+    種別は DirEntry が持つ情報だけで判定し、ファイルのサイズ・mtime は
+    DirEntry.stat() で列挙と同時に取る（Windows では列挙結果に含まれるので
+    追加の呼び出しはなく、それ以外でもパスを組み立て直さずに済む）。
+    os.walk と同様に、シンボリックリンクのフォルダは辿らず、
+    読めないフォルダは空として扱う。
+    """
+    dirs = []
+    files = []
+    sizes = array("q")
+    mtimes = array("q")
+    # mtime は列挙前に取得（列挙中の変更は次回の再検証で検出される）
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+    except OSError:
+        return DirListing([], [])
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if not is_dir:
+                    files.append(entry.name)
+                    try:
+                        st = entry.stat()
+                        sizes.append(st.st_size)
+                        mtimes.append(st.st_mtime_ns)
+                    except OSError:
+                        # リンク切れなど
+                        sizes.append(-1)
+                        mtimes.append(-1)
+                elif not entry.is_symlink():
+                    dirs.append(entry.name)
+    except OSError:
+        return DirListing([], [])
+    return DirListing(dirs, files, mtime_ns, sizes, mtimes)
+
+
+def join_rel(rel_dir: str, name: str) -> str:
+    """相対フォルダパスと名前を連結（ルート直下は名前のみ）"""
+    return os.path.join(rel_dir, name) if rel_dir else name
+
+
+def dir_abs_path(root: str, rel_dir: str) -> str:
+    """相対フォルダパスから絶対パス（os.walk の dirpath と同じ形）を生成"""
+    return os.path.join(root, rel_dir) if rel_dir else root
+
+
+# ========= 打ち切り条件 =========
+class ScanLimits:
+    """走査の打ち切り条件（0 は無制限）と中止要求
+
+    打ち切った場合は stop_reason に理由（STOP_REASON_LABELS のキー）が入る。
+    最大深さは打ち切っても他のフォルダの走査は続ける。
+    """
+
+    def __init__(self, max_files: int = 0, max_depth: int = 0, timeout: float = 0.0):
+        self.max_files = int(max_files)
+        self.max_depth = int(max_depth)
+        self.timeout = float(timeout)
+        self.file_count = 0
+        self.stop_reason = ""
+        self._start = time.monotonic()
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        """中止を要求（別スレッドから呼んでよい）"""
+        self._cancel.set()
+
+    def should_stop(self) -> bool:
+        """走査を止めるべきか判定し、止める場合は理由を記録"""
+        if self._cancel.is_set():
+            self.stop_reason = "cancelled"
+        elif self.timeout and time.monotonic() - self._start >= self.timeout:
+            self.stop_reason = "timeout"
+        elif self.max_files and self.file_count >= self.max_files:
+            self.stop_reason = "max_files"
+        else:
+            return False
+        return True
+
+    @property
+    def partial(self) -> bool:
+        """途中結果かどうか"""
+        return bool(self.stop_reason)
+
+
+# ========= 並列走査 =========
+def iter_scan(
+    root: str, exclude_dirs=(), workers: int = DEFAULT_SCAN_WORKERS, limits: ScanLimits = None
+):
+    """フォルダツリーをスレッドプールで並列に走査し、列挙の終わったフォルダから順に返す
+
+    limits を指定した場合は、中止要求・最大ファイル数・制限時間で途中終了し、
+    最大深さより深いフォルダには潜らない（理由は limits.stop_reason に記録）。
+
+    Yields:
+        (相対フォルダパス, DirListing)（ルートは ""、順序は完了順）
+    """
+    exclude_dirs_norm = {d.lower() for d in exclude_dirs}
+
+    pool = ThreadPoolExecutor(max_workers=max(1, int(workers)))
+    try:
+        pending = {pool.submit(list_directory, root): ("", 0)}
+        while pending:
+            if limits is not None and limits.should_stop():
+                return
+            # 応答の遅いフォルダがあっても中止・制限時間を確認できるよう待ち時間を区切る
+            done, _ = wait(pending, timeout=POLL_INTERVAL_SEC, return_when=FIRST_COMPLETED)
+            for fut in done:
+                rel_dir, depth = pending.pop(fut)
+                listing = fut.result()
+                # 除外フォルダは潜る前に除く（os.walk の dirnames[:] と同じ）
+                dirs = [d for d in listing.dirs if d.lower() not in exclude_dirs_norm]
+                descend = True
+                if limits is not None:
+                    limits.file_count += len(listing.files)
+                    if limits.max_depth and depth >= limits.max_depth and dirs:
+                        limits.stop_reason = limits.stop_reason or "max_depth"
+                        descend = False
+                if descend:
+                    for d in dirs:
+                        child = join_rel(rel_dir, d)
+                        fut = pool.submit(list_directory, dir_abs_path(root, child))
+                        pending[fut] = (child, depth + 1)
+                yield rel_dir, listing._replace(dirs=dirs)
+    finally:
+        # 中止時は応答待ちのフォルダを待たずに戻る
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def scan_tree(root: str, exclude_dirs=(), workers: int = DEFAULT_SCAN_WORKERS):
+    """フォルダツリーをスレッドプールで並列に走査する
+
+    Returns:
+        {相対フォルダパス: DirListing}（ルートは ""）
+    """
+    return dict(iter_scan(root, exclude_dirs, workers))
+
+
+def estimate_tree(
+    root: str,
+    exclude_dirs=(),
+    probes: int = DEFAULT_ESTIMATE_PROBES,
+    workers: int = DEFAULT_SCAN_WORKERS,
+    seed=None,
+):
+    """ランダムな経路を数十本たどるだけで、総フォルダ数・ファイル数を見積もる
+
+    Knuth の推定法：ルートから子フォルダを無作為に選んで葉まで降り、
+    各段の分岐数の積で重み付けした件数を合計する。これを複数回行って平均する。
+
+    Returns:
+        (推定フォルダ数, 推定ファイル数)
+    """
+    exclude_dirs_norm = {d.lower() for d in exclude_dirs}
+    cache = {}
+
+    def listing_of(rel_dir):
+        listing = cache.get(rel_dir)
+        if listing is None:
+            listing = list_directory(dir_abs_path(root, rel_dir))
+            dirs = [d for d in listing.dirs if d.lower() not in exclude_dirs_norm]
+            listing = cache[rel_dir] = listing._replace(dirs=dirs)
+        return listing
+
+    def probe(rng):
+        rel_dir = ""
+        weight = 1
+        dir_total = 0
+        file_total = 0
+        while True:
+            listing = listing_of(rel_dir)
+            dir_total += weight
+            file_total += weight * len(listing.files)
+            if not listing.dirs:
+                return dir_total, file_total
+            weight *= len(listing.dirs)
+            rel_dir = join_rel(rel_dir, rng.choice(listing.dirs))
+
+    base = random.Random(seed)
+    rngs = [random.Random(base.random()) for _ in range(max(1, int(probes)))]
+    with ThreadPoolExecutor(max_workers=max(1, int(workers))) as pool:
+        results = list(pool.map(probe, rngs))
+    return (
+        sum(r[0] for r in results) / len(results),
+        sum(r[1] for r in results) / len(results),
+    )
+
+
+def revalidate_tree(
+    root: str, listings: dict, exclude_dirs=(), workers: int = DEFAULT_SCAN_WORKERS
+):
+    """前回の走査結果をフォルダ mtime で検証し、変化したフォルダだけ再列挙する
+
+    変化のないフォルダは stat 1回のみで前回の一覧を再利用する。
+    新しく現れたフォルダは列挙し、消えたフォルダは結果から落ちる。
+
+    Returns:
+        (新しい {相対フォルダパス: DirListing}, 再列挙したフォルダのリスト)
+    """
+    exclude_dirs_norm = {d.lower() for d in exclude_dirs}
+    new_listings = {}
+    changed = []
+
+    def visit(rel_dir):
+        path = dir_abs_path(root, rel_dir)
+        old = listings.get(rel_dir)
+        if old is not None and old.mtime_ns >= 0:
+            try:
+                if os.stat(path).st_mtime_ns == old.mtime_ns:
+                    return old, False
+            except OSError:
+                pass
+        return list_directory(path), True
+
+    with ThreadPoolExecutor(max_workers=max(1, int(workers))) as pool:
+        pending = {pool.submit(visit, ""): ""}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                rel_dir = pending.pop(fut)
+                listing, was_listed = fut.result()
+                dirs = [d for d in listing.dirs if d.lower() not in exclude_dirs_norm]
+                new_listings[rel_dir] = listing._replace(dirs=dirs)
+                if was_listed:
+                    changed.append(rel_dir)
+                for d in dirs:
+                    child = join_rel(rel_dir, d)
+                    pending[pool.submit(visit, child)] = child
+
+    return new_listings, changed
+
+
+def update_tree(
+    root: str, listings: dict, rel_dirs, exclude_dirs=(), workers: int = DEFAULT_SCAN_WORKERS
+):
+    """指定したフォルダだけを再列挙して走査結果を更新する
+
+    新しく現れたサブフォルダは走査し、辿れなくなったフォルダは結果から落とす。
+
+    Returns:
+        (新しい {相対フォルダパス: DirListing}, 再列挙したフォルダのリスト, 消えたフォルダの集合)
+    """
+    exclude_dirs_norm = {d.lower() for d in exclude_dirs}
+    new_listings = dict(listings)
+    changed = []
+
+    with ThreadPoolExecutor(max_workers=max(1, int(workers))) as pool:
+        queued = {d for d in rel_dirs if d in listings}
+        pending = {pool.submit(list_directory, dir_abs_path(root, d)): d for d in queued}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                rel_dir = pending.pop(fut)
+                listing = fut.result()
+                dirs = [d for d in listing.dirs if d.lower() not in exclude_dirs_norm]
+                new_listings[rel_dir] = listing._replace(dirs=dirs)
+                changed.append(rel_dir)
+                for d in dirs:
+                    child = join_rel(rel_dir, d)
+                    if child not in new_listings and child not in queued:
+                        queued.add(child)
+                        pending[pool.submit(list_directory, dir_abs_path(root, child))] = child
+
+    # ルートから辿れなくなったフォルダ（削除・移動されたサブツリー）を落とす
+    new_listings = {d: new_listings[d] for d in iter_dirs(new_listings)}
+    changed = [d for d in changed if d in new_listings]
+    removed = set(listings) - set(new_listings)
+    return new_listings, changed, removed
+
+
+# ========= エントリ生成 =========
+def normalize_exts(include_exts):
+    """拡張子を小文字・ドット付きに正規化"""
+    return {
+        (e.lower() if e.startswith(".") else f".{e.lower()}") for e in include_exts
+    }
+
+
+def iter_dirs(listings: dict, exclude_dirs=()):
+    """走査結果のフォルダを os.walk と同じ順序（トップダウン）でたどる"""
+    exclude_dirs_norm = {d.lower() for d in exclude_dirs}
+    stack = [""]
+    while stack:
+        rel_dir = stack.pop()
+        listing = listings.get(rel_dir)
+        if listing is None:
+            continue
+        yield rel_dir
+        children = [
+            join_rel(rel_dir, d)
+            for d in listing.dirs
+            if d.lower() not in exclude_dirs_norm
+        ]
+        stack.extend(reversed(children))
+
+
+def filter_names(names, include_exts_norm, exclude_file_patterns=()) -> list:
+    """ファイル名を拡張子（正規化済み）と除外パターンで絞り込む"""
+    # 拡張子フィルタ（空の場合は全ファイル）
+    if include_exts_norm:
+        # str.endswith で大半を落とし、残りだけ splitext で厳密に判定（".md" などは拡張子なし）
+        exts = tuple(include_exts_norm)
+        splitext = os.path.splitext
+        names = [
+            fn
+            for fn in names
+            if fn.lower().endswith(exts) and splitext(fn)[1].lower() in include_exts_norm
+        ]
+    if exclude_file_patterns:
+        names = [
+            fn for fn in names if not any(p.search(fn) for p in exclude_file_patterns)
+        ]
+    return names
+
+
+def iter_entries(
+    root: str,
+    listings: dict,
+    exclude_dirs=(),
+    include_exts=(),
+    exclude_file_patterns=(),
+    rel_dirs=None,
+):
+    """走査結果を os.walk と同じ順序でたどり、条件に合うファイルを返す
+
+    Args:
+        exclude_file_patterns: コンパイル済み正規表現のリスト（search でマッチしたら除外）
+        rel_dirs: 指定した場合はそのフォルダ直下だけを対象にする（再帰しない）
+    """
+    include_exts_norm = normalize_exts(include_exts)
+    if rel_dirs is None:
+        rel_dirs = iter_dirs(listings, exclude_dirs)
+
+    for rel_dir in rel_dirs:
+        listing = listings.get(rel_dir)
+        if listing is None:
+            continue
+        names = filter_names(listing.files, include_exts_norm, exclude_file_patterns)
+        if not names:
+            continue
+        # パスの連結はフォルダごとに一度だけ（ファイルごとは文字列の足し算のみ）
+        rel_prefix = join_rel(rel_dir, "")
+        abs_prefix = os.path.join(dir_abs_path(root, rel_dir), "")
+
+        for fn in names:
+            yield {
+                "file_name": fn,
+                "rel_path": rel_prefix + fn,
+                "abs_path": abs_prefix + fn,
+            }
+
+
+# ========= ストリーミング走査の進捗 =========
+class ScanProgress:
+    """ストリーミング走査の進捗（列挙済みフォルダ数・一致件数・経過時間）
+
+    走査スレッドが add() で更新し、UI は lock を取って読み出す。
+    exclude_dirs に含まれるフォルダ以下は一致件数に数えない。
+    group_key を指定すると、一致したファイルの相対パスをキーごとに集計する。
+    """
+
+    def __init__(
+        self, include_exts=(), exclude_file_patterns=(), group_key=None, exclude_dirs=()
+    ):
+        self.include_exts_norm = normalize_exts(include_exts)
+        self.exclude_file_patterns = exclude_file_patterns
+        self.exclude_dirs_norm = {d.lower() for d in exclude_dirs}
+        self.group_key = group_key
+        self.lock = threading.Lock()
+        self.start = time.monotonic()
+        self.dir_count = 0
+        self.file_count = 0  # 条件に一致したファイル数
+        self.current_dir = ""
+        self.matches = {}  # {相対フォルダパス: 一致したファイル名のリスト}（一致なしは含めない）
+        self.group_counts = {}  # {group_key の値: 件数}
+
+    def add(self, rel_dir: str, listing: DirListing):
+        """列挙の終わったフォルダを反映し、一致したファイル名を返す"""
+        if self._is_excluded(rel_dir):
+            names = []
+        else:
+            names = filter_names(
+                listing.files, self.include_exts_norm, self.exclude_file_patterns
+            )
+        keys = [self.group_key(join_rel(rel_dir, fn)) for fn in names] if self.group_key else ()
+        with self.lock:
+            self.dir_count += 1
+            self.file_count += len(names)
+            self.current_dir = rel_dir
+            if names:
+                self.matches[rel_dir] = names
+            for key in keys:
+                self.group_counts[key] = self.group_counts.get(key, 0) + 1
+        return names
+
+    def _is_excluded(self, rel_dir: str) -> bool:
+        if not rel_dir or not self.exclude_dirs_norm:
+            return False
+        parts = rel_dir.replace(os.sep, "/").split("/")
+        return any(p.lower() in self.exclude_dirs_norm for p in parts)
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.start
+
+
+# ========= バックグラウンド走査 =========
+class ScanJob:
+    """フル走査をバックグラウンドスレッドで実行する（中止・打ち切り条件付き）
+
+    UI は progress を描画しながら done を待ち、listings を受け取る。
+    途中で打ち切った場合は partial が True になり、stop_reason に理由が入る。
+    """
+
+    def __init__(
+        self,
+        root: str,
+        exclude_dirs=(),
+        workers: int = DEFAULT_SCAN_WORKERS,
+        limits: ScanLimits = None,
+        progress: ScanProgress = None,
+    ):
+        self.root = root
+        self.exclude_dirs = tuple(exclude_dirs)
+        self.workers = workers
+        self.limits = limits if limits is not None else ScanLimits()
+        self.progress = progress if progress is not None else ScanProgress()
+        self.listings = {}
+        self._done = threading.Event()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        try:
+            for rel_dir, listing in iter_scan(
+                self.root, self.exclude_dirs, self.workers, self.limits
+            ):
+                self.listings[rel_dir] = listing
+                self.progress.add(rel_dir, listing)
+        finally:
+            self._done.set()
+
+    def cancel(self):
+        """中止を要求（それまでの結果は途中結果として残る）"""
+        self.limits.cancel()
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    @property
+    def partial(self) -> bool:
+        return self.limits.partial
+
+    @property
+    def stop_reason(self) -> str:
+        """打ち切った理由（表示用、完走した場合は空）"""
+        return STOP_REASON_LABELS.get(self.limits.stop_reason, "")
+
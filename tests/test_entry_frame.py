@@ -0,0 +1,64 @@
+import re
+from array import array
+
+import pytest
+
+from entry_frame import ListingFrame
+from entry_table import build_table
+from scanner import DirListing
+
+
+def make_listings():
+    names = [
+        "report.csv",
+        "report_2024.csv",
+        "summary.csv",
+        "aa.txt",
+        "ab.txt",
+        "Notes.TXT",
+        ".md",
+        "copy of spec.docx",
+    ]
+    files = {
+        "": (["sub"], names),
+        "sub": ([], [f"x_{n}" for n in names] + names),
+    }
+    return {
+        rel_dir: DirListing(
+            dirs,
+            files,
+            sizes=array("q", range(len(files))),
+            mtimes=array("q", range(len(files))),
+        )
+        for rel_dir, (dirs, files) in files.items()
+    }
+
+
+def table_rows(table):
+    return (
+        table.dirs,
+        list(table.dir_starts),
+        table.names,
+        list(table.sizes),
+        list(table.mtimes),
+    )
+
+
+@pytest.mark.parametrize(
+    "include_exts, patterns",
+    [
+        ([], [r"^(?!report).*\.csv$"]),  # 先読み
+        ([], [r"^(.)\1"]),  # 後方参照
+        (["csv", "txt"], [r"(?<!x_)report", r"copy"]),  # 後読み・複数パターン
+        (["txt"], []),
+        ([], []),
+    ],
+)
+@pytest.mark.parametrize("flags", [re.IGNORECASE, 0])
+def test_frame_matches_build_table(include_exts, patterns, flags):
+    listings = make_listings()
+    compiled = [re.compile(p, flags) for p in patterns]
+    frame = ListingFrame(listings)
+    expected = build_table("/root", listings, (), include_exts, compiled)
+    actual = frame.table("/root", frame.mask(include_exts, compiled))
+    assert table_rows(actual) == table_rows(expected)